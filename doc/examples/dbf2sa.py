@@ -4,6 +4,8 @@ Move DBF data (as single table) to RDBMS using SQLAlchemy
 """
 
 import os
+from itertools import izip
+
 import ydbf
 import sqlalchemy as sa
 
@@ -59,13 +61,14 @@ def make_table(metadata, reader):
         table.create()
     return table
 
-def convert_data(dbf_data_iterator):
+def convert_data(field_names, dbf_data_iterator):
     """
-    Convert dbf data to SQLAlchemy
+    Convert dbf data (tuples in order of `field_names`) to SQLAlchemy
     """
     # may make not only simple name conversion, but more complex stuff
+    columns = [_get_column_name(name) for name in field_names]
     for rec in dbf_data_iterator:
-        yield dict((_get_column_name(k), v) for k, v in rec.items())
+        yield dict(izip(columns, rec))
 
 def __next_n(iterable, n=1):
     """
@@ -125,10 +128,10 @@ def dbf2sa(dbf_name, sa_uri):
         ``sa_uri``
             SQLAlchemy DB URI, move data to
     """
-    reader = ydbf.open(dbf_name)
+    reader = ydbf.open(dbf_name, row_type='tuple')
     meta = make_meta(sa_uri)
     table = make_table(meta, reader)
-    push_data(table, convert_data(reader))
+    push_data(table, convert_data(reader.field_names, reader))
 
 if __name__ == '__main__':
     import sys
@@ -30,6 +30,11 @@ each record is a simple dict.
       include_package_data=True,
       zip_safe=True,
       install_requires=[],
+      extras_require={
+          'numpy': ['numpy'],
+          'aio': [],
+          'aio:python_version < "3.4"': ['trollius'],
+      },
       entry_points="""
       # -*- Entry points: -*-
       [console_scripts]
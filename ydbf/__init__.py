@@ -43,6 +43,38 @@ If you have Python 2.5+, you may want to use `with` statement:
             ...
 
 Each record is represented as dict, where keys are names of fields.
+If you hold a lot of records or pass them to DB-API `executemany`,
+you may want to use lighter records (see `row_type` option of YDbfReader):
+
+    dbf = ydbf.open('simple.dbf', row_type='tuple')
+
+If you scan the same big file several times, you may want to map it
+into memory, so records are sliced straight out of the page cache:
+
+    dbf = ydbf.open('simple.dbf', mmap=True)
+
+DBF data which is already in memory (str or bytearray) may be read
+by `YDbfMmapReader` directly:
+
+    dbf = ydbf.YDbfMmapReader(data)
+
+DBF may be read from stream which can't be seeked (pipe, socket, stdin),
+data compressed by gzip, bz2 or xz is decompressed on the fly:
+
+    dbf = ydbf.open(sys.stdin, stream=True)
+    dbf = ydbf.open('simple.dbf.gz', stream=True)
+
+Memo ('M') fields are read from memo file (.dbt or .fpt) next to DBF.
+Memo is read only when it's accessed: value of memo field is
+a `ydbf.memo.MemoHandle`, use its `value` attribute (or unicode()).
+
+    dbf = ydbf.open('memo.dbf')
+    notes = [unicode(rec['NOTE']) for rec in dbf if rec['NOTE']]
+
+Decoding is CPU-bound, so big file may be read by pool of processes,
+see `ydbf.parallel_records` and `ydbf.parallel_reduce`. For asyncio
+(or trollius) applications there is `ydbf.aio.open`, it reads and
+decodes records in executor, so event loop is not blocked.
 
 Writing
 -------
@@ -89,6 +121,24 @@ keys are name of fields. For early defined example it may looks like
         {'ID': 3, 'VALUE': u'pytils', 'VISIBLE': True,
          'UPDATE': datetime.date(2009, 5, 11)},
     ]
+
+Records may be appended to existing DBF, structure and encoding
+are taken from DBF, only new records are written:
+
+    dbf = ydbf.open('simple.dbf', 'a')
+    dbf.write(new_data)
+
+In 'r+' mode records are updated, deleted and undeleted in place,
+only changed fields are written:
+
+    with ydbf.open('simple.dbf', 'r+') as dbf:
+        dbf.update(10, {'VISIBLE': False})
+        dbf.delete(11)
+
+Deleted records are removed from DBF by `pack`, in place or to new file:
+
+    ydbf.pack('simple.dbf')
+    ydbf.pack('simple.dbf', 'packed.dbf')
 """
 try:
     import pkg_resources
@@ -99,12 +149,24 @@ try:
 except ImportError:
     VERSION = 'N/A'
     
-from ydbf.reader import YDbfReader
-from ydbf.writer import YDbfWriter
+from ydbf.reader import YDbfReader, YDbfMmapReader, YDbfStreamReader
+from ydbf.writer import YDbfWriter, YDbfAppender
+from ydbf.updater import YDbfUpdater, pack
+from ydbf.parallel import parallel_records, parallel_reduce
 
 FILE_MODES = {
     'r': YDbfReader,
     'w': YDbfWriter,
+    'a': YDbfAppender,
+    'r+': YDbfUpdater,
+}
+
+# modes of opening file by name
+OPEN_MODES = {
+    'r': 'rb',
+    'w': 'wb',
+    'a': 'r+b',
+    'r+': 'r+b',
 }
 
 def open(dbf_file, mode='r', *args, **kwargs):
@@ -116,7 +178,9 @@ def open(dbf_file, mode='r', *args, **kwargs):
             file name or file-like object
         
         `mode`:
-            'r' for reading, 'w' for writing
+            'r' for reading, 'w' for writing,
+            'a' for appending to existing DBF,
+            'r+' for reading and updating records in place
         
         `fields`:
             fields structure of DBF file, most
@@ -129,10 +193,30 @@ def open(dbf_file, mode='r', *args, **kwargs):
         `encoding`:
             Set encoding of DBF file, most
             useful for writing mode.
+        
+        `mmap`:
+            Map file into memory instead of reading it,
+            reading mode only. False by default.
+        
+        `stream`:
+            Read file forward only, without seeking (for pipes,
+            sockets, compressed files), reading mode only.
+            False by default.
     """
     if mode not in FILE_MODES:
         raise ValueError("Wrong mode %s for ydbf.open" % mode)
+    use_mmap = kwargs.pop('mmap', False)
+    use_stream = kwargs.pop('stream', False)
+    if use_mmap and mode != 'r':
+        raise ValueError("Option mmap is available for reading mode only")
+    if use_stream and mode != 'r':
+        raise ValueError("Option stream is available for reading mode only")
     if isinstance(dbf_file, basestring):
-        dbf_file = file(dbf_file, '%sb' % mode)
-    dbf_class = FILE_MODES[mode]
+        dbf_file = file(dbf_file, OPEN_MODES[mode])
+    if use_mmap:
+        dbf_class = YDbfMmapReader
+    elif use_stream:
+        dbf_class = YDbfStreamReader
+    else:
+        dbf_class = FILE_MODES[mode]
     return dbf_class(dbf_file, *args, **kwargs)
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+# YDbf - Pythonic reader and writer for DBF/XBase files
+# Inspired by code of Raymond Hettinger
+# http://code.activestate.com/recipes/362715
+#
+# Copyright (C) 2006-2010 Yury Yurevich and contributors
+#
+# http://pyobject.ru/projects/ydbf/
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+"""
+Asynchronous interface (asyncio or trollius)
+
+Blocking file I/O and decoding of records run in executor, so event
+loop is not blocked by large scans:
+
+    reader = ydbf.aio.open('simple.dbf')
+    async for rec in reader:
+        ...
+    rec = await reader.get(10)
+
+    writer = ydbf.aio.open('new.dbf', 'w', fields)
+    await writer.write_batch(rows)
+    await writer.close()
+
+Records are read by blocks and reading is pipelined: while records of
+one block are consumed, next block is decoded and one more block is
+read. Module has no async syntax, methods return futures, so on Python 2
+it works with trollius (`__anext__` is awaited by `yield From(...)`,
+end of records is signalled by `StopAsyncIteration` of this module).
+"""
+__all__ = ["open", "AsyncReader", "AsyncRecords", "AsyncWriter"]
+
+import threading
+from collections import deque
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+import ydbf
+
+try:
+    StopAsyncIteration = StopAsyncIteration
+except NameError:
+    class StopAsyncIteration(Exception):
+        """
+        End of asynchronous iteration (builtin on Python 3.5+)
+        """
+
+class _AsyncBase(object):
+    """
+    Base of asynchronous wrappers: runs functions in executor
+    """
+    def __init__(self, loop=None, executor=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.executor = executor
+
+    def _run(self, func, *args):
+        """
+        Run `func` in executor, returns future of result
+        """
+        return self.loop.run_in_executor(self.executor, func, *args)
+
+    def _future(self):
+        """
+        Make new future bound to the loop
+        """
+        create_future = getattr(self.loop, 'create_future', None)
+        if create_future is not None:
+            return create_future()
+        return asyncio.Future(loop=self.loop)
+
+    def _done(self, result):
+        """
+        Make already done future with `result`
+        """
+        future = self._future()
+        future.set_result(result)
+        return future
+
+    def __aenter__(self):
+        return self._done(self)
+
+    def __aexit__(self, exc_type, exc_value, traceback):
+        return self.close()
+
+class AsyncReader(_AsyncBase):
+    """
+    Asynchronous wrapper of `YDbfReader`
+    """
+    def __init__(self, reader, loop=None, executor=None):
+        """
+        Create asynchronous reader
+        
+        Args:
+            `reader`:
+                `YDbfReader` (or `YDbfMmapReader`) instance
+            `loop`:
+                event loop, current one by default
+            `executor`:
+                executor for I/O and decoding, default
+                executor of loop by default
+        """
+        super(AsyncReader, self).__init__(loop, executor)
+        self.reader = reader
+        # file is read under io_lock, records are decoded under
+        # decode_lock (decoders and value caches are shared),
+        # so reading of one block and decoding of another overlap
+        self.io_lock = threading.Lock()
+        self.decode_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.reader)
+
+    def records(self, **kwargs):
+        """
+        Iterate over DBF records asynchronously, options are
+        the same as for `YDbfReader.records`
+        
+        Returns `AsyncRecords` iterator.
+        """
+        return AsyncRecords(self, **kwargs)
+
+    def __aiter__(self):
+        return self.records()
+
+    def _get(self, key):
+        with self.io_lock:
+            with self.decode_lock:
+                return self.reader[key]
+
+    def get(self, key):
+        """
+        Get record (or list of records for slice) by index,
+        returns future of record (see `YDbfReader.__getitem__`)
+        """
+        return self._run(self._get, key)
+
+    def _close(self):
+        # blocks of mapped file may be decoded yet, so file is
+        # closed under both locks
+        with self.io_lock:
+            with self.decode_lock:
+                self.reader.close()
+
+    def close(self):
+        """
+        Close reader, returns future
+        """
+        return self._run(self._close)
+
+class AsyncRecords(_AsyncBase):
+    """
+    Asynchronous iterator over records of `AsyncReader`
+    """
+    def __init__(self, areader, start_from=None, limit=None,
+                 show_deleted=False, fields=None, where=None, lazy=False):
+        super(AsyncRecords, self).__init__(areader.loop, areader.executor)
+        self.areader = areader
+        reader = areader.reader
+        # reader's iteration state is not changed
+        if start_from is None:
+            start_from = reader.start_from
+        stop_at = reader.stop_at
+        if limit is not None:
+            stop_at = start_from + limit
+        self.blocks = reader._readBlocks(start_from, stop_at)
+        self.options = (show_deleted, fields, where, lazy)
+        self.decode_block = None
+        self.buffer = deque()
+        self.reading = self._run(self._read)
+        # future of records of next block (None at the end)
+        self.pending = self._startBlock()
+
+    def _read(self):
+        with self.areader.io_lock:
+            return next(self.blocks, None)
+
+    def _decode(self, item):
+        with self.areader.decode_lock:
+            if self.decode_block is None:
+                self.decode_block = \
+                    self.areader.reader._blockDecoder(*self.options)
+            return list(self.decode_block(*item))
+
+    def _startBlock(self):
+        """
+        Start decoding of block being read, and reading of next one
+        as soon as this is read. Returns future of list of records
+        of block, or of None if there is no blocks.
+        """
+        pending = self._future()
+
+        def on_decoded(future):
+            if future.exception() is not None:
+                pending.set_exception(future.exception())
+            else:
+                pending.set_result(future.result())
+
+        def on_read(future):
+            if future.exception() is not None:
+                pending.set_exception(future.exception())
+                return
+            item = future.result()
+            if item is None:
+                pending.set_result(None)
+                return
+            self.reading = self._run(self._read)
+            self._run(self._decode, item).add_done_callback(on_decoded)
+
+        self.reading.add_done_callback(on_read)
+        return pending
+
+    def _wait(self, result):
+        """
+        Set next record as `result` when next block is decoded
+        """
+        if self.pending is None:
+            result.set_exception(StopAsyncIteration())
+            return
+
+        def on_block(future):
+            if future.exception() is not None:
+                self.pending = None
+                if not result.cancelled():
+                    result.set_exception(future.exception())
+                return
+            recs = future.result()
+            if recs is None:
+                self.pending = None
+                if not result.cancelled():
+                    result.set_exception(StopAsyncIteration())
+                return
+            self.buffer.extend(recs)
+            # next block is decoded while this one is consumed
+            self.pending = self._startBlock()
+            if result.cancelled():
+                return
+            if self.buffer:
+                result.set_result(self.buffer.popleft())
+            else:
+                self._wait(result)
+
+        self.pending.add_done_callback(on_block)
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        """
+        Get next record, returns future of record, future raises
+        `StopAsyncIteration` if there is no more records
+        """
+        if self.buffer:
+            return self._done(self.buffer.popleft())
+        result = self._future()
+        self._wait(result)
+        return result
+
+    def close(self):
+        return self._done(None)
+
+class AsyncWriter(_AsyncBase):
+    """
+    Asynchronous wrapper of `YDbfWriter`
+    """
+    def __init__(self, writer, loop=None, executor=None):
+        """
+        Create asynchronous writer
+        
+        Args:
+            `writer`:
+                `YDbfWriter` instance
+            `loop`:
+                event loop, current one by default
+            `executor`:
+                executor for encoding and I/O, default
+                executor of loop by default
+        """
+        super(AsyncWriter, self).__init__(loop, executor)
+        self.writer = writer
+        self.lock = threading.Lock()
+
+    def _writeBatch(self, rows):
+        with self.lock:
+            self.writer._writeRecords(rows)
+
+    def write_batch(self, rows):
+        """
+        Write records after already written ones, returns future.
+        Batches should be awaited one by one to keep order of records.
+        
+        Args:
+            `rows`:
+                iterable of records (each record is a dict of values)
+        """
+        return self._run(self._writeBatch, rows)
+
+    def _close(self):
+        with self.lock:
+            self.writer._finish()
+            self.writer.close()
+
+    def close(self):
+        """
+        Write header and end of file mark and close file, returns future
+        """
+        return self._run(self._close)
+
+def open(dbf_file, mode='r', *args, **kwargs):
+    """
+    Open DBF for asynchronous reading or writing
+    
+    Args are the same as for `ydbf.open`, and:
+        `loop`:
+            event loop, current one by default
+        `executor`:
+            executor for blocking I/O and decoding,
+            default executor of loop by default
+    
+    Returns `AsyncReader` for 'r' mode, `AsyncWriter` for 'w'
+    and 'a' modes.
+    """
+    loop = kwargs.pop('loop', None)
+    executor = kwargs.pop('executor', None)
+    dbf = ydbf.open(dbf_file, mode, *args, **kwargs)
+    if mode in ('w', 'a'):
+        return AsyncWriter(dbf, loop, executor)
+    return AsyncReader(dbf, loop, executor)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+# YDbf - Pythonic reader and writer for DBF/XBase files
+# Inspired by code of Raymond Hettinger
+# http://code.activestate.com/recipes/362715
+#
+# Copyright (C) 2006-2010 Yury Yurevich and contributors
+#
+# http://pyobject.ru/projects/ydbf/
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+"""
+Vectorized decoding of DBF records to columns (NumPy arrays)
+
+Each field of block of fixed-width records is converted to a single array:
+'N' fields without decimals to int64, 'N' fields with decimals to float64
+(or to int64 scaled by 10**DEC), 'D' fields to datetime64[D] (NaT for
+empty dates), 'L' fields to bool and 'C' fields to fixed-width
+byte strings (or unicode, if encoding is defined). 'F' fields are
+the same as 'N'. Binary fields of Visual FoxPro are viewed by native
+dtypes: 'I' to int32, 'B' to float64, 'Y' to float64 (or to int64
+scaled by 10**4), 'T' to datetime64[ms].
+"""
+__all__ = ["make_dtype", "decode_columns"]
+
+from decimal import Decimal, InvalidOperation, ROUND_DOWN
+
+import numpy
+
+from ydbf import lib
+
+DIGIT_0, DIGIT_9 = ord('0'), ord('9')
+POINT, MINUS, PLUS, SPACE, NULL = ord('.'), ord('-'), ord('+'), ord(' '), 0
+LOGIC_TRUE = [ord(c) for c in "YyTt"]
+# julian day number of 1970-01-01
+UNIX_EPOCH_JULIAN_DAY = 2440588
+# numbers with more digits may overflow int64, so they are parsed by Python
+MAX_INT64_DIGITS = 18
+
+def make_dtype(fields):
+    """
+    Make structured dtype for records with given fields structure
+    
+    Args:
+        `fields`:
+            fields structure (with _deletion_flag), i.e.
+            [(NAME, TYP, SIZE, DEC), ...]
+    
+    'C' fields are fixed-width strings, binary fields are little-endian
+    numbers, other fields are arrays of bytes.
+    """
+    spec = []
+    for name, typ, size, dec in fields:
+        if typ == 'C':
+            spec.append((name, 'S%d' % size))
+        elif typ in lib.BINARY_FORMATS:
+            spec.append((name, '<' + lib.BINARY_FORMATS[typ]))
+        else:
+            spec.append((name, 'u1', (size,)))
+    return numpy.dtype(spec)
+
+def _parse_digits(chars, first_rec):
+    """
+    Parse matrix of chars (one number per row) to integer values,
+    ignoring decimal point. Returns tuple (values, number of digits
+    after decimal point, number of digits)
+    
+    Values with more than MAX_INT64_DIGITS digits may be wrong
+    (because of overflow), see `_parse_big`.
+    """
+    digits = (chars >= DIGIT_0) & (chars <= DIGIT_9)
+    points = chars == POINT
+    minuses = chars == MINUS
+    wrong = ~(digits | points | minuses | (chars == PLUS) |
+              (chars == SPACE) | (chars == NULL))
+    if wrong.any():
+        raise ValueError("Wrong number %r in rec #%d" % (
+            chars[wrong.any(axis=1)][0].tostring(),
+            first_rec + wrong.any(axis=1).nonzero()[0][0]))
+    values = numpy.zeros(len(chars), numpy.int64)
+    for col in xrange(chars.shape[1]):
+        values = numpy.where(digits[:, col],
+                             values*10 + (chars[:, col] - DIGIT_0),
+                             values)
+    after_point = numpy.cumsum(points, axis=1) > 0
+    frac_digits = (digits & after_point).sum(axis=1)
+    values = numpy.where(minuses.any(axis=1), -values, values)
+    return values, frac_digits, digits.sum(axis=1)
+
+def _parse_big(values, chars, rows, dec, first_rec, scaled):
+    """
+    Parse numbers in given rows of matrix of chars by Python, it is
+    slow, but there is no overflow. Numbers are stored to values as
+    integers scaled by 10**dec if `scaled`, otherwise as floats.
+    """
+    for row in rows.nonzero()[0]:
+        text = chars[row].tostring().split('\x00', 1)[0].strip()
+        try:
+            value = Decimal(text or '0').scaleb(dec).to_integral_value(
+                ROUND_DOWN)
+        except InvalidOperation:
+            raise ValueError("Wrong number %r in rec #%d"
+                             % (text, first_rec + row))
+        if not scaled:
+            values[row] = float(value) / 10**dec
+        elif -2**63 <= value < 2**63:
+            values[row] = int(value)
+        else:
+            raise ValueError("Number %r in rec #%d is out of range of int64"
+                             % (text, first_rec + row))
+    return values
+
+def decode_integer(chars, size, dec, first_rec, scaled):
+    values, frac_digits, num_digits = _parse_digits(chars, first_rec)
+    big = num_digits > MAX_INT64_DIGITS
+    if big.any():
+        values = _parse_big(values, chars, big, 0, first_rec, True)
+    return values
+
+def decode_decimal(chars, size, dec, first_rec, scaled):
+    values, frac_digits, num_digits = _parse_digits(chars, first_rec)
+    # normalize to exactly `dec` digits after point, extra digits
+    # are truncated (as by `lib.dbf2scaled`)
+    shift = dec - frac_digits
+    big = num_digits + numpy.maximum(shift, 0) > MAX_INT64_DIGITS
+    values = numpy.where(shift >= 0,
+                         values * 10**numpy.maximum(shift, 0),
+                         numpy.sign(values) *
+                         (numpy.abs(values) // 10**numpy.maximum(-shift, 0)))
+    if not scaled:
+        values = values / float(10**dec)
+    if big.any():
+        values = _parse_big(values, chars, big, dec, first_rec, scaled)
+    return values
+
+def decode_date(chars, size, dec, first_rec, scaled):
+    digits = (chars >= DIGIT_0) & (chars <= DIGIT_9)
+    parts = (chars.astype(numpy.int64) - DIGIT_0) * digits
+    weights = 10**numpy.arange(3, -1, -1)
+    year = (parts[:, 0:4] * weights).sum(axis=1)
+    month = (parts[:, 4:6] * weights[2:]).sum(axis=1)
+    day = (parts[:, 6:8] * weights[2:]).sum(axis=1)
+    # dates with non-digits are empty (as in `lib.dbf2date`)
+    valid = digits.all(axis=1)
+    months = (year - 1970).astype('M8[Y]') + \
+             (numpy.clip(month, 1, 12) - 1).astype('m8[M]')
+    month_days = ((months + 1).astype('M8[D]') -
+                  months.astype('M8[D]')).astype(numpy.int64)
+    wrong = valid & ((year < 1) | (month < 1) | (month > 12) |
+                     (day < 1) | (day > month_days))
+    if wrong.any():
+        raise ValueError("Wrong date %r in rec #%d" % (
+            chars[wrong][0].tostring(), first_rec + wrong.nonzero()[0][0]))
+    values = months.astype('M8[D]') + \
+             (numpy.where(valid, day, 1) - 1).astype('m8[D]')
+    values[~valid] = numpy.datetime64('NaT')
+    return values
+
+def decode_logic(chars, size, dec, first_rec, scaled):
+    return numpy.in1d(chars[:, 0], LOGIC_TRUE)
+
+def decode_string(values, size, dec, first_rec, scaled, encoding=None):
+    values = numpy.char.rstrip(values)
+    if encoding is not None:
+        values = numpy.char.decode(values, encoding)
+    return values
+
+def decode_binary(values, size, dec, first_rec, scaled):
+    return values
+
+def decode_currency(values, size, dec, first_rec, scaled):
+    if scaled:
+        return values
+    return values / 10000.0
+
+def decode_datetime(values, size, dec, first_rec, scaled):
+    days = values & 0xFFFFFFFF
+    result = (days - UNIX_EPOCH_JULIAN_DAY).astype('M8[D]').astype('M8[ms]') \
+             + (values >> 32).astype('m8[ms]')
+    result[days == 0] = numpy.datetime64('NaT')
+    return result
+
+DECODERS = {
+    'N': lambda dec: (dec and decode_decimal) or decode_integer,
+    'F': lambda dec: (dec and decode_decimal) or decode_integer,
+    'I': lambda dec: decode_binary,
+    'B': lambda dec: decode_binary,
+    'Y': lambda dec: decode_currency,
+    'T': lambda dec: decode_datetime,
+    'D': lambda dec: decode_date,
+    'L': lambda dec: decode_logic,
+    'C': lambda dec: decode_string,
+}
+
+def decode_columns(records, fields, names, first_rec=0, encoding=None,
+                   scaled=False):
+    """
+    Decode columns of records
+    
+    Args:
+        `records`:
+            array of records with dtype made by `make_dtype`
+        
+        `fields`:
+            fields structure (with _deletion_flag), i.e.
+            [(NAME, TYP, SIZE, DEC), ...]
+        
+        `names`:
+            names of fields to decode
+        
+        `first_rec`:
+            index of first record (for error messages)
+        
+        `encoding`:
+            decode 'C' fields to unicode using this encoding.
+            Fields are left as byte strings if None (default).
+        
+        `scaled`:
+            convert 'N' fields with decimals to int64 scaled by 10**DEC
+            (and 'Y' fields to int64 scaled by 10**4) instead of float64,
+            False by default
+    
+    Returns dict, where keys are field names and values are arrays.
+    """
+    columns = {}
+    for name, typ, size, dec in fields:
+        if name not in names:
+            continue
+        if name == '_deletion_flag':
+            columns[name] = records[name]
+            continue
+        if typ not in DECODERS:
+            raise ValueError("Cannot find dbf-to-numpy converter "
+                             "for field %s (type %s)" % (name, typ))
+        decoder = DECODERS[typ](dec)
+        if typ == 'C':
+            columns[name] = decoder(records[name], size, dec, first_rec,
+                                    scaled, encoding)
+        else:
+            columns[name] = decoder(records[name], size, dec, first_rec,
+                                    scaled)
+    return columns
@@ -20,10 +20,16 @@
 """
 YDbf dumper script
 """
+import re
 import sys
 from optparse import OptionParser
 from ydbf import lib, VERSION
 from ydbf.reader import YDbfStrictReader
+from ydbf.stream import StreamFile
+from ydbf.updater import pack
+
+# files with these extensions are decompressed on the fly
+COMPRESSED_EXTENSIONS = ('.gz', '.bz2', '.xz')
 
 def _unescape_separator(option, opt_str, value, parser):
     """
@@ -47,12 +53,52 @@ def _split_fields(option, opt_str, value, parser):
         value = tuple(f.upper().strip() for f in value.split(','))
     setattr(parser.values, option.dest, value)
 
+CONDITION_RE = re.compile(r'^\s*(\w+)\s*(==|=|!=|<=|>=|<|>|\^=)(.*)$')
+
+def _parse_condition(condition, fields_spec):
+    """
+    Parse condition of option --where (like NAME>=VALUE)
+    to tuple (NAME, OP, VALUE)
+    """
+    match = CONDITION_RE.match(condition)
+    if not match:
+        raise ValueError("Wrong condition %r, it should be like "
+                         "NAME=VALUE" % condition)
+    name, op, value = match.groups()
+    name = name.upper()
+    op = {'=': '==', '^=': 'startswith'}.get(op, op)
+    types = dict((f[0], f[1]) for f in fields_spec)
+    if name not in types:
+        raise ValueError("Wrong field %s in condition %r" % (name, condition))
+    if types[name] == 'D':
+        # YYYYMMDD or DD.MM.YYYY
+        if '.' in value:
+            value = lib.str2dbf(value)
+        value = lib.dbf2date(value)
+    elif types[name] == 'L':
+        value = value.strip() in ('Y', 'y', 'T', 't')
+    elif types[name] == 'N':
+        value = value.strip()
+    return name, op, value
+
+def open_input(filename):
+    """
+    Open DBF file for reading, '-' is stdin. Stdin and compressed
+    files are read as streams, without seeking.
+    """
+    if filename == '-':
+        return StreamFile(sys.stdin)
+    fh = open(filename, 'rb')
+    if filename.lower().endswith(COMPRESSED_EXTENSIONS):
+        return StreamFile(fh)
+    return fh
+
 def show_info(files):
     """
     Show info about files
     """
     for f in files:
-        reader = YDbfStrictReader(open(f, 'rb'))
+        reader = YDbfStrictReader(open_input(f))
         header_info = {
             'filename': f,
             'signature': hex(reader.sig),
@@ -83,12 +129,21 @@ Num   Name                Type Len  Decimal
             print "% 3d.  %s  %s  %s  %d" % \
                 (i+1, name.ljust(20), type_, str(length).rjust(3), dec)
 
+def pack_files(files, output=None):
+    """
+    Remove deleted records from files, file is packed
+    in place if output is not defined
+    """
+    for f in files:
+        removed = pack(f, output or None)
+        print "%s: %d deleted records removed" % (f, removed)
+
 def parse_options(args):
     """
     Parse options
     """
-    parser = OptionParser(usage="%prog [options] files", version="%%prog %s"
-                                                                 % VERSION)
+    parser = OptionParser(usage="%prog [options] files (- for stdin)",
+                          version="%%prog %s" % VERSION)
     parser.add_option('-r', '--rs',
                            dest='record_separator',
                            action='callback',
@@ -113,6 +168,16 @@ def parse_options(args):
                            help='comma separated list of fields to print ' \
                                 '[default all]',
                            )
+    parser.add_option('-w', '--where',
+                           dest='where',
+                           action='append',
+                           default=[],
+                           type='string',
+                           help='print only records matching condition ' \
+                                'NAME{=,!=,<,<=,>,>=,^=}VALUE, where ^= ' \
+                                'means "starts with", may be repeated ' \
+                                '[default all records]',
+                           )
     parser.add_option('-u', '--undef',
                            dest='undef',
                            type='string',
@@ -136,12 +201,23 @@ def parse_options(args):
                            action='store_true',
                            default=False,
                            help='show info about file and exit'),
+    parser.add_option('-p', '--pack',
+                           dest='pack',
+                           action='store_true',
+                           default=False,
+                           help='remove deleted records (in place, or '
+                                'to file defined by --output) and exit'),
     options, args = parser.parse_args(args)
     if not args:
         parser.error('Files is required argument')
     if options.info:
         show_info(args)
         sys.exit(0)
+    if options.pack:
+        if options.output and len(args) > 1:
+            parser.error('Only one file may be packed to output file')
+        pack_files(args, options.output)
+        sys.exit(0)
     return options, args
 
 def csv_output_generator(data_iterator, record_separator, field_separator):
@@ -218,32 +294,30 @@ def replace_null(data_iterator, undef):
     for rec in data_iterator:
         yield tuple(provide_undef(x) for x in rec)
 
-def _flatten_data(data_iterator, fields):
-    """
-    Flatten each rec in data iterator from dict to tuple
-    """
-    for rec in data_iterator:
-        yield tuple(rec[name] for name in fields)
-
-def dbf_data(fh, fields=None):
+def dbf_data(fh, fields=None, where=None):
     """
     Return a fields spec and data generator
     """
-    reader = YDbfStrictReader(fh, use_unicode=False)
+    reader = YDbfStrictReader(fh, use_unicode=False, row_type='tuple')
+    if where:
+        where = [_parse_condition(condition, reader.fields)
+                 for condition in where]
     if fields:
-        fields_spec = [f for f in reader.fields if f[0] in fields]
-        if len(fields_spec) != len(fields):
+        spec = dict((f[0], f) for f in reader.fields)
+        if len(set(fields) & set(spec)) != len(fields):
             # got wrong name in fields
-            difference = tuple(set(fields) - set(f[0] for f in fields_spec))
+            difference = tuple(set(fields) - set(spec))
             if difference:
                 raise ValueError("Wrong fields: %s" % ', '.join(difference))
             else:
                 raise ValueError("Wrong fields")
+        # records are in order of requested fields
+        fields_spec = [spec[name] for name in fields]
+        generator = reader.records(fields=fields, where=where)
     else:
         # all fields
         fields_spec = reader.fields
-        fields = [f[0] for f in reader.fields]
-    generator = _flatten_data(reader.records(), fields)
+        generator = reader.records(where=where)
     return fields_spec, generator
 
 def write_output(output_fh, data_iterator, flush_on_each_record=True):
@@ -265,8 +339,9 @@ def dump(args):
     else:
         ofh = sys.stdout
     for filename in args:
-        fh = open(filename, 'rb')
-        fields_spec, data_iterator = dbf_data(fh, options.fields)
+        fh = open_input(filename)
+        fields_spec, data_iterator = dbf_data(fh, options.fields,
+                                              options.where)
         data_iterator = replace_null(data_iterator, options.undef)
         if options.table:
             output_generator = table_output_generator(fields_spec,
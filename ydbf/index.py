@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+# YDbf - Pythonic reader and writer for DBF/XBase files
+# Inspired by code of Raymond Hettinger
+# http://code.activestate.com/recipes/362715
+#
+# Copyright (C) 2006-2010 Yury Yurevich and contributors
+#
+# http://pyobject.ru/projects/ydbf/
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+"""
+Persistent secondary index for keyed lookups
+
+Index is a sidecar file next to DBF (named like `data.dbf.CUSTID.ydx`),
+it maps key (value of one or more fields) to number of record. Index is
+sorted by key, so lookup is a binary search over mapped sidecar file.
+Index is bound to state of DBF file: if number of records, date of last
+update, size or modification time of DBF are changed, index is stale
+and should be rebuilt. If directory of DBF is not writable, index is
+built in temporary directory and it is removed when index is closed.
+
+Keys are fixed-width byte strings made from field values: 'C' values
+are stripped and padded by spaces, 'N' values are scaled to integers by
+10**DEC and packed to sortable 8 bytes, 'D' values are YYYYMMDD strings,
+'L' values are 'T' or 'F'. Key of several fields is a concatenation of
+fields' keys, so lookup by leading fields only is also possible.
+"""
+__all__ = ["YDbfIndex", "index_path", "build_index", "open_index",
+           "make_key"]
+
+import os
+import mmap
+import heapq
+import shutil
+import tempfile
+from struct import Struct
+from decimal import Decimal
+
+from ydbf import lib
+
+# <   -- little endian
+# 4s  -- magic
+# L   -- number of records in DBF
+# L   -- date of last update of DBF (ordinal)
+# Q   -- size of DBF file
+# d   -- modification time of DBF file
+# H   -- size of key
+# H   -- length of fields spec (names joined by '+')
+INDEX_HEADER = Struct('<4sLLQdHH')
+INDEX_MAGIC = 'YDX\x01'
+# record number in entry is big-endian, so entries of equal
+# keys are sorted by record number
+RECNO = Struct('>L')
+# number of entries sorted in memory at once while building index
+SORT_CHUNK = 1000000
+
+def index_path(dbf_path, fields):
+    """
+    Get file name of sidecar index of DBF for given fields
+    """
+    return '%s.%s.ydx' % (dbf_path, '+'.join(fields))
+
+def _dbf_path(reader):
+    """
+    Get file name of DBF read by reader
+    """
+    fh = getattr(reader, 'source_fh', None) or reader.fh
+    name = getattr(fh, 'name', None)
+    if not isinstance(name, basestring) or not os.path.isfile(name):
+        raise ValueError("Reader has no file name, so sidecar index "
+                         "is not available")
+    return name
+
+def _dbf_state(reader):
+    """
+    Get state of DBF, which index is bound to
+    """
+    stat = os.stat(_dbf_path(reader))
+    return reader.numrec, reader.dt.toordinal(), stat.st_size, stat.st_mtime
+
+def _number_key(value, size, dec):
+    """
+    Make sortable key from number (string or numeric value)
+    """
+    value = str(value).strip(' \x00') or '0'
+    if dec:
+        value = int((Decimal(value).scaleb(dec)).to_integral_value())
+    else:
+        value = int(value)
+    return _int_key(value)
+
+def _int_key(value):
+    """
+    Make sortable key from integer
+    """
+    # flip sign bit, so negative numbers are less than positive ones
+    return Struct('>Q').pack(value + 2**63)
+
+def _key_makers(reader, fields):
+    """
+    Get list of (offset, size, key width, function raw value -> key)
+    for given fields
+    """
+    types = dict((name, (typ, size, dec))
+                 for name, typ, size, dec in reader.fields)
+    makers = []
+    for name in fields:
+        if name not in types:
+            raise ValueError("Unknown field %s" % name)
+        typ, size, dec = types[name]
+        if typ == 'C':
+            width = size
+            func = lambda raw, size=size: \
+                       raw.split('\x00', 1)[0].rstrip().ljust(size)
+        elif typ == 'N':
+            width = 8
+            func = lambda raw, size=size, dec=dec: \
+                       _number_key(raw.split('\x00', 1)[0], size, dec)
+        elif typ == 'D':
+            width = 8
+            func = lambda raw: raw.split('\x00', 1)[0].ljust(8)
+        elif typ == 'L':
+            width = 1
+            func = lambda raw: (raw.strip() in ('Y', 'y', 'T', 't') and 'T') \
+                               or 'F'
+        else:
+            raise ValueError("Field %s of type %s cannot be indexed"
+                             % (name, typ))
+        makers.append((reader.field_offsets[name], size, width, func))
+    return makers
+
+def make_key(reader, fields, values):
+    """
+    Make index key from values of fields
+    
+    Args:
+        `reader`:
+            YDbfReader instance
+        
+        `fields`:
+            names of indexed fields
+        
+        `values`:
+            values of leading fields (all or several first ones)
+    
+    Returns None if some value cannot be stored in its field (e.g.
+    string is longer than field, or number has more decimal digits),
+    so no record has such key.
+    """
+    if len(values) > len(fields):
+        raise ValueError("Too many values (%d) for index on %d fields"
+                         % (len(values), len(fields)))
+    types = dict((name, (typ, size, dec))
+                 for name, typ, size, dec in reader.fields)
+    key = []
+    for name, value in zip(fields, values):
+        typ, size, dec = types[name]
+        if typ == 'C':
+            if isinstance(value, unicode):
+                value = value.encode(reader.encoding or 'ascii')
+            value = value.rstrip()
+            if len(value) > size:
+                return None
+            key.append(value.ljust(size))
+        elif typ == 'N':
+            value = Decimal(str(value).strip(' \x00') or '0').scaleb(dec)
+            if value != value.to_integral_value():
+                return None
+            key.append(_int_key(int(value)))
+        elif typ == 'D':
+            key.append((value and lib.date2dbf(value)) or ' '*8)
+        elif typ == 'L':
+            key.append((value and 'T') or 'F')
+    return ''.join(key)
+
+def _write_run(entries):
+    """
+    Sort entries and write them to temporary run file
+    """
+    entries.sort()
+    run = tempfile.TemporaryFile()
+    run.write(''.join(entries))
+    return run
+
+def _iter_run(run, entry_size):
+    """
+    Iterate over sorted entries of temporary run file
+    """
+    run.seek(0)
+    entries_per_block = max(1, lib.BLOCK_SIZE // entry_size)
+    while True:
+        block = run.read(entries_per_block * entry_size)
+        if not block:
+            break
+        for pos in xrange(0, len(block), entry_size):
+            yield block[pos:pos + entry_size]
+
+def build_index(reader, fields, path=None, sort_chunk=SORT_CHUNK):
+    """
+    Build sidecar index on fields of DBF, returns YDbfIndex
+    
+    Args:
+        `reader`:
+            YDbfReader instance (reader of DBF file)
+        
+        `fields`:
+            names of indexed fields
+        
+        `path`:
+            file name of index, by default it is made by `index_path`
+            (or it is in temporary directory if directory of DBF is
+            not writable)
+        
+        `sort_chunk`:
+            number of entries sorted in memory at once, bigger
+            indexes are sorted by merging of temporary files
+    """
+    fields = tuple(fields)
+    tmp_dir = None
+    if path is None:
+        path = index_path(_dbf_path(reader), fields)
+        if not os.access(os.path.dirname(os.path.abspath(path)), os.W_OK):
+            tmp_dir = tempfile.mkdtemp(prefix='ydbf')
+            path = os.path.join(tmp_dir, os.path.basename(path))
+    try:
+        index = _build_index(reader, fields, path, sort_chunk)
+    except:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, True)
+        raise
+    index.tmp_dir = tmp_dir
+    return index
+
+def _build_index(reader, fields, path, sort_chunk):
+    """
+    Write sidecar index to `path`, returns YDbfIndex
+    """
+    makers = _key_makers(reader, fields)
+    key_size = sum(width for offset, size, width, func in makers)
+    entries = []
+    runs = []
+    recsize = reader.recsize
+    try:
+        for first, count, block, offset in reader._readBlocks(0,
+                                                              reader.numrec):
+            for i in xrange(first, first + count):
+                key = ''.join(func(str(block[offset + field_offset:
+                                             offset + field_offset + size]))
+                              for field_offset, size, width, func in makers)
+                entries.append(key + RECNO.pack(i))
+                offset += recsize
+                if len(entries) >= sort_chunk:
+                    runs.append(_write_run(entries))
+                    entries = []
+        entries.sort()
+        if runs:
+            entries = heapq.merge(iter(entries), *[
+                _iter_run(run, key_size + RECNO.size) for run in runs])
+        numrec, date, size, mtime = _dbf_state(reader)
+        names = '+'.join(fields)
+        tmp_path = path + '.tmp'
+        fh = open(tmp_path, 'wb')
+        try:
+            fh.write(INDEX_HEADER.pack(INDEX_MAGIC, numrec, date, size,
+                                       mtime, key_size, len(names)))
+            fh.write(names)
+            for entry in entries:
+                fh.write(entry)
+        finally:
+            fh.close()
+    finally:
+        for run in runs:
+            run.close()
+    os.rename(tmp_path, path)
+    return YDbfIndex(path)
+
+def open_index(reader, fields, rebuild=True):
+    """
+    Open sidecar index on fields of DBF, returns YDbfIndex
+    
+    Args:
+        `reader`:
+            YDbfReader instance (reader of DBF file)
+        
+        `fields`:
+            names of indexed fields
+        
+        `rebuild`:
+            build index if it doesn't exist or it is stale (True by
+            default), otherwise raise ValueError
+    """
+    fields = tuple(fields)
+    path = index_path(_dbf_path(reader), fields)
+    if os.path.isfile(path):
+        index = YDbfIndex(path)
+        if index.fields == fields and index.isValid(reader):
+            return index
+        index.close()
+    if not rebuild:
+        raise ValueError("Index %s doesn't exist or it is stale" % path)
+    return build_index(reader, fields)
+
+class YDbfIndex(object):
+    """
+    Sidecar index, maps keys to numbers of records
+    """
+    def __init__(self, path):
+        """
+        Open sidecar index
+        
+        Args:
+            `path`:
+                file name of index
+        """
+        self.path = path
+        # temporary directory of index, it is removed on close
+        self.tmp_dir = None
+        self.fh = open(path, 'rb')
+        header = self.fh.read(INDEX_HEADER.size)
+        if len(header) != INDEX_HEADER.size:
+            raise ValueError("File %s is not an ydbf index" % path)
+        (magic, self.numrec, self.date, self.size, self.mtime,
+         self.key_size, names_size) = INDEX_HEADER.unpack(header)
+        if magic != INDEX_MAGIC:
+            raise ValueError("File %s is not an ydbf index" % path)
+        self.fields = tuple(self.fh.read(names_size).split('+'))
+        self.entry_size = self.key_size + RECNO.size
+        self.offset = INDEX_HEADER.size + names_size
+        self.data = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.numentries = (len(self.data) - self.offset) // self.entry_size
+
+    def isValid(self, reader):
+        """
+        Check that index is bound to current state of DBF
+        """
+        return (self.numrec, self.date, self.size, self.mtime) == \
+               _dbf_state(reader)
+
+    def find(self, key):
+        """
+        Find numbers of records with given key (or key prefix)
+        
+        Returns list of numbers of records in order of index
+        (i.e. by key, then by number of record)
+        """
+        key_len = len(key)
+        data, offset, entry_size = self.data, self.offset, self.entry_size
+        lo, hi = 0, self.numentries
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = offset + mid*entry_size
+            if data[pos:pos + key_len] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        result = []
+        pos = offset + lo*entry_size
+        while pos < len(data) and data[pos:pos + key_len] == key:
+            result.append(RECNO.unpack_from(data, pos + self.key_size)[0])
+            pos += entry_size
+        return result
+
+    def __len__(self):
+        return self.numentries
+
+    def close(self):
+        self.data.close()
+        self.fh.close()
+        if self.tmp_dir is not None:
+            shutil.rmtree(self.tmp_dir, True)
+            self.tmp_dir = None
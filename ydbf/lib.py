@@ -20,7 +20,9 @@
 Common lib for both reader and writer
 """
 
+import codecs
 import datetime
+from decimal import Decimal, InvalidOperation
 
 # Reference data
 
@@ -72,7 +74,33 @@ SIGNATURES = {
     0xFB: 'FoxPro',
 }
 
-SUPPORTED_SIGNATURES = (0x03, 0x04, 0x05)
+SUPPORTED_SIGNATURES = (0x03, 0x04, 0x05, 0x30, 0x31, 0x83, 0x8B, 0xF5)
+
+# Visual FoxPro signatures, header of VFP file has 263 bytes
+# of backlink (path to database container) after fields
+VFP_SIGNATURES = (0x30, 0x31)
+VFP_BACKLINK_SIZE = 263
+
+# struct formats (little endian) of binary fields of Visual FoxPro:
+# I -- integer (int32)
+# B -- double
+# Y -- currency (int64, scaled by 10**4)
+# T -- datetime (int32 julian day, int32 milliseconds since midnight,
+#      unpacked as single int64)
+BINARY_FORMATS = {
+    'I': 'i',
+    'B': 'd',
+    'Y': 'q',
+    'T': 'q',
+}
+# difference between julian day number and ordinal of date
+JULIAN_DAY_SHIFT = 1721425
+
+# default size (in bytes) of data block which is read at once
+BLOCK_SIZE = 1024*1024
+
+# default number of written records between header checkpoints
+CHECKPOINT_RECORDS = 1000
 
 # <   -- little endian
 # B   -- version number (signature)
@@ -80,15 +108,15 @@ SUPPORTED_SIGNATURES = (0x03, 0x04, 0x05)
 # L   -- number of records
 # H   -- length of header
 # H   -- length of each record
-# 17x -- pad (2B -- reserved,
+# 16x -- pad (2B -- reserved,
 #              B -- incomplete transaction,
 #              B -- encryption flag,
 #             4B -- free record thread (reserved for LAN)
-#             8B -- reserved for multiuser dBASE
-#              B -- MDX flag)
+#             8B -- reserved for multiuser dBASE)
+# B   -- MDX flag (production index exists, for FoxPro -- table flags)
 # B   -- language driver
 # 2x  -- pad (2B -- reserved)
-HEADER_FORMAT = '<B3BLHH17xB2x'
+HEADER_FORMAT = '<B3BLHH16xBB2x'
 
 # <   -- little endian
 # 11s -- field name in ASCII (terminated by 0x00)
@@ -98,18 +126,41 @@ HEADER_FORMAT = '<B3BLHH17xB2x'
 #                                   beginning of record (for FoxPro)
 # B   -- field length
 # B   -- decimal count
-# 14x -- pad (2B -- reserved for multi-user dBASE,
+# 13x -- pad (2B -- reserved for multi-user dBASE,
 #              B -- work area id ()
 #             2B -- reserved for multi-user dBASE,
 #              B -- flag for SET FIELDS
-#             7B -- reserved
-#              B -- index field flag)
-# B   -- language driver
-# 2x  -- pad (2B -- reserved)
-FIELD_DESCRIPTION_FORMAT = '<11sc4xBB14x'
+#             7B -- reserved)
+# B   -- index field flag (field has tag in production index)
+FIELD_DESCRIPTION_FORMAT = '<11sc4xBB13xB'
 
 # Common functions
 
+def is_single_byte(encoding):
+    """
+    Check if encoding is a single-byte one (each byte is decoded to one
+    character, so offsets in bytes are equal to offsets in characters).
+    Unknown and multi-byte encodings are reported as non single-byte.
+    
+    Args:
+        `encoding`:
+            name of encoding
+    """
+    try:
+        name = codecs.lookup(encoding).name
+    except LookupError:
+        return False
+    if name == 'ascii':
+        return True
+    # charmap codecs from standard library define table of 256 chars
+    try:
+        module = __import__('encodings.' + name.replace('-', '_'),
+                            fromlist=['decoding_table'])
+    except ImportError:
+        return False
+    table = getattr(module, 'decoding_table', None)
+    return isinstance(table, unicode) and len(table) == 256
+
 def dbf2date(dbf_str):
     """
     Converts date from dbf-date to datetime.date
@@ -126,6 +177,64 @@ def dbf2date(dbf_str):
                                int(dbf_str[6:8]))
     return result
 
+def dbf2datetime(value):
+    """
+    Converts Visual FoxPro datetime to datetime.datetime
+    
+    Args:
+        `value`:
+            int64, where low 32 bits are julian day number and high
+            32 bits are milliseconds since midnight
+    """
+    day = value & 0xFFFFFFFF
+    if not day:
+        return None
+    return datetime.datetime.fromordinal(day - JULIAN_DAY_SHIFT) + \
+           datetime.timedelta(milliseconds=value >> 32)
+
+# quantizers for number of digits after decimal point
+DECIMAL_EXPONENTS = [Decimal(1).scaleb(-dec) for dec in xrange(256)]
+
+def dbf2decimal(dbf_str, dec):
+    """
+    Converts number from dbf-number to exact decimal.Decimal with
+    `dec` digits after decimal point
+    
+    Args:
+        `dbf_str`:
+            number as string (e.g. '  12.30')
+        
+        `dec`:
+            number of digits after decimal point
+    """
+    try:
+        value = Decimal(dbf_str.strip() or 0)
+    except InvalidOperation:
+        raise ValueError("Wrong number %r" % dbf_str)
+    if value.as_tuple()[2] != -dec:
+        if not value.is_finite():
+            raise ValueError("Wrong number %r" % dbf_str)
+        value = value.quantize(DECIMAL_EXPONENTS[dec])
+    return value
+
+def dbf2scaled(dbf_str, dec):
+    """
+    Converts number from dbf-number to integer scaled by 10**`dec`,
+    extra digits after decimal point are truncated
+    
+    Args:
+        `dbf_str`:
+            number as string (e.g. '  12.30')
+        
+        `dec`:
+            number of digits after decimal point
+    """
+    whole, point, frac = dbf_str.strip().partition('.')
+    try:
+        return int((whole + frac[:dec].ljust(dec, '0')).lstrip('+') or 0)
+    except ValueError:
+        raise ValueError("Wrong number %r" % dbf_str)
+
 def date2dbf(dt):
     """
     Converts date from datetime.date to dbf-date (string in format YYYYMMDD)
@@ -172,6 +281,24 @@ def str2dbf(dt_str):
     d, m, y = dt_str.split('.')
     return ''.join((y, m, d))
 
+def compile_function(name, source, namespace):
+    """
+    Compile function from python source code
+    
+    Args:
+        `name`:
+            name of function defined in `source`
+        
+        `source`:
+            python source code of function
+        
+        `namespace`:
+            dict of globals available for function
+    """
+    code = compile(source, '<ydbf %s>' % name, 'exec')
+    exec code in namespace
+    return namespace[name]
+
 # References:
 # [dbfspec]: http://www.clicketyclick.dk/databases/xbase/format/index.html
 
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+# YDbf - Pythonic reader and writer for DBF/XBase files
+# Inspired by code of Raymond Hettinger
+# http://code.activestate.com/recipes/362715
+#
+# Copyright (C) 2006-2010 Yury Yurevich and contributors
+#
+# http://pyobject.ru/projects/ydbf/
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+"""
+Memo files (.dbt, .fpt)
+
+Values of memo ('M') fields are stored in separate file, DBF record
+holds only number of first block of memo. Memo file is read on demand:
+reader returns `MemoHandle` for memo field, and text is read only if
+handle is accessed. Read memos are kept in bounded LRU cache. On cache
+miss a chunk of file is read at once and all memos in the chunk are
+cached too, so access to memos in order of records (memos are usually
+stored in the same order) reads memo file sequentially by big chunks.
+"""
+__all__ = ["MemoFile", "MemoHandle", "open_memo", "memo_path"]
+
+import os
+from collections import OrderedDict
+from struct import Struct
+
+# default number of memos in cache
+CACHE_SIZE = 256
+# default size (in bytes) of chunk which is read on cache miss
+READ_AHEAD = 64*1024
+
+# dBASE III memo is terminated by two 0x1A
+DBT3_TERMINATOR = '\x1a\x1a'
+DBT3_BLOCK_SIZE = 512
+# dBASE IV memo block:
+# <   -- little endian
+# 4s  -- signature (0xFF 0xFF 0x08 0x00)
+# L   -- length of memo (including this header)
+DBT4_BLOCK = Struct('<4sL')
+DBT4_SIGNATURE = '\xff\xff\x08\x00'
+# dBASE IV memo header, block size is at offset 20
+DBT4_HEADER_BLOCK_SIZE = Struct('<20xH')
+# FoxPro memo header:
+# >   -- big endian
+# L   -- next free block
+# 2x  -- reserved
+# H   -- block size
+FPT_HEADER = Struct('>L2xH')
+# FoxPro memo block:
+# >   -- big endian
+# L   -- type of memo (0 -- picture, 1 -- text, 2 -- object)
+# L   -- length of memo (excluding this header)
+FPT_BLOCK = Struct('>LL')
+FPT_TEXT = 1
+
+# extensions of memo files by DBF signatures
+MEMO_EXTENSIONS = {
+    0x30: '.fpt',
+    0x31: '.fpt',
+    0x83: '.dbt',
+    0x8B: '.dbt',
+    0xF5: '.fpt',
+}
+
+def memo_path(dbf_path, sig):
+    """
+    Find memo file for DBF, return None if it is not found
+    
+    Args:
+        `dbf_path`:
+            file name of DBF
+        
+        `sig`:
+            signature of DBF
+    """
+    base = os.path.splitext(dbf_path)[0]
+    ext = MEMO_EXTENSIONS.get(sig, '.dbt')
+    for path in (base + ext, base + ext.upper()):
+        if os.path.isfile(path):
+            return path
+    return None
+
+class MemoHandle(object):
+    """
+    Lazy value of memo field, memo is read by first access to `value`
+    (or by unicode(), str(), len(), comparison)
+    """
+    __slots__ = ('memo', 'block')
+
+    def __init__(self, memo, block):
+        self.memo = memo
+        self.block = block
+
+    @property
+    def value(self):
+        return self.memo.read(self.block)
+
+    def __unicode__(self):
+        return unicode(self.value)
+
+    def __str__(self):
+        value = self.value
+        if isinstance(value, unicode):
+            value = value.encode(self.memo.encoding)
+        return value
+
+    def __len__(self):
+        return len(self.value)
+
+    def __eq__(self, other):
+        if isinstance(other, MemoHandle):
+            other = other.value
+        return self.value == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<MemoHandle %s:%d>' % (self.memo.name, self.block)
+
+class MemoFile(object):
+    """
+    Reader of memo file
+    
+    Children define `_parse(chunk, pos)` which returns tuple (type of
+    memo, data, position of memo's end in chunk) or None if memo
+    doesn't end in chunk.
+    """
+    def __init__(self, fh, encoding=None, cache_size=CACHE_SIZE,
+                 read_ahead=READ_AHEAD):
+        """
+        Create memo file reader
+        
+        Args:
+            `fh`:
+                file handler of memo file
+            
+            `encoding`:
+                decode text memos to unicode with this encoding,
+                leave them as byte strings if None
+            
+            `cache_size`:
+                maximal number of memos in cache
+            
+            `read_ahead`:
+                size (in bytes) of chunk read on cache miss
+        """
+        self.fh = fh
+        self.name = getattr(fh, 'name', '<memo>')
+        self.encoding = encoding
+        self.cache_size = cache_size
+        self.read_ahead = read_ahead
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.block_size = self._readHeader()
+        if not self.block_size:
+            raise ValueError("Block size of memo file %s is zero" % self.name)
+
+    def _readHeader(self):
+        raise NotImplementedError()
+
+    def _parse(self, chunk, pos):
+        raise NotImplementedError()
+
+    def _convert(self, memo_type, data):
+        if memo_type == FPT_TEXT and self.encoding:
+            return data.decode(self.encoding)
+        return data
+
+    def _store(self, block, value):
+        self.cache[block] = value
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def read(self, block):
+        """
+        Get value of memo starting at `block` (text memo is unicode if
+        encoding is defined, other memos are byte strings)
+        """
+        try:
+            value = self.cache.pop(block)
+        except KeyError:
+            self.misses += 1
+            value = self._readChunk(block)
+        else:
+            self.hits += 1
+        self.cache[block] = value
+        return value
+
+    def prefetch(self, blocks):
+        """
+        Read memos starting at `blocks` into cache in order of file
+        
+        Only memos which are not in cache are read. Number of read memos
+        is limited by size of cache.
+        """
+        for block in sorted(set(blocks))[:self.cache_size]:
+            if block not in self.cache:
+                self._readChunk(block)
+
+    def _readChunk(self, block):
+        """
+        Read chunk of file starting at `block`, cache all memos found
+        in chunk and return value of first one
+        """
+        size = self.block_size
+        self.fh.seek(block*size)
+        chunk = self.fh.read(max(self.read_ahead, size))
+        result = self._parse(chunk, 0)
+        while result is None:
+            # memo is bigger than chunk, read more
+            more = self.fh.read(len(chunk))
+            if not more:
+                raise ValueError("Memo at block %d of %s is truncated"
+                                 % (block, self.name))
+            chunk += more
+            result = self._parse(chunk, 0)
+        memo_type, data, end = result
+        value = self._convert(memo_type, data)
+        # cache following memos, they are likely to be read next
+        pos = -(-end // size) * size
+        while pos < len(chunk):
+            following = self._parse(chunk, pos)
+            if following is None:
+                break
+            if block + pos // size not in self.cache:
+                self._store(block + pos // size,
+                            self._convert(*following[:2]))
+            pos = -(-following[2] // size) * size
+        self._store(block, value)
+        return value
+
+    def close(self):
+        self.cache.clear()
+        self.fh.close()
+
+class DbtMemoFile(MemoFile):
+    """
+    dBASE III/IV memo file (.dbt)
+    """
+    def __init__(self, fh, encoding=None, cache_size=CACHE_SIZE,
+                 read_ahead=READ_AHEAD, version=3):
+        self.version = version
+        super(DbtMemoFile, self).__init__(fh, encoding, cache_size,
+                                          read_ahead)
+
+    def _readHeader(self):
+        if self.version == 3:
+            return DBT3_BLOCK_SIZE
+        self.fh.seek(0)
+        header = self.fh.read(DBT4_HEADER_BLOCK_SIZE.size)
+        return DBT4_HEADER_BLOCK_SIZE.unpack(header)[0] or DBT3_BLOCK_SIZE
+
+    def _parse(self, chunk, pos):
+        if chunk.startswith(DBT4_SIGNATURE, pos):
+            if pos + DBT4_BLOCK.size > len(chunk):
+                return None
+            length = DBT4_BLOCK.unpack_from(chunk, pos)[1]
+            end = pos + length
+            if end > len(chunk):
+                return None
+            return FPT_TEXT, chunk[pos + DBT4_BLOCK.size:end], end
+        end = chunk.find(DBT3_TERMINATOR, pos)
+        if end < 0:
+            return None
+        return FPT_TEXT, chunk[pos:end], end + len(DBT3_TERMINATOR)
+
+class FptMemoFile(MemoFile):
+    """
+    FoxPro memo file (.fpt)
+    """
+    def _readHeader(self):
+        self.fh.seek(0)
+        next_free, block_size = FPT_HEADER.unpack(
+            self.fh.read(FPT_HEADER.size))
+        return block_size
+
+    def _parse(self, chunk, pos):
+        if pos + FPT_BLOCK.size > len(chunk):
+            return None
+        memo_type, length = FPT_BLOCK.unpack_from(chunk, pos)
+        end = pos + FPT_BLOCK.size + length
+        if end > len(chunk):
+            return None
+        return memo_type, chunk[pos + FPT_BLOCK.size:end], end
+
+def open_memo(path, sig, encoding=None, cache_size=CACHE_SIZE,
+              read_ahead=READ_AHEAD):
+    """
+    Open memo file for DBF with signature `sig`
+    
+    Args:
+        `path`:
+            file name of memo file or file-like object
+        
+        `sig`:
+            signature of DBF
+        
+        `encoding`, `cache_size`, `read_ahead`:
+            see `MemoFile`
+    """
+    fh = path
+    if isinstance(path, basestring):
+        fh = open(path, 'rb')
+    if MEMO_EXTENSIONS.get(sig) == '.fpt':
+        return FptMemoFile(fh, encoding, cache_size, read_ahead)
+    return DbtMemoFile(fh, encoding, cache_size, read_ahead,
+                       version=(sig == 0x83 and 3) or 4)
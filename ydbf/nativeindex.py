@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+# YDbf - Pythonic reader and writer for DBF/XBase files
+# Inspired by code of Raymond Hettinger
+# http://code.activestate.com/recipes/362715
+#
+# Copyright (C) 2006-2010 Yury Yurevich and contributors
+#
+# http://pyobject.ru/projects/ydbf/
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+"""
+Reading of native dBASE (.ndx, .mdx) and FoxPro (.cdx) indexes
+
+Indexes are B-trees maintained by dBASE/FoxPro software. Each index
+consists of one (.ndx) or several (.mdx, .cdx) tags, each tag is
+a B-tree over key expression. Tags are walked in order of keys, so
+records are found without full scan of DBF and without sorting.
+
+Keys are decoded to python values: character keys to stripped str,
+numeric keys to float (Decimal for BCD keys of .mdx), date keys
+to julian day number (float). Only ascending tags are supported.
+
+Formats are read by their published descriptions, tests use files
+built by these descriptions (not files made by dBASE or FoxPro).
+"""
+__all__ = ["NdxIndex", "MdxIndex", "CdxIndex", "open_native_index",
+           "julian_day"]
+
+import os
+from struct import Struct, unpack_from
+from decimal import Decimal
+
+from ydbf.lib import JULIAN_DAY_SHIFT
+
+PAGE_SIZE = 512
+UINT32 = Struct('<L')
+DOUBLE = Struct('<d')
+DOUBLE_BE = Struct('>d')
+
+# NDX header:
+# <    -- little endian
+# L    -- root page
+# L    -- number of pages
+# 4x   -- reserved
+# H    -- key length
+# H    -- max number of keys per page
+# H    -- key type (0 -- character, 1 -- numeric/date)
+# H    -- size of key entry
+# 3x   -- reserved
+# B    -- unique flag
+NDX_HEADER = Struct('<LL4xHHHH3xB')
+
+# MDX header (only used parts):
+# <    -- little endian
+# B    -- version
+# 3B   -- date of creation
+# 16s  -- name of DBF
+# H    -- block size in pages
+# H    -- block size in bytes
+# B    -- production index flag
+# B    -- max number of tags
+# B    -- length of tag table entry
+# x    -- reserved
+# H    -- number of tags in use
+MDX_HEADER = Struct('<B3B16sHHBBBxH')
+MDX_TAG_TABLE_OFFSET = 544
+# MDX tag table entry:
+# <    -- little endian
+# L    -- page of tag header
+# 11s  -- tag name
+# B    -- key format
+# 4x   -- tag threads
+# c    -- key type
+MDX_TAG_ENTRY = Struct('<L11sB4xc')
+# MDX tag header:
+# <    -- little endian
+# L    -- root page
+# L    -- file size in pages
+# B    -- key format (0x08 -- descending, 0x40 -- unique)
+# c    -- key type
+# 2x   -- reserved
+# H    -- key length
+# H    -- max number of keys per node
+# H    -- secondary key type
+# H    -- size of key entry
+# 3x   -- reserved
+# B    -- unique flag
+MDX_TAG_HEADER = Struct('<LLBc2xHHHH3xB')
+MDX_DESCENDING = 0x08
+# maximal depth of tree (deeper trees are treated as broken)
+MDX_MAX_DEPTH = 32
+
+# CDX tag header:
+# <    -- little endian
+# L    -- root node offset
+# l    -- free node list offset
+# L    -- version
+# H    -- key length
+# B    -- index options
+# B    -- index signature
+CDX_HEADER = Struct('<LlLHBB')
+CDX_HEADER_SIZE = 1024
+CDX_ORDER_OFFSET = 502
+CDX_NODE_SIZE = 512
+# CDX node header:
+# <    -- little endian
+# H    -- attributes (0 -- index, 1 -- root, 2 -- leaf)
+# H    -- number of keys
+# l    -- left sibling
+# l    -- right sibling
+CDX_NODE = Struct('<HHll')
+CDX_LEAF = 0x02
+# CDX leaf node header (after node header):
+# <    -- little endian
+# H    -- free space
+# L    -- record number mask
+# B    -- duplicate count mask
+# B    -- trailing count mask
+# B    -- number of bits for record number
+# B    -- number of bits for duplicate count
+# B    -- number of bits for trailing count
+# B    -- number of bytes of key info
+CDX_LEAF_HEADER = Struct('<HLBBBBBB')
+
+def julian_day(date):
+    """
+    Get julian day number of date, as it stored in index keys
+    """
+    return float(date.toordinal() + JULIAN_DAY_SHIFT)
+
+def _decode_char(raw):
+    return raw.rstrip(' \x00')
+
+def _decode_bcd(raw):
+    """
+    Decode dBASE IV numeric key (12 bytes BCD)
+    """
+    exponent = ord(raw[0]) - 0x34
+    info = ord(raw[1])
+    ndigits = (info >> 2) & 0x1F
+    if not ndigits:
+        return Decimal(0)
+    digits = ''.join('%02x' % ord(c) for c in raw[2:])[:ndigits]
+    value = Decimal('0.' + digits).scaleb(exponent)
+    if info & 0x80:
+        value = -value
+    return value
+
+def _decode_foxpro_double(raw):
+    """
+    Decode FoxPro binary key (big-endian double, transformed
+    to be comparable byte by byte)
+    """
+    if ord(raw[0]) & 0x80:
+        raw = chr(ord(raw[0]) ^ 0x80) + raw[1:]
+    else:
+        raw = ''.join(chr(~ord(c) & 0xFF) for c in raw)
+    return DOUBLE_BE.unpack(raw)[0]
+
+class Tag(object):
+    """
+    Single B-tree of index
+    
+    Children define `_readNode(pointer, depth)` which returns tuple
+    (is leaf, [(key, pointer), ...], last child pointer or None),
+    where pointers of leaf nodes are numbers of records and `depth`
+    is a depth of node (0 for root).
+    """
+    def __init__(self, fh, name, expression, root, decode_key,
+                 descending=False):
+        self.fh = fh
+        self.name = name
+        self.expression = expression
+        self.root = root
+        self.decode_key = decode_key
+        self.descending = descending
+
+    def _read(self, offset, size):
+        self.fh.seek(offset)
+        return self.fh.read(size)
+
+    def _readNode(self, pointer, depth):
+        raise NotImplementedError()
+
+    def iterKeys(self, low=None):
+        """
+        Iterate over pairs (key, record number) in order of keys,
+        starting from key `low` (from first key, if `low` is None).
+        Record numbers are 0-based.
+        """
+        if self.descending:
+            raise ValueError("Descending tag %s is not supported" % self.name)
+        return self._walk(self.root, low, 0)
+
+    def _walk(self, pointer, low, depth):
+        is_leaf, entries, last = self._readNode(pointer, depth)
+        if is_leaf:
+            for key, recno in entries:
+                if low is None or key >= low:
+                    yield key, recno - 1
+            return
+        if last:
+            entries.append((None, last))
+        for key, child in entries:
+            # key of index node is the biggest key of child
+            if low is None or key is None or key >= low:
+                for item in self._walk(child, low, depth + 1):
+                    yield item
+
+class NdxTag(Tag):
+    """
+    Tag of dBASE III .ndx index
+    """
+    def __init__(self, fh, name):
+        header = fh.read(PAGE_SIZE)
+        (root, pages, self.key_length, max_keys, key_type,
+         self.entry_size, unique) = NDX_HEADER.unpack_from(header)
+        expression = header[24:].split('\x00', 1)[0].strip()
+        if key_type:
+            decode_key = lambda raw: DOUBLE.unpack(raw[:8])[0]
+        else:
+            decode_key = _decode_char
+        super(NdxTag, self).__init__(fh, name, expression, root, decode_key)
+
+    def _readNode(self, page, depth):
+        data = self._read(page*PAGE_SIZE, PAGE_SIZE)
+        count = UINT32.unpack_from(data)[0]
+        entries = []
+        pos = 4
+        is_leaf = True
+        for i in xrange(count):
+            child, recno = unpack_from('<LL', data, pos)
+            key = self.decode_key(data[pos + 8:pos + 8 + self.key_length])
+            if child:
+                is_leaf = False
+                entries.append((key, child))
+            else:
+                entries.append((key, recno))
+            pos += self.entry_size
+        last = None
+        if not is_leaf and pos + 4 <= PAGE_SIZE:
+            last = UINT32.unpack_from(data, pos)[0]
+        return is_leaf, entries, last
+
+class MdxTag(Tag):
+    """
+    Tag of dBASE IV .mdx index
+    """
+    def __init__(self, fh, name, header_page, block_size):
+        self.block_size = block_size
+        self.file_pages = os.fstat(fh.fileno()).st_size // PAGE_SIZE
+        self.leaf_depth = None
+        fh.seek(header_page*PAGE_SIZE)
+        header = fh.read(PAGE_SIZE)
+        (root, pages, key_format, self.key_type, self.key_length, max_keys,
+         secondary_type, self.entry_size, unique) = \
+            MDX_TAG_HEADER.unpack_from(header)
+        expression = header[24:244].split('\x00', 1)[0].strip()
+        if self.key_type == 'C':
+            decode_key = _decode_char
+        elif self.key_type == 'D':
+            decode_key = lambda raw: DOUBLE.unpack(raw[:8])[0]
+        else:
+            decode_key = _decode_bcd
+        super(MdxTag, self).__init__(fh, name, expression, root, decode_key,
+                                     bool(key_format & MDX_DESCENDING))
+
+    def _readEntries(self, page):
+        """
+        Read block of tree, returns pair ([(key, pointer), ...],
+        pointer after last entry or 0)
+        """
+        data = self._read(page*PAGE_SIZE, self.block_size)
+        count = UINT32.unpack_from(data)[0]
+        if 8 + count*self.entry_size > len(data):
+            raise ValueError("Wrong block %d of tag %s: %d keys don't fit "
+                             "into block" % (page, self.name, count))
+        entries = []
+        pos = 8
+        for i in xrange(count):
+            pointer = UINT32.unpack_from(data, pos)[0]
+            entries.append((self.decode_key(data[pos + 4:
+                                                 pos + 4 + self.key_length]),
+                            pointer))
+            pos += self.entry_size
+        last = 0
+        if pos + 4 <= len(data):
+            last = UINT32.unpack_from(data, pos)[0]
+        return entries, last
+
+    def _isBlock(self, page):
+        return 0 < page < self.file_pages
+
+    def _leafDepth(self):
+        """
+        Get depth of leaves of tree
+        
+        Block has no flag of leaf, but index block has pointer to child
+        block without key after last entry, and it is zero in leaf. All
+        leaves of B-tree are on the same depth, so it is found once by
+        leftmost path, and stale data after keys of other leaves doesn't
+        matter.
+        """
+        if self.leaf_depth is None:
+            page, depth = self.root, 0
+            while depth < MDX_MAX_DEPTH:
+                entries, last = self._readEntries(page)
+                pointers = [pointer for key, pointer in entries] + [last]
+                if not all(self._isBlock(pointer) for pointer in pointers):
+                    break
+                page = pointers[0]
+                depth += 1
+            else:
+                raise ValueError("Tag %s is broken: tree is deeper than %d"
+                                 % (self.name, MDX_MAX_DEPTH))
+            self.leaf_depth = depth
+        return self.leaf_depth
+
+    def _readNode(self, page, depth):
+        entries, last = self._readEntries(page)
+        if depth >= self._leafDepth():
+            return True, entries, None
+        if not self._isBlock(last):
+            raise ValueError("Wrong block %d of tag %s: it should be index "
+                             "block (depth of leaves is %d)"
+                             % (page, self.name, self.leaf_depth))
+        return False, entries, last
+
+class CdxTag(Tag):
+    """
+    Tag of FoxPro .cdx index (compact B-tree)
+    """
+    def __init__(self, fh, name, offset, key_type='C'):
+        fh.seek(offset)
+        header = fh.read(CDX_HEADER_SIZE)
+        (root, free_list, version, self.key_length, options,
+         signature) = CDX_HEADER.unpack_from(header)
+        descending = unpack_from('<H', header, CDX_ORDER_OFFSET)[0]
+        expression = header[512:].split('\x00', 1)[0].strip()
+        if key_type == 'C':
+            self.fill = ' '
+            decode_key = _decode_char
+        else:
+            # numbers, dates are binary
+            self.fill = '\x00'
+            decode_key = _decode_foxpro_double
+        super(CdxTag, self).__init__(fh, name, expression, root, decode_key,
+                                     bool(descending))
+
+    def _readNode(self, offset, depth):
+        data = self._read(offset, CDX_NODE_SIZE)
+        attributes, count, left, right = CDX_NODE.unpack_from(data)
+        entries = []
+        key_length = self.key_length
+        if not attributes & CDX_LEAF:
+            pos = CDX_NODE.size
+            for i in xrange(count):
+                key = data[pos:pos + key_length]
+                recno, child = unpack_from('>LL', data, pos + key_length)
+                entries.append((self.decode_key(key), child))
+                pos += key_length + 8
+            return False, entries, None
+        (free, rec_mask, dup_mask, trail_mask, rec_bits, dup_bits,
+         trail_bits, info_size) = CDX_LEAF_HEADER.unpack_from(data,
+                                                              CDX_NODE.size)
+        info_pos = CDX_NODE.size + CDX_LEAF_HEADER.size
+        key_end = CDX_NODE_SIZE
+        previous = ''
+        for i in xrange(count):
+            info = 0
+            for j, c in enumerate(data[info_pos:info_pos + info_size]):
+                info |= ord(c) << (8*j)
+            info_pos += info_size
+            recno = info & rec_mask
+            dup = (info >> rec_bits) & dup_mask
+            trail = (info >> (rec_bits + dup_bits)) & trail_mask
+            size = key_length - dup - trail
+            key_end -= size
+            key = previous[:dup] + data[key_end:key_end + size] + \
+                  self.fill*trail
+            previous = key
+            entries.append((self.decode_key(key), recno))
+        return True, entries, None
+
+class NdxIndex(object):
+    """
+    dBASE III .ndx index, it has single tag named by file name
+    """
+    def __init__(self, path, field_types=None):
+        self.path = path
+        self.fh = open(path, 'rb')
+        name = os.path.splitext(os.path.basename(path))[0].upper()
+        self.tags = {name: NdxTag(self.fh, name)}
+
+    def close(self):
+        self.fh.close()
+
+class MdxIndex(object):
+    """
+    dBASE IV .mdx index (multiple tags)
+    """
+    def __init__(self, path, field_types=None):
+        self.path = path
+        self.fh = open(path, 'rb')
+        header = self.fh.read(MDX_TAG_TABLE_OFFSET)
+        (version, year, month, day, dbf_name, block_pages, block_size,
+         production, max_tags, entry_size, numtags) = \
+            MDX_HEADER.unpack_from(header)
+        self.tags = {}
+        for i in xrange(numtags):
+            self.fh.seek(MDX_TAG_TABLE_OFFSET + i*entry_size)
+            header_page, name, key_format, key_type = \
+                MDX_TAG_ENTRY.unpack(self.fh.read(MDX_TAG_ENTRY.size))
+            name = name.split('\x00', 1)[0].upper()
+            self.tags[name] = MdxTag(self.fh, name, header_page,
+                                     block_size or block_pages*PAGE_SIZE)
+
+    def close(self):
+        self.fh.close()
+
+class CdxIndex(object):
+    """
+    FoxPro compound .cdx index (multiple tags)
+    
+    Key type of tag is resolved by `field_types` (dict name -> DBF type)
+    if key expression is a field name, otherwise character is assumed.
+    """
+    def __init__(self, path, field_types=None):
+        self.path = path
+        self.fh = open(path, 'rb')
+        field_types = field_types or {}
+        # header of file is a tag directory: index of tag names,
+        # where "record numbers" are offsets of tag headers
+        directory = CdxTag(self.fh, 'TAGS', 0)
+        self.tags = {}
+        for name, offset in list(directory.iterKeys()):
+            # iterKeys returns 0-based numbers
+            tag = CdxTag(self.fh, name.upper(), offset + 1)
+            key_type = field_types.get(tag.expression.upper(), 'C')
+            if key_type != 'C':
+                tag = CdxTag(self.fh, name.upper(), offset + 1, key_type)
+            self.tags[tag.name] = tag
+
+    def close(self):
+        self.fh.close()
+
+INDEX_CLASSES = {
+    '.ndx': NdxIndex,
+    '.mdx': MdxIndex,
+    '.cdx': CdxIndex,
+}
+
+def open_native_index(path, field_types=None):
+    """
+    Open native index by its extension (.ndx, .mdx or .cdx)
+    
+    Args:
+        `path`:
+            file name of index
+        
+        `field_types`:
+            dict name of field -> DBF type, is used for resolving
+            of key types of FoxPro tags
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in INDEX_CLASSES:
+        raise ValueError("Unknown type of index %s, should be one of: %s"
+                         % (path, ', '.join(sorted(INDEX_CLASSES))))
+    return INDEX_CLASSES[ext](path, field_types)
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# YDbf - Pythonic reader and writer for DBF/XBase files
+# Inspired by code of Raymond Hettinger
+# http://code.activestate.com/recipes/362715
+#
+# Copyright (C) 2006-2010 Yury Yurevich and contributors
+#
+# http://pyobject.ru/projects/ydbf/
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+"""
+Parallel reading of single DBF by pool of processes
+
+Record range of DBF file is split into chunks, each chunk is read and
+decoded in its own worker process by regular YDbfReader. Functions
+passed to workers (`func`, `predicate`, `function`, `combine`) should
+be picklable, i.e. defined on module level.
+
+Records are pickled to parent process, so memo fields are read in
+workers (as with `lazy_memo=False`), and records of row types
+'namedtuple' and 'slots' (their classes are made at runtime, so they
+can't be pickled) are sent as tuples and made in parent process.
+"""
+__all__ = ["parallel_records", "parallel_reduce"]
+
+import multiprocessing
+
+import ydbf
+
+# row types whose records are sent from workers as tuples
+TUPLE_ROW_TYPES = ('namedtuple', 'slots')
+
+def _make_chunks(dbf_path, workers, chunk_size, reader_kwargs):
+    """
+    Split record range of DBF to chunks
+
+    Returns list of (start, count) pairs
+    """
+    reader = ydbf.open(dbf_path, **reader_kwargs)
+    try:
+        numrec = reader.numrec
+    finally:
+        reader.close()
+    if chunk_size is None:
+        # several chunks per worker smooth out unequal chunks
+        chunk_size = max(1, -(-numrec // (workers*4)))
+    return [(start, min(chunk_size, numrec - start))
+            for start in xrange(0, numrec, chunk_size)]
+
+def _iter_chunk(dbf_path, start, count, predicate, show_deleted, fields,
+                reader_kwargs):
+    """
+    Iterate over records of chunk, filtered by predicate
+    """
+    reader = ydbf.open(dbf_path, **reader_kwargs)
+    try:
+        for rec in reader.records(start_from=start, limit=count,
+                                  show_deleted=show_deleted, fields=fields):
+            if predicate is None or predicate(rec):
+                yield rec
+    finally:
+        reader.close()
+
+def _row_class(dbf_path, show_deleted, fields, reader_kwargs):
+    """
+    Get class of records (for row types 'namedtuple' and 'slots')
+    """
+    reader = ydbf.open(dbf_path, **reader_kwargs)
+    try:
+        return reader._getRowClass(reader._decodedNames(show_deleted,
+                                                        fields))
+    finally:
+        reader.close()
+
+def _read_chunk(args):
+    """
+    Read chunk of records in worker process
+    """
+    (dbf_path, start, count, func, predicate, show_deleted, fields,
+     reader_kwargs, as_tuples) = args
+    records = _iter_chunk(dbf_path, start, count, predicate, show_deleted,
+                          fields, reader_kwargs)
+    if func is not None:
+        return [func(rec) for rec in records]
+    if as_tuples:
+        return [tuple(rec) for rec in records]
+    return list(records)
+
+def _reduce_chunk(args):
+    """
+    Reduce chunk of records in worker process
+    """
+    (dbf_path, start, count, function, initial, predicate, show_deleted,
+     fields, reader_kwargs) = args
+    records = _iter_chunk(dbf_path, start, count, predicate, show_deleted,
+                          fields, reader_kwargs)
+    return reduce(function, records, initial)
+
+def _run(worker, tasks, workers, ordered):
+    """
+    Run tasks by pool of `workers` processes, yield results
+    """
+    if workers == 1:
+        # no reason to spawn single process
+        for task in tasks:
+            yield worker(task)
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        if ordered:
+            results = pool.imap(worker, tasks)
+        else:
+            results = pool.imap_unordered(worker, tasks)
+        for result in results:
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def parallel_records(dbf_path, workers=None, func=None, predicate=None,
+                     ordered=True, chunk_size=None, show_deleted=False,
+                     fields=None, **reader_kwargs):
+    """
+    Iterate over DBF records read by pool of processes
+    
+    Args:
+        `dbf_path`:
+            file name of DBF (each worker opens its own file handler)
+        
+        `workers`:
+            number of worker processes, by default number of CPUs
+        
+        `func`:
+            function applied to each record in worker (optional),
+            its results are yielded instead of records
+        
+        `predicate`:
+            function applied to each record in worker (optional),
+            only records for which it returns true are yielded
+        
+        `ordered`:
+            yield records in order of file (True, default), or in
+            order of chunks completion (False), which is faster
+        
+        `chunk_size`:
+            number of records read by worker at once, by default
+            record range is split to four chunks per worker
+        
+        `show_deleted`, `fields`:
+            are passed to `YDbfReader.records`
+    
+    All other keyword args are passed to `ydbf.open`.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    row_class = None
+    if func is None:
+        # lazy memo can't be pickled
+        reader_kwargs['lazy_memo'] = False
+        if reader_kwargs.get('row_type') in TUPLE_ROW_TYPES:
+            row_class = _row_class(dbf_path, show_deleted, fields,
+                                   reader_kwargs)
+    tasks = [(dbf_path, start, count, func, predicate, show_deleted, fields,
+              reader_kwargs, row_class is not None)
+             for start, count in _make_chunks(dbf_path, workers, chunk_size,
+                                              reader_kwargs)]
+    for records in _run(_read_chunk, tasks, workers, ordered):
+        if row_class is None:
+            for rec in records:
+                yield rec
+        else:
+            for values in records:
+                yield row_class(*values)
+
+def parallel_reduce(dbf_path, function, initial, combine, workers=None,
+                    predicate=None, chunk_size=None, show_deleted=False,
+                    fields=None, **reader_kwargs):
+    """
+    Reduce DBF records by pool of processes
+    
+    Each chunk is reduced in worker as `reduce(function, records, initial)`,
+    then results of chunks are reduced as `reduce(combine, results, initial)`
+    in order of chunks completion, so `combine` should be commutative.
+    `initial` is a start value both for chunks and for combining their
+    results, so it should be an identity value of `combine` (e.g. 0
+    for addition, empty list for concatenation), otherwise it is
+    counted once per chunk.
+    For example, sum of field AMOUNT is
+    
+        def add_amount(total, rec):
+            return total + rec['AMOUNT']
+        
+        parallel_reduce(path, add_amount, 0, operator.add)
+    
+    Args `workers`, `predicate`, `chunk_size`, `show_deleted`, `fields`
+    and other keyword args are the same as for `parallel_records`.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    tasks = [(dbf_path, start, count, function, initial, predicate,
+              show_deleted, fields, reader_kwargs)
+             for start, count in _make_chunks(dbf_path, workers, chunk_size,
+                                              reader_kwargs)]
+    return reduce(combine, _run(_reduce_chunk, tasks, workers, False),
+                  initial)
@@ -19,13 +19,20 @@
 """
 DBF reader
 """
-__all__ = ["YDbfStrictReader", "YDbfReader"]
+__all__ = ["YDbfStrictReader", "YDbfReader", "YDbfMmapReader",
+           "YDbfStreamReader"]
 
+import os
+import re
+import mmap
+import keyword
 import datetime
-from struct import calcsize, unpack
-from itertools import izip
+from collections import namedtuple
+from cStringIO import StringIO
+from struct import unpack, unpack_from, calcsize, Struct
 
-from ydbf import lib
+from ydbf import lib, memo, stream
+from ydbf.memo import MemoHandle
 
 try:
     from decimal import Decimal
@@ -34,13 +41,195 @@ except ImportError:
     Decimal = lambda x: float(x)
     decimal_enabled = False
 
+# operators of conditions for records(where=...)
+WHERE_OPS = ('==', '!=', '<', '<=', '>', '>=', 'startswith')
+
+# supported types of fields (VFP types are 'F', 'I', 'B', 'Y', 'T'
+# and '0' -- null flags, it's decoded as raw bytes)
+FIELD_TYPES = ('N', 'D', 'L', 'C', 'M', 'F', 'I', 'B', 'Y', 'T', '0')
+
+# formats of records
+ROW_TYPES = ('dict', 'tuple', 'namedtuple', 'slots')
+
+# modes of decoding of numbers with decimals
+NUMERIC_MODES = ('decimal', 'float', 'int', 'raw')
+
+# options of value cache: maximal number of cached values of field,
+# number of lookups before hit ratio is checked, minimal hit ratio
+# of adaptive cache
+VALUE_CACHE_SIZE = 4096
+VALUE_CACHE_WINDOW = 1024
+VALUE_CACHE_MIN_HIT_RATIO = 0.5
+# types of fields which values may be cached
+VALUE_CACHE_TYPES = ('C', 'D', 'N', 'F')
+
+class ValueCache(object):
+    """
+    Cache of converted values of field, keyed by raw bytes of field
+    
+    Cache is cleared when it's full. Adaptive cache is disabled when
+    hit ratio is lower than `min_hit_ratio` after `window` lookups.
+    """
+    def __init__(self, name, adaptive=True, max_size=VALUE_CACHE_SIZE,
+                 window=VALUE_CACHE_WINDOW,
+                 min_hit_ratio=VALUE_CACHE_MIN_HIT_RATIO, on_disable=None):
+        self.name = name
+        self.adaptive = adaptive
+        self.max_size = max_size
+        self.window = window
+        self.min_hit_ratio = min_hit_ratio
+        self.on_disable = on_disable
+        self.enabled = True
+        self.values = {}
+        # hits are counted by compiled decoder
+        self.hits_counter = [0]
+        self.misses = 0
+        # function raw value -> value, it's set by decoder builder
+        self.convert = None
+
+    @property
+    def hits(self):
+        return self.hits_counter[0]
+
+    def miss(self, raw):
+        self.misses += 1
+        value = self.convert(raw)
+        if len(self.values) >= self.max_size:
+            self.values.clear()
+        self.values[raw] = value
+        if self.adaptive:
+            lookups = self.misses + self.hits_counter[0]
+            if lookups >= self.window and \
+                   self.hits_counter[0] < lookups*self.min_hit_ratio:
+                self.disable()
+        return value
+
+    def disable(self):
+        self.enabled = False
+        self.values.clear()
+        if self.on_disable is not None:
+            self.on_disable(self)
+
+class LazyRecord(object):
+    """
+    Read-only mapping over raw bytes of record, value of field is
+    converted on first access and memoized
+    
+    Use `dict(rec)` or `rec.materialize()` to convert all fields.
+    """
+    __slots__ = ('_raw', '_layout', '_values')
+
+    def __init__(self, raw, layout):
+        """
+        Args:
+            `raw`:
+                bytes of record
+            `layout`:
+                pair (names of fields, dict name -> function which
+                gets value of field from bytes of record)
+        """
+        self._raw = raw
+        self._layout = layout
+        self._values = None
+
+    def __getitem__(self, name):
+        values = self._values
+        if values is None:
+            values = self._values = {}
+        elif name in values:
+            return values[name]
+        value = values[name] = self._layout[1][name](self._raw)
+        return value
+
+    def get(self, name, default=None):
+        if name not in self._layout[1]:
+            return default
+        return self[name]
+
+    def __contains__(self, name):
+        return name in self._layout[1]
+
+    def keys(self):
+        return list(self._layout[0])
+
+    def __iter__(self):
+        return iter(self._layout[0])
+
+    def __len__(self):
+        return len(self._layout[0])
+
+    def values(self):
+        return [self[name] for name in self._layout[0]]
+
+    def items(self):
+        return [(name, self[name]) for name in self._layout[0]]
+
+    def materialize(self):
+        """
+        Convert all fields, return record as dict
+        """
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, LazyRecord):
+            other = other.materialize()
+        return self.materialize() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<LazyRecord %r>' % self.materialize()
+
+IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def _makeSlotsClass(names):
+    """
+    Make lightweight record class with __slots__ for given field names
+    
+    Names which are not valid identifiers (or are keywords, duplicates,
+    or dunder names) are replaced by '_N', where N is position of field,
+    as by `namedtuple(rename=True)`.
+    """
+    names = list(names)
+    seen = set()
+    for i, name in enumerate(names):
+        if not IDENTIFIER_RE.match(name) or keyword.iskeyword(name) or \
+               name.startswith('__') or name == '_asdict' or name in seen:
+            names[i] = '_%d' % i
+        seen.add(names[i])
+    source = ["class Record(object):",
+              "    __slots__ = %r" % (tuple(names),),
+              "    def __init__(self%s):" % ''.join(', ' + n for n in names)]
+    source.extend("        self.%s = %s" % (n, n) for n in names)
+    source.extend([
+        "        pass",
+        "    def __iter__(self):",
+        "        return iter((%s))" % ''.join('self.%s, ' % n for n in names),
+        "    def __eq__(self, other):",
+        "        return type(self) is type(other) and "
+        "tuple(self) == tuple(other)",
+        "    def __ne__(self, other):",
+        "        return not self == other",
+        "    def __repr__(self):",
+        "        return 'Record(%s)' %% (%s)" % (
+            ', '.join('%s=%%r' % n for n in names),
+            ''.join('self.%s, ' % n for n in names)),
+        "    def _asdict(self):",
+        "        return {%s}" % ', '.join('%r: self.%s' % (n, n)
+                                         for n in names),
+    ])
+    return lib.compile_function('Record', '\n'.join(source) + '\n', {})
+
 class YDbfReader(object):
     """
     Basic class for reading DBF
     
     Instance is an iterator over DBF records
     """
-    def __init__(self, fh, fields=None, use_unicode=True, encoding=None):
+    def __init__(self, fh, fields=None, use_unicode=True, encoding=None,
+                 block_size=lib.BLOCK_SIZE, row_type='dict', memo=None,
+                 lazy_memo=True, numeric='decimal', value_cache=None):
         """
         Iterator over DBF records
         
@@ -60,9 +249,62 @@ class YDbfReader(object):
             `encoding`:
                 force usage of implicitly defined encoding
                 instead of builtin one. By default None.
+            
+            `block_size`:
+                size (in bytes) of readahead block. Records are read
+                from file by blocks of this size and decoded from
+                block one by one. At least one record is read at once.
+                By default 1 MB.
+            
+            `row_type`:
+                format of records: 'dict' (default) -- dict where keys are
+                names of fields, 'tuple' -- plain tuple of values in order
+                of fields, 'namedtuple' -- named tuple with fields as
+                attributes, 'slots' -- lightweight object with __slots__,
+                fields are attributes. Names of fields which are not
+                valid identifiers are renamed to '_N' (N is position).
+            
+            `memo`:
+                file name or filehandler of memo file (.dbt, .fpt) for
+                'M' fields. By default, memo file with the same name
+                as DBF is used. Memo file is opened on first read of
+                memo.
+            
+            `lazy_memo`:
+                convert 'M' fields to `ydbf.memo.MemoHandle`, so memo is
+                read only if it's accessed (True by default), otherwise
+                memo is read with record.
+            
+            `numeric`:
+                how to decode 'N' and 'F' fields with decimals (and 'Y'
+                fields): 'decimal' (default) -- exact Decimal, 'float' --
+                float, 'int' -- integer scaled by 10**DEC (extra digits
+                are truncated), 'raw' -- raw bytes of field (unpacked
+                int64 for 'Y'). Fields without decimals are int in all
+                modes except 'raw'.
+            
+            `value_cache`:
+                cache converted values of fields by raw bytes, so repeated
+                values are converted once and shared. 'auto' -- cache all
+                'C', 'D', 'N', 'F' fields, cache of field is disabled if
+                its hit ratio is low, sequence of names -- always cache
+                these fields. Disabled by default. See `cacheStats`.
         """
+        if row_type not in ROW_TYPES:
+            raise ValueError("Wrong row type %s, should be one of: %s"
+                             % (row_type, ', '.join(ROW_TYPES)))
+        if numeric not in NUMERIC_MODES:
+            raise ValueError("Wrong numeric mode %s, should be one of: %s"
+                             % (numeric, ', '.join(NUMERIC_MODES)))
         self.fh = fh             # filehandler
+        self.block_size = block_size
+        self.row_type = row_type
+        self.numeric = numeric
         self.implicit_encoding = encoding
+        self.memo_source = memo
+        self.lazy_memo = lazy_memo
+        self.memo_file = None    # opened memo file
+        self.value_cache = value_cache
         if fields:
             self._fields = [('_deletion_flag', 'C', 1, 0)] + list(fields)
             self.fields = list(fields)
@@ -83,8 +325,13 @@ class YDbfReader(object):
         self.stop_at = 0         # number of rec, iteration stopped at
                                  # (not include this)
         self.recfmt = ''         # struct-format of rec
+        self.field_offsets = {}  # offsets of fields in rec
+        self.field_sizes = {}    # sizes and decimals of fields
+        self.rec_struct = None   # compiled struct of rec
         self.recsize = 0         # size of each record (in bytes)
         self.dt = None           # date of file creation
+        self.mdx_flag = 0        # production index flag
+        self.indexed_fields = [] # fields with tags in production index
         self.dbf2date = lib.dbf2date # function for conversion from dbf to date
         
 
@@ -92,7 +339,17 @@ class YDbfReader(object):
         self.builtin_encoding = None
 
         self.converters = {}
+        self.unicode_converter = None
         self.action_resolvers = ()
+        self.inline_converters = {}
+        self.decoders = {}
+        # converters and dbf2date, which decoders were made with
+        self.decoders_state = None
+        self.value_caches = {}
+        self.row_classes = {}
+        self.indexes = {}
+        self.tags = {}           # tags of opened native indexes
+        self.native_indexes = []
 
         self.iterator = None
 
@@ -123,18 +380,91 @@ class YDbfReader(object):
             return (val.strip() or 0) and int(val.strip())
         
         def dbf2py_decimal(val, size, dec):
-            return Decimal(('%%.%df'%dec) % float(val.strip() or 0.0))
+            return lib.dbf2decimal(val, dec)
+
+        def dbf2py_float(val, size, dec):
+            return float(val.strip() or 0)
+
+        def dbf2py_scaled(val, size, dec):
+            return lib.dbf2scaled(val, dec)
+
+        def dbf2py_raw(val, size, dec):
+            return val
+
+        def dbf2py_memo(val, size, dec):
+            if isinstance(val, basestring):
+                block = int(val.strip(' \x00') or 0)
+            else:
+                block = val
+            if not block:
+                return None
+            if self.lazy_memo:
+                return MemoHandle(self._getMemoFile(), block)
+            return self._getMemoFile().read(block)
+
+        def dbf2py_binary(val, size, dec):
+            # already unpacked by struct
+            return val
+
+        def dbf2py_currency(val, size, dec):
+            return Decimal(val) / 10000
+
+        def dbf2py_currency_float(val, size, dec):
+            return val / 10000.0
 
+        def dbf2py_datetime(val, size, dec):
+            return lib.dbf2datetime(val)
+
+        # converter which may be replaced by decoding of whole record
+        self.unicode_converter = dbf2py_unicode
+        numeric_converters = {
+            'decimal': dbf2py_decimal,
+            'float': dbf2py_float,
+            'int': dbf2py_scaled,
+        }
+        currency_converters = {
+            'decimal': dbf2py_currency,
+            'float': dbf2py_currency_float,
+            'int': dbf2py_binary,
+            'raw': dbf2py_binary,
+        }
         self.action_resolvers = (
             lambda typ, size, dec: (typ == 'C' and self.encoding) and \
                                     dbf2py_unicode,
             lambda typ, size, dec: (typ == 'C' and not self.encoding) and \
                                     dbf2py_string,
-            lambda typ, size, dec: (typ == 'N' and dec) and dbf2py_decimal,
-            lambda typ, size, dec: (typ == 'N' and not dec) and dbf2py_integer,
+            lambda typ, size, dec: (typ in 'NF' and
+                                    self.numeric == 'raw') and dbf2py_raw,
+            lambda typ, size, dec: (typ in 'NF' and not dec) and \
+                                    dbf2py_integer,
+            lambda typ, size, dec: typ in 'NF' and numeric_converters[
+                                    self.numeric],
             lambda typ, size, dec: typ == 'D' and dbf2py_date,
             lambda typ, size, dec: typ == 'L' and dbf2py_logic,
+            lambda typ, size, dec: typ == 'M' and dbf2py_memo,
+            lambda typ, size, dec: typ in 'IB0' and dbf2py_binary,
+            lambda typ, size, dec: typ == 'Y' and currency_converters[
+                                    self.numeric],
+            lambda typ, size, dec: typ == 'T' and dbf2py_datetime,
         )
+        # python expressions used by compiled decoder instead of call
+        # of builtin converter, %(val)s is substituted by raw value,
+        # %(dec)d -- by number of decimals of field
+        self.inline_converters = {
+            dbf2py_date: 'dbf2date(%(val)s)',
+            dbf2py_logic: '%(val)s.strip() in LOGIC_TRUE',
+            dbf2py_unicode: '%(val)s.decode(%(encoding)r).rstrip()',
+            dbf2py_string: '%(val)s.rstrip()',
+            dbf2py_integer: 'int(%(val)s.strip() or 0)',
+            dbf2py_binary: '%(val)s',
+            dbf2py_decimal: 'dbf2decimal(%(val)s, %(dec)d)',
+            dbf2py_float: 'float(%(val)s.strip() or 0)',
+            dbf2py_scaled: 'dbf2scaled(%(val)s, %(dec)d)',
+            dbf2py_raw: '%(val)s',
+            dbf2py_currency: 'Decimal(%(val)s) / 10000',
+            dbf2py_currency_float: '%(val)s / 10000.0',
+            dbf2py_datetime: 'dbf2datetime(%(val)s)',
+        }
         for name, typ, size, dec in self._fields:
             for resolver in self.action_resolvers:
                 action = resolver(typ, size, dec)
@@ -144,16 +474,475 @@ class YDbfReader(object):
             if not action:
                 raise ValueError("Cannot find dbf-to-python converter "
                                  "for field %s (type %s)" % (name, typ))
-                    
+        self.decoders = {}
+        self._makeValueCaches()
+
+    def _makeValueCaches(self):
+        """
+        Make value caches for fields defined by `value_cache` option
+        """
+        self.value_caches = {}
+        if not self.value_cache:
+            return
+        if self.value_cache == 'auto':
+            names = [name for name, typ, size, dec in self.fields
+                     if typ in VALUE_CACHE_TYPES]
+        else:
+            names = list(self.value_cache)
+            unknown = set(names) - set(self.field_names)
+            if unknown:
+                raise ValueError("Unknown fields in value_cache: %s"
+                                 % ', '.join(sorted(unknown)))
+        def on_disable(cache):
+            # rebuild decoders without disabled cache
+            self.decoders.clear()
+        for name in names:
+            self.value_caches[name] = ValueCache(
+                name, adaptive=(self.value_cache == 'auto'),
+                on_disable=on_disable)
+
+    def cacheStats(self):
+        """
+        Get statistics of value caches: dict name of field ->
+        dict with keys 'hits', 'misses', 'size' (number of cached
+        values) and 'enabled'
+        """
+        return dict((name, {'hits': cache.hits, 'misses': cache.misses,
+                            'size': len(cache.values),
+                            'enabled': cache.enabled})
+                    for name, cache in self.value_caches.items())
+
+    def _checkDecoders(self):
+        """
+        Drop compiled decoders if `converters` or `dbf2date` were
+        changed since decoders were made
+        """
+        state = self.decoders_state
+        if state is None or state[0] is not self.dbf2date or \
+               state[1] != self.converters:
+            self.decoders.clear()
+            # cached values were converted by old converters
+            for cache in self.value_caches.values():
+                cache.values.clear()
+                cache.convert = None
+            self.decoders_state = (self.dbf2date, dict(self.converters))
+
+    @property
+    def decoder(self):
+        """
+        Compiled decoder of live records with all fields
+        """
+        return self._getDecoder(show_deleted=False)
+
+    def _getDecoder(self, show_deleted, fields=None):
+        """
+        Get compiled record decoder, build it if it not exists yet
+        
+        Decoder is a function (block, offset) -> record, where `block`
+        is a data buffer (str, mmap or bytearray) and `offset` is
+        a position of the record in `block`.
+        """
+        if fields is not None:
+            fields = tuple(fields)
+        key = (show_deleted, fields, self.row_type)
+        self._checkDecoders()
+        if key not in self.decoders:
+            self.decoders[key] = self._makeDecoder(show_deleted, fields)
+        return self.decoders[key]
+
+    def _getLazyDecoder(self, show_deleted, fields=None):
+        """
+        Get function (block, offset) -> `LazyRecord`, build it
+        if it not exists yet
+        """
+        if fields is not None:
+            fields = tuple(fields)
+        key = ('lazy', show_deleted, fields)
+        self._checkDecoders()
+        if key not in self.decoders:
+            self.decoders[key] = self._makeLazyDecoder(show_deleted, fields)
+        return self.decoders[key]
+
+    def _makeLazyDecoder(self, show_deleted, fields=None):
+        """
+        Build function which makes `LazyRecord` from bytes of record,
+        with compiled getters of field values
+        """
+        names = tuple(self._decodedNames(show_deleted, fields))
+        namespace = self._decoderNamespace()
+        namespace['unpack_from'] = unpack_from
+        getters = {}
+        for name, typ, size, dec in self._fields:
+            if name not in names:
+                continue
+            start = self.field_offsets[name]
+            if typ in lib.BINARY_FORMATS or (typ == 'M' and size == 4):
+                raw = "    v = unpack_from(%r, rec, %d)[0]\n" % (
+                    '<' + lib.BINARY_FORMATS.get(typ, 'i'), start)
+            elif typ == '0':
+                raw = "    v = rec[%d:%d]\n" % (start, start + size)
+            else:
+                raw = ("    v = rec[%d:%d]\n"
+                       "    if '\\x00' in v:\n"
+                       "        v = v.split('\\x00', 1)[0]\n"
+                       % (start, start + size))
+            getters[name] = lib.compile_function(
+                'get', "def get(rec):\n%s    return %s\n"
+                % (raw, self._fieldExpr(name, 'v', namespace)),
+                dict(namespace))
+        layout = (names, getters)
+        recsize = self.recsize
+        def decode(block, offset):
+            # str() makes bytes of bytearray, str is left as is
+            return LazyRecord(str(block[offset:offset + recsize]), layout)
+        return decode
+
+    def _getRowClass(self, names):
+        """
+        Get class of records for given field names (for row types
+        'namedtuple' and 'slots'), build it if it not exists yet
+        """
+        key = (tuple(names), self.row_type)
+        if key not in self.row_classes:
+            if self.row_type == 'namedtuple':
+                # rename=True because _deletion_flag is not allowed
+                # as namedtuple's field name
+                row_class = namedtuple('Record', names, rename=True)
+            else:
+                row_class = _makeSlotsClass(names)
+            self.row_classes[key] = row_class
+        return self.row_classes[key]
+
+    def _makeDecoder(self, show_deleted, fields=None):
+        """
+        Build record decoder for current fields structure
+        
+        All per-field dispatching is resolved here once, so decoder
+        unpacks record and converts values without any checks. Values
+        are cutted by NULL symbol (some software terminates values by
+        NULL) only if record contains NULL. Binary values (Visual FoxPro
+        types I, B, Y, T) are unpacked by native struct codes, text
+        values of such records are always cutted.
+        
+        If encoding is single-byte, unicode 'C' fields of record are
+        decoded by single call and sliced from result (see
+        `_makeWholeDecoder`). Values of fields with enabled value cache
+        (see `ValueCache`) are taken from cache by raw bytes.
+        
+        If `fields` (sequence of names) is defined, only these fields
+        are unpacked and converted, bytes of other fields are skipped.
+        Values of non-dict records follow order of `fields`.
+        """
+        names = self._decodedNames(show_deleted, fields)
+        recfmt = ['<']
+        namespace = self._decoderNamespace()
+        exprs = {}
+        vals = {}
+        # values cutted by NULL symbol (text values only)
+        cut = []
+        has_binary = False
+        for name, typ, size, dec in self._fields:
+            if name not in names:
+                recfmt.append('%dx' % size)
+                continue
+            i = len(exprs)
+            if typ in lib.BINARY_FORMATS or (typ == 'M' and size == 4):
+                # VFP memo field holds block number as int32
+                recfmt.append(lib.BINARY_FORMATS.get(typ, 'i'))
+                cut.append('v[%d]' % i)
+                has_binary = True
+            elif typ == '0':
+                # VFP null flags
+                recfmt.append('%ds' % size)
+                cut.append('v[%d]' % i)
+                has_binary = True
+            else:
+                recfmt.append('%ds' % size)
+                cut.append("v[%d].split('\\x00', 1)[0]" % i)
+            vals[name] = 'v[%d]' % i
+            exprs[name] = self._fieldExpr(name, vals[name], namespace)
+        cached = self._cachedValues(exprs, vals, namespace)
+        namespace['unpack_from'] = Struct(''.join(recfmt)).unpack_from
+        if has_binary:
+            # binary values almost always contain NULL, so cut text
+            # values always
+            cut_values = "    v = (%s)\n" % ''.join('%s, ' % c for c in cut)
+        else:
+            cut_values = (
+                "    if block.find('\\x00', offset, offset + %d) >= 0:\n"
+                "        v = [x.split('\\x00', 1)[0] for x in v]\n"
+                % self.recsize)
+        source = (
+            "def decode(block, offset):\n"
+            "    v = unpack_from(block, offset)\n"
+            "%(cut)s"
+            "%(cached)s"
+            "    return %(row)s\n"
+            % {'cut': cut_values, 'cached': cached,
+               'row': self._rowExpr(names, exprs, namespace)})
+        decode = lib.compile_function('decode', source, namespace)
+        if not has_binary and self.encoding and \
+               lib.is_single_byte(self.encoding):
+            whole_decode = self._makeWholeDecoder(names, decode)
+            if whole_decode is not None:
+                return whole_decode
+        return decode
+
+    def _makeWholeDecoder(self, names, decode_fields):
+        """
+        Build record decoder which decodes unicode 'C' fields of record
+        by single call (for single-byte encodings only, where offsets
+        in bytes are equal to offsets in chars)
+        
+        Bytes from first to last unicode field are decoded at once,
+        values are sliced from decoded string. Records with NULL symbol
+        or with non-decodable bytes are passed to `decode_fields`
+        (per-field decoder), so results and errors are the same.
+        
+        Returns None if record has less than two unicode fields
+        (fields with enabled value cache are not counted).
+        """
+        text_fields = [(name, self.field_offsets[name], size)
+                       for name, typ, size, dec in self._fields
+                       if name in names and
+                          self.converters[name] is self.unicode_converter
+                          and not self._isCached(name)]
+        if len(text_fields) < 2:
+            return None
+        start = text_fields[0][1]
+        stop = text_fields[-1][1] + text_fields[-1][2]
+        namespace = self._decoderNamespace()
+        namespace['decode_fields'] = decode_fields
+        exprs = {}
+        vals = {}
+        for name, offset, size in text_fields:
+            exprs[name] = 'u[%d:%d].rstrip()' % (offset - start,
+                                                  offset - start + size)
+        recfmt = ['<']
+        i = 0
+        for name, typ, size, dec in self._fields:
+            if name not in names or name in exprs:
+                recfmt.append('%dx' % size)
+                continue
+            recfmt.append('%ds' % size)
+            vals[name] = 'v[%d]' % i
+            exprs[name] = self._fieldExpr(name, vals[name], namespace)
+            i += 1
+        cached = self._cachedValues(exprs, vals, namespace)
+        namespace['unpack_from'] = Struct(''.join(recfmt)).unpack_from
+        source = (
+            "def decode(block, offset):\n"
+            "    if block.find('\\x00', offset, offset + %(recsize)d) "
+            ">= 0:\n"
+            "        return decode_fields(block, offset)\n"
+            "    try:\n"
+            "        u = block[offset + %(start)d:offset + %(stop)d]"
+            ".decode(%(encoding)r)\n"
+            "    except UnicodeDecodeError:\n"
+            "        return decode_fields(block, offset)\n"
+            "    v = unpack_from(block, offset)\n"
+            "%(cached)s"
+            "    return %(row)s\n"
+            % {'recsize': self.recsize, 'start': start, 'stop': stop,
+               'encoding': self.encoding,
+               'cached': cached,
+               'row': self._rowExpr(names, exprs, namespace)})
+        return lib.compile_function('decode', source, namespace)
+
+    def _decodedNames(self, show_deleted, fields):
+        """
+        Get names of fields which are decoded (in order of record)
+        """
+        if fields is None:
+            names = [name for name, typ, size, dec in self._fields]
+        else:
+            unknown = set(fields) - set(self.field_names)
+            if unknown:
+                raise ValueError("Unknown fields: %s"
+                                 % ', '.join(sorted(unknown)))
+            names = ['_deletion_flag'] + list(fields)
+        if not show_deleted:
+            names.remove('_deletion_flag')
+        return names
+
+    def _decoderNamespace(self):
+        return {
+            'dbf2date': self.dbf2date,
+            'dbf2datetime': lib.dbf2datetime,
+            'dbf2decimal': lib.dbf2decimal,
+            'dbf2scaled': lib.dbf2scaled,
+            'Decimal': Decimal,
+            'LOGIC_TRUE': frozenset(("Y", "y", "T", "t")),
+        }
+
+    def _fieldExpr(self, name, val, namespace):
+        """
+        Get python expression which converts raw value `val` of field,
+        add objects used by expression to `namespace`
+        """
+        size, dec = self.field_sizes[name]
+        conv = self.converters[name]
+        if conv in self.inline_converters:
+            return self.inline_converters[conv] % {
+                'val': val, 'encoding': self.encoding, 'dec': dec}
+        namespace['conv_%s' % name] = conv
+        return 'conv_%s(%s, %d, %d)' % (name, val, size, dec)
+
+    def _isCached(self, name):
+        return name in self.value_caches and self.value_caches[name].enabled
+
+    def _cachedValues(self, exprs, vals, namespace):
+        """
+        Get statements which take values of fields with enabled value
+        cache from cache by raw value, replace expressions of such
+        fields in `exprs` by names of local variables
+        
+        Args:
+            `exprs`:
+                dict name of field -> expression of value
+            `vals`:
+                dict name of field -> expression of raw value
+            `namespace`:
+                namespace of decoder
+        """
+        lines = []
+        for name, val in sorted(vals.items()):
+            if not self._isCached(name):
+                continue
+            cache = self.value_caches[name]
+            if cache.convert is None:
+                cache.convert = lib.compile_function(
+                    'convert', 'def convert(val):\n    return %s\n'
+                    % self._fieldExpr(name, 'val', namespace),
+                    dict(namespace))
+            namespace['cache_%s' % name] = cache.values
+            namespace['hits_%s' % name] = cache.hits_counter
+            namespace['miss_%s' % name] = cache.miss
+            lines.append(
+                "    try:\n"
+                "        x_%(name)s = cache_%(name)s[%(val)s]\n"
+                "        hits_%(name)s[0] += 1\n"
+                "    except KeyError:\n"
+                "        x_%(name)s = miss_%(name)s(%(val)s)\n"
+                % {'name': name, 'val': val})
+            exprs[name] = 'x_%s' % name
+        return ''.join(lines)
+
+    def _rowExpr(self, names, exprs, namespace):
+        """
+        Get python expression which makes record from values
+        """
+        if self.row_type == 'dict':
+            return '{%s}' % ', '.join('%r: %s' % (name, exprs[name])
+                                      for name in names)
+        row = '(%s)' % ''.join('%s, ' % exprs[name] for name in names)
+        if self.row_type != 'tuple':
+            namespace['Record'] = self._getRowClass(names)
+            row = 'Record' + row
+        return row
+
+    def _makeMatcher(self, where):
+        """
+        Build function which checks raw record against conditions
+        
+        Matcher is a function (block, offset) -> bool, it doesn't decode
+        record: 'C', 'D' and 'L' values are compared with raw bytes of
+        record, 'N' values are compared with parsed number of this
+        field only.
+        
+        Args:
+            `where`:
+                sequence of conditions (NAME, OP, VALUE), where OP is
+                one of '==', '!=', '<', '<=', '>', '>=', 'startswith'
+                ('C' fields only). All conditions should be true.
+        """
+        namespace = {}
+        checks = []
+        types = dict((name, (typ, size, dec))
+                     for name, typ, size, dec in self.fields)
+        for i, (name, op, value) in enumerate(where):
+            if name not in types:
+                raise ValueError("Unknown field %s in condition" % name)
+            if op not in WHERE_OPS:
+                raise ValueError("Unknown operator %r in condition, should "
+                                 "be one of: %s" % (op, ', '.join(WHERE_OPS)))
+            typ, size, dec = types[name]
+            if typ in ('M', 'T', '0'):
+                raise ValueError("Conditions on field %s of type %s are "
+                                 "not supported" % (name, typ))
+            start = self.field_offsets[name]
+            raw = 'block[offset + %d:offset + %d]' % (start, start + size)
+            if op == 'startswith' and typ != 'C':
+                raise ValueError("Operator startswith is available for "
+                                 "'C' fields only, but field %s has type %s"
+                                 % (name, typ))
+            if typ in lib.BINARY_FORMATS:
+                if typ == 'Y':
+                    value = int(Decimal(str(value)) * 10000)
+                namespace['unpack_from'] = unpack_from
+                namespace['V%d' % i] = value
+                checks.append("unpack_from(%r, block, offset + %d)[0] %s V%d"
+                              % ('<' + lib.BINARY_FORMATS[typ], start, op, i))
+                continue
+            if typ in ('N', 'F'):
+                # number layout in file differs from software to software,
+                # so parse this field (only) instead of raw comparison
+                if dec:
+                    namespace['V%d' % i] = float(value)
+                    checks.append("float(%s.strip(' \\x00') or 0) %s V%d"
+                                  % (raw, op, i))
+                else:
+                    namespace['V%d' % i] = int(value)
+                    checks.append("int(%s.strip(' \\x00') or 0) %s V%d"
+                                  % (raw, op, i))
+                continue
+            if typ == 'L':
+                if op not in ('==', '!='):
+                    raise ValueError("Only == and != operators are "
+                                     "available for 'L' field %s" % name)
+                # the same as dbf2py_logic
+                negate = (op == '!=') != (not value)
+                checks.append("(block[offset + %d] %sin LOGIC_TRUE)"
+                              % (start, negate and 'not ' or ''))
+                # items of bytearray are integers
+                namespace['LOGIC_TRUE'] = frozenset("YyTt") | \
+                                          frozenset(map(ord, "YyTt"))
+                continue
+            if typ == 'D':
+                value = (value and lib.date2dbf(value)) or ' '*size
+            elif isinstance(value, unicode):
+                value = value.encode(self.encoding or 'ascii')
+            if len(value) > size and op in ('startswith', '==', '!='):
+                # value doesn't fit into field, so field never
+                # equals to value and never starts with it
+                checks.append(str(op == '!='))
+            elif op == 'startswith':
+                namespace['V%d' % i] = value
+                checks.append("block.find(V%d, offset + %d, offset + %d) "
+                              "== offset + %d" % (i, start,
+                                                  start + len(value), start))
+            elif op in ('==', '!='):
+                namespace['V%d' % i] = value.ljust(size)
+                checks.append("(block.find(V%d, offset + %d, offset + %d) "
+                              "%s offset + %d)" % (i, start, start + size,
+                                                   op, start))
+            else:
+                # longer value is not truncated, so it is compared
+                # as a whole
+                namespace['V%d' % i] = value.ljust(size)
+                checks.append("%s %s V%d" % (raw, op, i))
+        source = ("def match(block, offset):\n"
+                  "    return %s\n" % (' and '.join(checks) or 'True'))
+        return lib.compile_function('match', source, namespace)
+
     def _readHeader(self):
         """
         Read DBF header
         """
         self.fh.seek(0)
 
-        sig, year, month, day, numrec, lenheader, recsize, lang = unpack(
-            lib.HEADER_FORMAT,
-            self.fh.read(32))
+        (sig, year, month, day, numrec, lenheader, recsize, mdx_flag,
+         lang) = unpack(lib.HEADER_FORMAT, self.fh.read(32))
         year = year + 1900
         # some software use 0x08 as 2008 instead of 0x6c
         if year < 1950:
@@ -165,15 +954,26 @@ class YDbfReader(object):
             raise ValueError("DBF version '%s' (signature %s) not supported"
                              % (version, hex(sig)))
         
-        numfields = (lenheader - 33) // 32
+        if sig in lib.VFP_SIGNATURES:
+            numfields = (lenheader - 33 - lib.VFP_BACKLINK_SIZE) // 32
+        else:
+            numfields = (lenheader - 33) // 32
         fields = []
+        indexed_fields = []
         for fieldno in xrange(numfields):
-            name, typ, size, deci = unpack(lib.FIELD_DESCRIPTION_FORMAT,
-                                                  self.fh.read(32))
+            name, typ, size, deci, indexed = unpack(
+                lib.FIELD_DESCRIPTION_FORMAT, self.fh.read(32))
             name = name.split('\0', 1)[0]       # NULL is a end of string
-            if typ not in ('N', 'D', 'L', 'C'):
+            if typ not in FIELD_TYPES:
                 raise ValueError("Unknown type %r on field %s" % (typ, name))
+            if typ in lib.BINARY_FORMATS and \
+                   size != calcsize('<' + lib.BINARY_FORMATS[typ]):
+                raise ValueError("Size of field %s of type %s should be %d, "
+                                 "but it is %d" % (name, typ, calcsize(
+                                     '<' + lib.BINARY_FORMATS[typ]), size))
             fields.append((name, typ, size, deci))
+            if indexed:
+                indexed_fields.append(name)
 
         terminator = self.fh.read(1)
         if terminator != '\x0d':
@@ -190,13 +990,25 @@ class YDbfReader(object):
             self.fields = self.builtin_fields
             self._fields = self.builtin__fields	
         self.raw_lang = lang
+        # size of record by header (recsize is calculated by fields)
+        self.raw_recsize = recsize
+        self.mdx_flag = mdx_flag
+        self.indexed_fields = indexed_fields
         self.recfmt = ''.join(['%ds' % fld[2] for fld in self._fields])
-        self.recsize = calcsize(self.recfmt)
+        self.rec_struct = Struct(self.recfmt)
+        self.recsize = self.rec_struct.size
         self.numrec = numrec
         self.lenheader = lenheader
         self.numfields = numfields
         self.stop_at = numrec
         self.field_names = [fld[0] for fld in self.fields]
+        self.field_offsets = {}
+        self.field_sizes = {}
+        offset = 0
+        for name, typ, size, dec in self._fields:
+            self.field_offsets[name] = offset
+            self.field_sizes[name] = size, dec
+            offset += size
 
     def _defineEncoding(self):
         self.builtin_encoding = lib.ENCODINGS.get(self.raw_lang, (None,))[0]
@@ -229,7 +1041,33 @@ class YDbfReader(object):
         """
         return self.numrec
     
-    def records(self, start_from=None, limit=None, show_deleted=False):
+    def _readBlocks(self, start, stop, recs_per_block=None):
+        """
+        Read records from `start` till `stop` (not include) by blocks
+        of `recs_per_block` records (by default, as many as fit into
+        `block_size`)
+
+        Yields tuples (index of first record in block, number of records
+        in block, block data, offset of first record in block)
+        """
+        if recs_per_block is None:
+            recs_per_block = max(1, self.block_size // self.recsize)
+        for first in xrange(start, stop, recs_per_block):
+            count = min(recs_per_block, stop - first)
+            # file may be read by somebody else between blocks
+            # (e.g. getMany while iterating), so check position
+            offset = self.lenheader + self.recsize*first
+            if self.fh.tell() != offset:
+                self.fh.seek(offset)
+            block = self.fh.read(count*self.recsize)
+            if len(block) != count*self.recsize:
+                raise RuntimeError("Unexpected end of file while reading "
+                                   "rec #%d" % (first + len(block) //
+                                                self.recsize))
+            yield first, count, block, 0
+
+    def records(self, start_from=None, limit=None, show_deleted=False,
+                fields=None, where=None, lazy=False):
         """
         Iterate over DBF records
         
@@ -241,48 +1079,449 @@ class YDbfReader(object):
             `show_deleted`:
                 do not skip deleted records (optional)
                 False by default
+            `fields`:
+                names of fields to read (optional), other fields
+                are skipped without decoding. All fields by default.
+                Values of tuple-like records are in order of `fields`.
+            `where`:
+                conditions on fields (optional), sequence of
+                (NAME, OP, VALUE), where OP is one of '==', '!=', '<',
+                '<=', '>', '>=' or 'startswith' (for 'C' fields).
+                Records are checked before decoding, only records
+                which match all conditions are decoded. For example,
+                [('ID', '>=', 100), ('NAME', 'startswith', u'A')]
+            `lazy`:
+                yield `LazyRecord` mappings instead of records, fields
+                are converted on access only (option `row_type` is
+                ignored). False by default.
         """
         
         if start_from is not None:
             self.start_from = start_from
-        offset = self.lenheader + self.recsize*self.start_from
-        if self.fh.tell() != offset:
-            self.fh.seek(offset)
-        
         if limit is not None:
             self.stop_at = self.start_from + limit
 
-        converters = tuple((self.converters[name], name, size, dec)
-                           for name, typ, size, dec in self._fields)
-        for i in xrange(self.start_from, self.stop_at):
-            record = unpack(self.recfmt, self.fh.read(self.recsize))
-            if not show_deleted and record[0] != ' ':
-                # deleted record
-                continue
+        decode_block = self._blockDecoder(show_deleted, fields, where, lazy)
+        for first, count, block, offset in self._readBlocks(self.start_from,
+                                                            self.stop_at):
+            for rec in decode_block(first, count, block, offset):
+                yield rec
+
+    def _blockDecoder(self, show_deleted=False, fields=None, where=None,
+                      lazy=False):
+        """
+        Make decoder of blocks yielded by `_readBlocks`: generator
+        function of (first, count, block, offset), which yields
+        decoded records of block (options are the same as
+        for `records`)
+        """
+        get_decoder = (lazy and self._getLazyDecoder) or self._getDecoder
+        get_decoder(show_deleted, fields)
+        match = None
+        if where:
+            match = self._makeMatcher(where)
+        recsize = self.recsize
+
+        def decode_block(first, count, block, offset):
+            # decoder is rebuilt if some value cache was disabled
+            decode = get_decoder(show_deleted, fields)
+            if show_deleted:
+                positions = xrange(count)
+            else:
+                positions = self._iterLive(block, offset, count)
+            for j in positions:
+                rec_offset = offset + j*recsize
+                try:
+                    if match is not None and not match(block, rec_offset):
+                        continue
+                    yield decode(block, rec_offset)
+                except (UnicodeDecodeError, IndexError, ValueError,
+                        TypeError, KeyError), err:
+                    raise self._readError(err, first + j)
+        return decode_block
+
+    def _flags(self, block, offset, count):
+        """
+        Get deletion flags of `count` records in block (as string, one
+        byte per record), only flag bytes are sliced, records themselves
+        are not touched
+        """
+        return block[offset:offset + count*self.recsize:self.recsize]
+
+    def _iterLive(self, block, offset, count):
+        """
+        Iterate over positions (in block) of live (not deleted) records
+        """
+        flags = self._flags(block, offset, count)
+        pos = flags.find(' ')
+        while pos >= 0:
+            yield pos
+            pos = flags.find(' ', pos + 1)
+
+    def countLive(self):
+        """
+        Count live (not deleted) records, only deletion flags are checked
+        """
+        live = 0
+        for first, count, block, offset in self._readBlocks(0, self.numrec):
+            live += self._flags(block, offset, count).count(' ')
+        return live
+
+    def deletedRatio(self):
+        """
+        Get ratio of deleted records to all records (0.0 for empty DBF)
+        """
+        if not self.numrec:
+            return 0.0
+        return float(self.numrec - self.countLive()) / self.numrec
+
+    def _readError(self, err, i):
+        """
+        Make informative exception from error `err` occured
+        while reading rec #`i`
+        """
+        if isinstance(err, UnicodeDecodeError):
+            args = list(err.args[:-1]) + [
+                "Error occured while reading rec #%d. You are "
+                "using YDbfReader with unicode-related options: "
+                "actual encoding %s, builtin DBF encoding %s (raw "
+                "lang code %s), manually set encoding is %s. "
+                "Probably, data in DBF file is not encoded with %s "
+                "encoding, so you should manually define encoding "
+                "by setting up `encoding` option"
+                % (i, self.encoding, self.builtin_encoding,
+                   hex(self.raw_lang), self.implicit_encoding,
+                   self.encoding)]
+            return UnicodeDecodeError(*args)
+        return RuntimeError("Error occured (%s: %s) while reading "
+                            "rec #%d" % (err.__class__.__name__, err, i))
+
+    def getMany(self, indices, show_deleted=True, fields=None):
+        """
+        Get records by their indices
+        
+        Only requested records are read and decoded, nearby records
+        are read by single block. Reader's iteration state
+        (`start_from`, `stop_at`) is not changed.
+        
+        Args:
+            `indices`:
+                sequence of indices of records, negative
+                index counts from the end
+            `show_deleted`:
+                return deleted records with _deletion_flag (as
+                `records(show_deleted=True)` does), True by default.
+                If False, None is returned for deleted records.
+            `fields`:
+                names of fields to read (optional), all by default
+        
+        Returns list of records in order of `indices`.
+        """
+        indices = list(indices)
+        for pos, i in enumerate(indices):
+            if i < 0:
+                i += self.numrec
+            if not 0 <= i < self.numrec:
+                raise IndexError("Record index %d out of range"
+                                 % indices[pos])
+            indices[pos] = i
+        decode = self._getDecoder(show_deleted, fields)
+        recsize = self.recsize
+        recs_per_block = max(1, self.block_size // recsize)
+        # group sorted indices to spans which fit into single block
+        spans = []
+        for i in sorted(set(indices)):
+            if spans and i - spans[-1][0] < recs_per_block:
+                spans[-1].append(i)
+            else:
+                spans.append([i])
+        records = {}
+        for span in spans:
+            span_size = span[-1] + 1 - span[0]
+            for first, count, block, offset in self._readBlocks(
+                    span[0], span[0] + span_size, span_size):
+                # items of bytearray are integers
+                live = (isinstance(block, bytearray) and 0x20) or ' '
+                for i in span:
+                    rec_offset = offset + (i - first)*recsize
+                    if not show_deleted and block[rec_offset] != live:
+                        records[i] = None
+                        continue
+                    try:
+                        records[i] = decode(block, rec_offset)
+                    except (UnicodeDecodeError, IndexError, ValueError,
+                            TypeError, KeyError), err:
+                        raise self._readError(err, i)
+        return [records[i] for i in indices]
+
+    def __getitem__(self, key):
+        """
+        Get record (or list of records for slice) by index,
+        deleted records are returned with _deletion_flag
+        """
+        if isinstance(key, slice):
+            return self.getMany(xrange(*key.indices(self.numrec)))
+        return self.getMany([key])[0]
+
+    def iterColumnBatches(self, batch_size=None, fields=None,
+                          show_deleted=False, scaled=False):
+        """
+        Iterate over DBF data by batches of columns, NumPy is required
+        
+        Each batch is a dict, where keys are names of fields and values
+        are NumPy arrays (see `ydbf.columns` for types of arrays).
+        Batches are decoded by vectorized operations over whole block
+        of records.
+        
+        Args:
+            `batch_size`:
+                number of records (including deleted ones) in each
+                batch (optional), by default as many as fit into
+                `block_size`
+            `fields`:
+                names of fields to read (optional), all by default
+            `show_deleted`:
+                do not skip deleted records (optional), then
+                _deletion_flag column is included. False by default
+            `scaled`:
+                convert 'N' fields with decimals to int64 scaled by
+                10**DEC instead of float64 (optional), False by default
+        """
+        from ydbf import columns
+        if fields is None:
+            names = list(self.field_names)
+        else:
+            unknown = set(fields) - set(self.field_names)
+            if unknown:
+                raise ValueError("Unknown fields: %s"
+                                 % ', '.join(sorted(unknown)))
+            names = list(fields)
+        if show_deleted:
+            names.append('_deletion_flag')
+        dtype = columns.make_dtype(self._fields)
+        for first, count, block, offset in self._readBlocks(0, self.numrec,
+                                                            batch_size):
+            records = columns.numpy.frombuffer(block, dtype, count, offset)
+            if not show_deleted:
+                records = records[records['_deletion_flag'] == ' ']
             try:
-                yield dict((name, conv(val.split('\x00', 1)[0], size, dec))
-                            for (conv, name, size, dec), val
-                            in izip(converters, record)
-                            if (name != '_deletion_flag' or show_deleted))
-            except UnicodeDecodeError, err:
-                args = list(err.args[:-1]) + [
-                    "Error occured while reading rec #%d. You are "
-                    "using YDbfReader with unicode-related options: "
-                    "actual encoding %s, builtin DBF encoding %s (raw lang "
-                    "code %s), manually set encoding is %s. Probably, data "
-                    "in DBF file is not encoded with %s encoding, so you "
-                    "should manually define encoding by setting up `encoding` "
-                    "option" % (i, self.encoding, self.builtin_encoding,
-                    hex(self.raw_lang), self.implicit_encoding, self.encoding)]
-                raise UnicodeDecodeError(*args)
+                yield columns.decode_columns(records, self._fields, names,
+                                             first, self.encoding, scaled)
+            except UnicodeDecodeError:
+                # it is ValueError too, but informative enough itself
+                raise
             except (IndexError, ValueError, TypeError, KeyError), err:
-                raise RuntimeError("Error occured (%s: %s) while reading rec "
-                                   "#%d" % (err.__class__.__name__, err, i))
+                raise RuntimeError("Error occured (%s: %s) while reading "
+                                   "recs #%d-%d" % (err.__class__.__name__,
+                                                    err, first,
+                                                    first + count - 1))
+
+    def readColumns(self, fields=None, show_deleted=False, scaled=False):
+        """
+        Read whole DBF data as columns, NumPy is required
+        
+        Returns dict, where keys are names of fields and values are
+        NumPy arrays. Args are the same as for `iterColumnBatches`.
+        """
+        from ydbf import columns
+        batches = list(self.iterColumnBatches(fields=fields,
+                                              show_deleted=show_deleted,
+                                              scaled=scaled))
+        if not batches:
+            # no records, but arrays should be properly typed
+            records = columns.numpy.zeros(0, columns.make_dtype(self._fields))
+            names = list(fields or self.field_names)
+            if show_deleted:
+                names.append('_deletion_flag')
+            return columns.decode_columns(records, self._fields, names,
+                                          0, self.encoding, scaled)
+        return dict((name, columns.numpy.concatenate([batch[name]
+                                                      for batch in batches]))
+                    for name in batches[0])
 
     def read(self):
         return self.records()
     
+    def lookup(self, fields, values, rebuild=True):
+        """
+        Get records where fields are equal to values by sidecar index
+        
+        Sidecar index (see `ydbf.index`) is built on first lookup, and
+        rebuilt if DBF was changed since index building. If directory
+        of DBF is read-only, index is built in temporary directory. Records are
+        returned in order of index, deleted records are skipped.
+        
+        Args:
+            `fields`:
+                name of field, or names of several fields
+            `values`:
+                value of field, or values of several fields (values of
+                several leading fields are enough for lookup)
+            `rebuild`:
+                build index if it doesn't exist or it is stale (True by
+                default), otherwise raise ValueError
+        """
+        from ydbf import index
+        if isinstance(fields, basestring):
+            fields, values = (fields,), (values,)
+        fields = tuple(fields)
+        if fields not in self.indexes:
+            self.indexes[fields] = self._openLookupIndex(fields, rebuild)
+        key = index.make_key(self, fields, values)
+        if key is None:
+            return []
+        recnos = self.indexes[fields].find(key)
+        return [rec for rec in self.getMany(recnos, show_deleted=False)
+                if rec is not None]
+
+    def _openLookupIndex(self, fields, rebuild):
+        """
+        Open sidecar index on `fields` for `lookup`
+        """
+        from ydbf import index
+        return index.open_index(self, fields, rebuild)
+
+    def openIndex(self, path=None):
+        """
+        Open native index (.ndx, .mdx or .cdx), its tags are available
+        for `seekKey` and `scanRange` by names (in upper case).
+        
+        Args:
+            `path`:
+                file name of index, by default production index
+                (.mdx or .cdx with same name as DBF) is opened
+        
+        Returns list of names of opened tags.
+        """
+        from ydbf import index, nativeindex
+        if path is None:
+            base = os.path.splitext(index._dbf_path(self))[0]
+            for ext in ('.mdx', '.cdx', '.MDX', '.CDX'):
+                if os.path.isfile(base + ext):
+                    path = base + ext
+                    break
+            else:
+                raise ValueError("Production index for %s not found" % base)
+        field_types = dict((fld[0].upper(), fld[1]) for fld in self.fields)
+        native_index = nativeindex.open_native_index(path, field_types)
+        self.native_indexes.append(native_index)
+        self.tags.update(native_index.tags)
+        return sorted(native_index.tags)
+
+    def _getTag(self, tag):
+        if not self.tags and self.mdx_flag:
+            self.openIndex()
+        if tag.upper() not in self.tags:
+            raise ValueError("Unknown tag %s, opened tags are: %s"
+                             % (tag, ', '.join(sorted(self.tags))))
+        return self.tags[tag.upper()]
+
+    def _makeIndexKey(self, value):
+        from ydbf import nativeindex
+        if isinstance(value, datetime.date):
+            return nativeindex.julian_day(value)
+        if isinstance(value, unicode):
+            value = value.encode(self.encoding or 'ascii')
+        if isinstance(value, str):
+            return value.rstrip()
+        return value
+
+    def seekKey(self, tag, value):
+        """
+        Get records with key `value` by tag of native index
+        
+        Records are returned in order of index, deleted records
+        are skipped. Production index is opened if no index was
+        opened before and DBF is marked as having production index.
+        
+        Args:
+            `tag`:
+                name of tag
+            `value`:
+                value of key (str or unicode for character keys, number
+                for numeric keys, datetime.date for date keys)
+        """
+        tag = self._getTag(tag)
+        key = self._makeIndexKey(value)
+        recnos = []
+        for found, recno in tag.iterKeys(key):
+            if found != key:
+                break
+            recnos.append(recno)
+        return [rec for rec in self.getMany(recnos, show_deleted=False)
+                if rec is not None]
+
+    def scanRange(self, tag, low=None, high=None):
+        """
+        Iterate over records with keys from `low` to `high` (both
+        inclusive) in order of tag of native index, deleted records
+        are skipped.
+        
+        Args:
+            `tag`:
+                name of tag
+            `low`:
+                lower bound of key (from the first key if None)
+            `high`:
+                upper bound of key (to the last key if None)
+        """
+        tag = self._getTag(tag)
+        if low is not None:
+            low = self._makeIndexKey(low)
+        if high is not None:
+            high = self._makeIndexKey(high)
+        recnos = []
+        for key, recno in tag.iterKeys(low):
+            if high is not None and key > high:
+                break
+            recnos.append(recno)
+            if len(recnos) >= self.block_size // self.recsize + 1:
+                for rec in self.getMany(recnos, show_deleted=False):
+                    if rec is not None:
+                        yield rec
+                recnos = []
+        for rec in self.getMany(recnos, show_deleted=False):
+            if rec is not None:
+                yield rec
+
+    def _getMemoFile(self):
+        """
+        Get memo file, open it if it isn't opened yet
+        """
+        if self.memo_file is None:
+            source = self.memo_source
+            if source is None:
+                fh = getattr(self, 'source_fh', None) or self.fh
+                name = getattr(fh, 'name', None)
+                if isinstance(name, basestring):
+                    source = memo.memo_path(name, self.sig)
+                if source is None:
+                    raise ValueError("Memo file for DBF %s not found, "
+                                     "define it by `memo` argument" % name)
+            self.memo_file = memo.open_memo(source, self.sig, self.encoding)
+        return self.memo_file
+
+    def prefetchMemos(self, records):
+        """
+        Read memos of lazy memo fields of `records` into cache at once,
+        in order of memo file
+        """
+        blocks = []
+        for rec in records:
+            if isinstance(rec, dict):
+                rec = rec.values()
+            blocks.extend(value.block for value in rec
+                          if isinstance(value, MemoHandle))
+        if blocks:
+            self._getMemoFile().prefetch(blocks)
+
     def close(self):
+        if self.memo_file is not None:
+            self.memo_file.close()
+        for index in self.indexes.values():
+            index.close()
+        for native_index in self.native_indexes:
+            native_index.close()
         return self.fh.close()
 
     def __enter__(self):
@@ -291,6 +1530,91 @@ class YDbfReader(object):
     def __exit__(self, exc_type, exc_value, traceback):
         self.close()
 
+class YDbfMmapReader(YDbfReader):
+    """
+    DBF reader over memory-mapped file or in-memory data
+
+    Records are unpacked straight out of mapped data, file handler is
+    not seeked or read while iterating, so scanning the same file
+    several times is cheap.
+    """
+    def __init__(self, source, *args, **kwargs):
+        """
+        Iterator over memory-mapped DBF records
+
+        Args:
+            `source`:
+                filehandler (should be opened for binary reading) which
+                is mapped to memory, or DBF data itself (str or bytearray)
+
+        All other args are the same as for YDbfReader.
+        """
+        if isinstance(source, (str, bytearray)):
+            self.source_fh = None
+            self.data = source
+            # header length is 16-bit, so header never exceeds 64 KB
+            fh = StringIO(str(buffer(source, 0, 0x10000)))
+        else:
+            self.source_fh = source
+            self.data = mmap.mmap(source.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            fh = self.data
+        super(YDbfMmapReader, self).__init__(fh, *args, **kwargs)
+
+    def _readBlocks(self, start, stop, recs_per_block=None):
+        """
+        Slice records from `start` till `stop` (not include) by blocks
+        of `recs_per_block` records (by default, as many as fit into
+        `block_size`)
+
+        Yields tuples (index of first record in block, number of records
+        in block, mapped data, offset of first record in mapped data)
+        """
+        offset = self.lenheader + self.recsize*start
+        if offset + (stop - start)*self.recsize > len(self.data):
+            raise RuntimeError("Unexpected end of file while reading "
+                               "rec #%d" % ((len(self.data) - self.lenheader)
+                                            // self.recsize))
+        if recs_per_block is None:
+            recs_per_block = max(1, self.block_size // self.recsize)
+        for first in xrange(start, stop, recs_per_block):
+            count = min(recs_per_block, stop - first)
+            yield first, count, self.data, offset
+            offset += count*self.recsize
+
+    def close(self):
+        super(YDbfMmapReader, self).close()
+        if self.source_fh is not None:
+            return self.source_fh.close()
+
+class YDbfStreamReader(YDbfReader):
+    """
+    DBF reader over forward-only stream (pipe, socket, stdin)
+
+    Header and records are read in order and stream is never seeked
+    back, so records may be iterated only once and random access
+    (`getMany`, `lookup`, indexes) is not available. Data compressed
+    by gzip, bz2 or xz is decompressed on the fly.
+    """
+    def __init__(self, source, *args, **kwargs):
+        """
+        Iterator over DBF records from stream
+
+        Args:
+            `source`:
+                stream (file-like object with `read` method)
+            `compression`:
+                'auto' (default) -- detect compression of stream,
+                None -- stream is not compressed, or one of 'gzip',
+                'bz2', 'xz'
+
+        All other args are the same as for YDbfReader.
+        """
+        compression = kwargs.pop('compression', 'auto')
+        self.source_fh = source
+        fh = stream.StreamFile(source, compression)
+        super(YDbfStreamReader, self).__init__(fh, *args, **kwargs)
+
 class YDbfStrictReader(YDbfReader):
     """
     DBF-reader with additional logical checks
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# YDbf - Pythonic reader and writer for DBF/XBase files
+# Inspired by code of Raymond Hettinger
+# http://code.activestate.com/recipes/362715
+#
+# Copyright (C) 2006-2010 Yury Yurevich and contributors
+#
+# http://pyobject.ru/projects/ydbf/
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+"""
+Forward-only streams (pipes, sockets, stdin, compressed files)
+
+`StreamFile` wraps stream which can be read only: it counts read bytes
+for `tell`, and `seek` forward skips data (seek backward is an error).
+Data compressed by gzip, bz2 or xz (if lzma module is available) is
+decompressed on the fly, compression is detected by magic bytes.
+"""
+__all__ = ["StreamFile", "COMPRESSIONS"]
+
+import bz2
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# size (in bytes) of chunk read from source
+CHUNK_SIZE = 64*1024
+
+def _gzip_decompressor():
+    # 16 + MAX_WBITS -- gzip header and trailer
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+def _xz_decompressor():
+    if lzma is None:
+        raise ValueError("Can't decompress xz stream, have no lzma module")
+    return lzma.LZMADecompressor()
+
+# name: (magic bytes, decompressor factory)
+COMPRESSIONS = {
+    'gzip': ('\x1f\x8b', _gzip_decompressor),
+    'bz2': ('BZh', bz2.BZ2Decompressor),
+    'xz': ('\xfd7zXZ\x00', _xz_decompressor),
+}
+
+class StreamFile(object):
+    """
+    Forward-only file-like object over stream
+    """
+    def __init__(self, source, compression='auto', chunk_size=CHUNK_SIZE):
+        """
+        Create stream file
+        
+        Args:
+            `source`:
+                stream to read from, only `read` method is used
+            `compression`:
+                'auto' (default) -- detect compression by magic bytes,
+                None -- data is not compressed, or one of 'gzip',
+                'bz2', 'xz'
+            `chunk_size`:
+                size (in bytes) of chunk read from source
+        """
+        if compression is not None and compression != 'auto' and \
+               compression not in COMPRESSIONS:
+            raise ValueError("Wrong compression %s, should be one of: %s"
+                             % (compression, ', '.join(sorted(COMPRESSIONS))))
+        self.source = source
+        self.chunk_size = chunk_size
+        self.position = 0   # number of read (decompressed) bytes
+        self.eof = False
+        self.make_decompressor = None
+        self.decompressor = None
+        # raw data read from source for detection of compression
+        head = ''
+        if compression == 'auto':
+            head = self._readSource(max(len(magic) for magic, factory
+                                        in COMPRESSIONS.values()))
+            for name, (magic, factory) in COMPRESSIONS.items():
+                if head.startswith(magic):
+                    compression = name
+                    break
+        if compression in COMPRESSIONS:
+            self.make_decompressor = COMPRESSIONS[compression][1]
+            self.decompressor = self.make_decompressor()
+        self.compression = compression != 'auto' and compression or None
+        # decompressed data which is not read yet
+        self.buffer = head and self._decompress(head)
+
+    def _readSource(self, size):
+        """
+        Read up to `size` bytes from source (less only at end of stream)
+        """
+        chunks = []
+        while size > 0:
+            chunk = self.source.read(size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        return ''.join(chunks)
+
+    def _decompress(self, raw):
+        """
+        Decompress `raw` data, concatenated streams
+        (e.g. multi-member gzip) are supported
+        """
+        if self.decompressor is None:
+            return raw
+        chunks = []
+        while raw:
+            try:
+                chunks.append(self.decompressor.decompress(raw))
+            except EOFError:
+                # data after end of stream (bz2, xz), start new stream
+                self.decompressor = self.make_decompressor()
+                continue
+            raw = self.decompressor.unused_data
+            if raw:
+                self.decompressor = self.make_decompressor()
+        return ''.join(chunks)
+
+    def _readChunk(self):
+        """
+        Read and decompress next chunk of source
+        """
+        raw = self.source.read(self.chunk_size)
+        if not raw:
+            self.eof = True
+            return ''
+        return self._decompress(raw)
+
+    def read(self, size=-1):
+        """
+        Read at most `size` bytes (all till end of stream if
+        `size` is negative)
+        """
+        chunks = [self.buffer]
+        have = len(self.buffer)
+        while (size < 0 or have < size) and not self.eof:
+            chunk = self._readChunk()
+            chunks.append(chunk)
+            have += len(chunk)
+        data = ''.join(chunks)
+        if 0 <= size < len(data):
+            self.buffer = data[size:]
+            data = data[:size]
+        else:
+            self.buffer = ''
+        self.position += len(data)
+        return data
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        """
+        Move forward to `offset` (absolute or relative to current
+        position), skipped data is read and dropped
+        """
+        if whence == 1:
+            offset += self.position
+        elif whence != 0:
+            raise ValueError("Stream can't be seeked from end")
+        if offset < self.position:
+            raise RuntimeError("Can't seek backward in stream (from %d to "
+                               "%d), stream can be read forward only"
+                               % (self.position, offset))
+        while self.position < offset:
+            if not self.read(min(offset - self.position, self.chunk_size)):
+                break
+
+    def close(self):
+        close = getattr(self.source, 'close', None)
+        if close is not None:
+            close()
@@ -26,10 +26,25 @@ import unittest
 import tempfile
 import decimal
 import os
+import shutil
+import struct
+import gzip
+import bz2
 from StringIO import StringIO
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    from ydbf import aio
+except ImportError:
+    aio = None
 
-from ydbf import YDbfReader, YDbfWriter
+import ydbf
+from ydbf import YDbfReader, YDbfWriter, YDbfMmapReader
 from ydbf.lib import date2dbf, str2dbf, dbf2date, dbf2str
+from ydbf.parallel import parallel_records, parallel_reduce
+from ydbf import lib, index, nativeindex, stream
 
 def testdata(filename=None, mode='rb'):
     """
@@ -64,6 +79,148 @@ def testdata(filename=None, mode='rb'):
         return wrapper
     return testrunner
 
+# functions for parallel reading should be picklable
+def _get_int_fld(rec):
+    return rec['INT_FLD']
+
+def _is_odd(rec):
+    return rec['INT_FLD'] % 2
+
+def _add_int_fld(total, rec):
+    return total + rec['INT_FLD']
+
+def _add(x, y):
+    return x + y
+
+# builders of native index files (only structures read by ydbf)
+def _ndx_file(keys, key_length=8, per_page=3):
+    """
+    Build .ndx with numeric keys (doubles), `keys` are sorted pairs
+    (key, 1-based record number)
+    """
+    entry_size = 8 + key_length
+    pages = []
+    leaves = [keys[i:i + per_page] for i in xrange(0, len(keys), per_page)]
+    for leaf in leaves:
+        pages.append(struct.pack('<L', len(leaf)) + ''.join(
+            struct.pack('<LLd', 0, recno, key) for key, recno in leaf))
+    # root: page numbers of leaves start from 1
+    root = struct.pack('<L', len(leaves) - 1) + ''.join(
+        struct.pack('<LLd', i + 1, 0, leaf[-1][0])
+        for i, leaf in enumerate(leaves[:-1])) + \
+        struct.pack('<L', len(leaves))
+    pages.append(root)
+    header = struct.pack('<LL4xHHHH3xB', len(pages), len(pages) + 1,
+                         key_length, per_page, 1, entry_size, 0) + 'DAY'
+    return ''.join(page.ljust(512, '\x00') for page in [header] + pages)
+
+def _mdx_bcd(value):
+    sign, digits, exponent = value.normalize().as_tuple()
+    if digits == (0,):
+        return '\x34' + '\x00'*11
+    nibbles = ''.join(str(d) for d in digits)
+    info = (len(digits) << 2) | (sign and 0x80)
+    return chr(len(digits) + exponent + 0x34) + chr(info) + \
+           (nibbles + '0'*(20 - len(nibbles))).decode('hex')
+
+def _mdx_file(tags, levels=1):
+    """
+    Build .mdx, `tags` are triples (name, type of key, sorted pairs
+    (raw key, 1-based record number)). Tags are single-node trees, or
+    two-level trees (index node and two leaves) if `levels` is 2.
+    """
+    block_size = 1024
+    header = struct.pack('<B3B16sHHBBBxH', 2, 110, 1, 1, 'test', 2,
+                         block_size, 1, 48, 32, len(tags))
+    header = header.ljust(544, '\x00')
+    blocks = []
+    # page 0-1: header, then by 8 pages (4 blocks) for each tag: tag
+    # header, root node and up to two leaves
+    for i, (name, key_type, keys) in enumerate(tags):
+        header_page = 2 + i*8
+        header += struct.pack('<L11sB4xc', header_page, name, 0, key_type
+                              ).ljust(32, '\x00')
+        key_length = len(keys[0][0])
+        entry_size = 4 + key_length
+        blocks.append(struct.pack('<LLBc2xHHHH3xB', header_page + 2, 0, 0,
+                                  key_type, key_length, 10, 0,
+                                  entry_size, 0).ljust(24, '\x00') + name)
+        if levels == 1:
+            nodes = [keys]
+        else:
+            half = len(keys) // 2
+            first, second = keys[:half], keys[half:]
+            nodes = [[(first[-1][0], header_page + 4)], first, second]
+        for j, node in enumerate(nodes):
+            block = struct.pack('<L4x', len(node)) + ''.join(
+                struct.pack('<L', recno) + key for key, recno in node)
+            if levels == 2 and j == 0:
+                # pointer to last child
+                block += struct.pack('<L', header_page + 6)
+            elif j == 2:
+                # stale data after keys of leaf
+                block += struct.pack('<L', header_page)
+            blocks.append(block)
+        blocks.extend([''] * (3 - len(nodes)))
+    return header.ljust(block_size, '\x00') + ''.join(
+        block.ljust(block_size, '\x00') for block in blocks)
+
+def _cdx_double(value):
+    raw = struct.pack('>d', value)
+    if value >= 0:
+        return chr(ord(raw[0]) | 0x80) + raw[1:]
+    return ''.join(chr(~ord(c) & 0xFF) for c in raw)
+
+def _cdx_leaf(keys, fill, attributes=3):
+    info, packed = '', ''
+    previous = ''
+    for key, recno in keys:
+        dup = 0
+        while dup < min(len(key), len(previous), 15) and \
+              key[dup] == previous[dup]:
+            dup += 1
+        trail = min(len(key) - len(key.rstrip(fill)), len(key) - dup, 15)
+        packed = key[dup:len(key) - trail] + packed
+        value = recno | (dup << 16) | (trail << 20)
+        info += struct.pack('<L', value)[:3]
+        previous = key
+    node = struct.pack('<HHll', attributes, len(keys), -1, -1) + \
+           struct.pack('<HLBBBBBB', 0, 0xFFFF, 0xF, 0xF, 16, 4, 4, 3) + info
+    return node + packed.rjust(512 - len(node), '\x00')
+
+def _cdx_file(tags):
+    """
+    Build .cdx, `tags` are tuples (name, expression, fill, sorted pairs
+    (raw key, 1-based record number)). Tags with binary keys (fill is
+    NUL) are stored as two-level trees.
+    """
+    # 0: directory header, 512: directory leaf, then by 3072 bytes
+    # for each tag: 1024 bytes of tag header and up to 3 nodes
+    parts = []
+    directory = []
+    for i, (name, expression, fill, keys) in enumerate(tags):
+        offset = 1024 + i*3072
+        directory.append((name.ljust(10), offset))
+        key_length = len(keys[0][0])
+        if fill == ' ':
+            nodes = _cdx_leaf(keys, fill)
+        else:
+            half = len(keys) // 2
+            root = struct.pack('<HHll', 1, 2, -1, -1) + ''.join(
+                part[-1][0] + struct.pack('>LL', part[-1][1],
+                                          offset + 1024 + 512*(j + 1))
+                for j, part in enumerate((keys[:half], keys[half:])))
+            nodes = root.ljust(512, '\x00') + \
+                _cdx_leaf(keys[:half], fill, 2) + \
+                _cdx_leaf(keys[half:], fill, 2)
+        parts.append(struct.pack('<LlLHBB', offset + 1024, -1, 0,
+                                 key_length, 0, 1).ljust(512, '\x00') +
+                     expression.ljust(512, '\x00') +
+                     nodes.ljust(2048, '\x00'))
+    header = struct.pack('<LlLHBB', 512, -1, 0, 10, 0xE0, 1)
+    return header.ljust(512, '\x00') + _cdx_leaf(directory, ' ') + \
+           ''.join(parts)
+
 class TestDateConverters(unittest.TestCase):
         
     def test_dbf2date(self):
@@ -236,6 +393,1374 @@ class TestYDbfReader(unittest.TestCase):
     def test_wrongtype(self, fh):
         self.assertRaises(ValueError, YDbfReader, fh)
 
+    @testdata('simple.dbf')
+    def test_block_size(self, fh):
+        dbf_data = fh.read()
+        reference_data = list(YDbfReader(StringIO(dbf_data)).records(
+            show_deleted=True))
+        live_data = list(YDbfReader(StringIO(dbf_data)))
+        # one record per block, two records per block, all at once
+        for block_size in (1, 50, 1024):
+            dbf = YDbfReader(StringIO(dbf_data), block_size=block_size)
+            self.assertEqual(list(dbf.records(show_deleted=True)),
+                             reference_data)
+            self.assertEqual(list(dbf.records(start_from=1, limit=2)),
+                             [live_data[1]])
+            self.assertEqual(list(dbf.records(start_from=0, limit=1,
+                                              show_deleted=True)),
+                             [reference_data[0]])
+
+    @testdata('simple.dbf')
+    def test_truncated(self, fh):
+        dbf = YDbfReader(StringIO(fh.read()[:-10]))
+        self.assertRaises(RuntimeError, list, dbf.records(show_deleted=True))
+
+class TestReaderDecoder(unittest.TestCase):
+
+    @testdata('simple.dbf')
+    def test_decoder(self, fh):
+        dbf_data = fh.read()
+        dbf = YDbfReader(StringIO(dbf_data))
+        offset = dbf.lenheader
+        self.assertEqual(dbf.decoder(dbf_data, offset),
+                         {'INT_FLD': 25,
+                          'FLT_FLD': decimal.Decimal('12.34'),
+                          'CHR_FLD': u'test',
+                          'DTE_FLD': datetime.date(2006,  5,  7),
+                          'BLN_FLD': True})
+        # NULL terminates value
+        nulled_data = dbf_data[:offset+1] + '25\x00\x00' + \
+                      dbf_data[offset+5:]
+        self.assertEqual(dbf.decoder(nulled_data, offset)['INT_FLD'], 25)
+
+    @testdata('simple.dbf')
+    def test_custom_converter(self, fh):
+        class Reader(YDbfReader):
+            def _makeActions(self):
+                super(Reader, self)._makeActions()
+                self.converters['INT_FLD'] = lambda val, size, dec: \
+                                                (val, size, dec)
+                self.decoders = {}
+        dbf = Reader(fh)
+        self.assertEqual([rec['INT_FLD'] for rec in dbf],
+                         [('  25', 4, 0), (' 113', 4, 0)])
+
+    @testdata('simple.dbf')
+    def test_change_converters(self, fh):
+        # decoders are rebuilt after change of converters
+        dbf = YDbfReader(fh, value_cache='auto')
+        self.assertEqual([rec['INT_FLD'] for rec in dbf.records()],
+                         [25, 113])
+        dbf.converters['INT_FLD'] = lambda val, size, dec: val.strip()
+        dbf.dbf2date = lambda val: val
+        self.assertEqual([(rec['INT_FLD'], rec['DTE_FLD'])
+                          for rec in dbf.records()],
+                         [('25', '20060507'), ('113', '20061223')])
+        self.assertEqual(dbf[1]['INT_FLD'], '113')
+
+class TestReaderProjection(unittest.TestCase):
+
+    @testdata('simple.dbf')
+    def test_fields(self, fh):
+        dbf = YDbfReader(fh)
+        self.assertEqual(list(dbf.records(fields=['INT_FLD', 'DTE_FLD'])),
+                         [{'INT_FLD': 25,
+                           'DTE_FLD': datetime.date(2006,  5,  7)},
+                          {'INT_FLD': 113,
+                           'DTE_FLD': datetime.date(2006, 12, 23)}])
+        self.assertEqual(list(dbf.records(fields=['FLT_FLD'],
+                                          show_deleted=True)),
+                         [{'_deletion_flag': u'',
+                           'FLT_FLD': decimal.Decimal('12.34')},
+                          {'_deletion_flag': u'',
+                           'FLT_FLD': decimal.Decimal('1.01')},
+                          {'_deletion_flag': u'*',
+                           'FLT_FLD': decimal.Decimal('0.50')}])
+        self.assertEqual(list(dbf.records(fields=[])), [{}, {}])
+        self.assertRaises(ValueError, dbf.records(fields=['FOO']).next)
+
+    @testdata('simple.dbf')
+    def test_dump(self, fh):
+        from ydbf.dump import dbf_data
+        from ydbf.dump import table_output_generator
+        dbf_data_str = fh.read()
+        fields_spec, data = dbf_data(StringIO(dbf_data_str),
+                                     ('CHR_FLD', 'INT_FLD'))
+        self.assertEqual(fields_spec, [('CHR_FLD', 'C', 6, 0),
+                                       ('INT_FLD', 'N', 4, 0)])
+        self.assertEqual(list(data), [('test', 25), ('del', 113)])
+        fields_spec, data = dbf_data(StringIO(dbf_data_str),
+                                     ('CHR_FLD', 'INT_FLD'))
+        self.assertEqual(list(table_output_generator(fields_spec, data)),
+                         ['CHR_F+ | INT+ | \n', '-'*15 + '\n',
+                          'test   | 25   | \n', 'del    | 113  | \n'])
+
+class TestReaderRowTypes(unittest.TestCase):
+
+    @testdata('simple.dbf')
+    def setUp(self, fh):
+        self.dbf_data = fh.read()
+        self.reference_data = list(YDbfReader(StringIO(self.dbf_data)
+                                             ).records(show_deleted=True))
+
+    def _read(self, row_type, **kwargs):
+        dbf = YDbfReader(StringIO(self.dbf_data), row_type=row_type)
+        return dbf, list(dbf.records(**kwargs))
+
+    def test_tuple(self):
+        dbf, data = self._read('tuple', show_deleted=True)
+        names = ['_deletion_flag'] + dbf.field_names
+        self.assertEqual([dict(zip(names, rec)) for rec in data],
+                         self.reference_data)
+        dbf, data = self._read('tuple', fields=['DTE_FLD', 'INT_FLD'])
+        self.assertEqual(data, [(datetime.date(2006,  5,  7), 25),
+                                (datetime.date(2006, 12, 23), 113)])
+
+    def test_namedtuple(self):
+        dbf, data = self._read('namedtuple')
+        self.assertEqual([rec._asdict() for rec in data],
+                         [dict((k, v) for k, v in rec.items()
+                               if k != '_deletion_flag')
+                          for rec in self.reference_data[:2]])
+        self.assertEqual(data[0].INT_FLD, 25)
+        dbf, data = self._read('namedtuple', show_deleted=True)
+        self.assertEqual([tuple(rec) for rec in data],
+                         [tuple(rec[name] for name in
+                                ['_deletion_flag'] + dbf.field_names)
+                          for rec in self.reference_data])
+
+    def test_slots(self):
+        dbf, data = self._read('slots', show_deleted=True)
+        self.assertEqual([rec._asdict() for rec in data],
+                         self.reference_data)
+        self.assertEqual(data[1].CHR_FLD, u'del')
+        self.assertEqual(data[0]._deletion_flag, u'')
+        self.assertRaises(AttributeError, setattr, data[0], 'FOO', 1)
+        self.assertEqual(data[0], data[0].__class__(*data[0]))
+        self.assertNotEqual(data[0], data[1])
+
+    def test_slots_names(self):
+        # names which are not identifiers are renamed as by namedtuple
+        fields = [('class', 'C', 4, 0), ('A-B', 'N', 3, 0),
+                  ('1ST', 'L', 1, 0), ('OK', 'N', 2, 0)]
+        fh = StringIO()
+        YDbfWriter(fh, fields).write([{'class': u'x', 'A-B': 5, '1ST': True,
+                                       'OK': 1}])
+        for row_type in ('slots', 'namedtuple'):
+            dbf = YDbfReader(StringIO(fh.getvalue()), row_type=row_type)
+            rec = list(dbf)[0]
+            self.assertEqual(dict(rec._asdict()),
+                             {'_0': u'x', '_1': 5, '_2': True, 'OK': 1})
+
+    def test_wrong_row_type(self):
+        self.assertRaises(ValueError, YDbfReader, StringIO(self.dbf_data),
+                          row_type='list')
+
+class TestReaderColumns(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = [('INT_FLD', 'N', 4, 0),
+                       ('FLT_FLD', 'N', 6, 2),
+                       ('CHR_FLD', 'C', 6, 0),
+                       ('DTE_FLD', 'D', 8, 0),
+                       ('BLN_FLD', 'L', 1, 0)]
+        self.data = [
+            {'INT_FLD': 25, 'FLT_FLD': decimal.Decimal('12.34'),
+             'CHR_FLD': u'test', 'DTE_FLD': datetime.date(2006, 5, 7),
+             'BLN_FLD': True},
+            {'INT_FLD': -113, 'FLT_FLD': decimal.Decimal('-1.5'),
+             'CHR_FLD': u'', 'DTE_FLD': None, 'BLN_FLD': False},
+            {'INT_FLD': 0, 'FLT_FLD': decimal.Decimal('0'),
+             'CHR_FLD': u'x y', 'DTE_FLD': datetime.date(1899, 12, 31),
+             'BLN_FLD': True},
+        ]
+        fh = StringIO()
+        YDbfWriter(fh, self.fields).write(self.data)
+        self.dbf_data = fh.getvalue()
+
+    def test_read_columns(self):
+        if numpy is None:
+            print "test %s SKIPPED, have no numpy" % 'test_read_columns'
+            return
+        dbf = YDbfReader(StringIO(self.dbf_data))
+        columns = dbf.readColumns()
+        self.assertEqual(sorted(columns.keys()), sorted(dbf.field_names))
+        self.assertEqual(columns['INT_FLD'].dtype, numpy.int64)
+        self.assertEqual(columns['INT_FLD'].tolist(), [25, -113, 0])
+        self.assertEqual(columns['FLT_FLD'].dtype, numpy.float64)
+        self.assertEqual(columns['FLT_FLD'].tolist(), [12.34, -1.5, 0.0])
+        self.assertEqual(columns['CHR_FLD'].tolist(), [u'test', u'', u'x y'])
+        self.assertEqual(columns['DTE_FLD'].dtype,
+                         numpy.dtype('datetime64[D]'))
+        self.assertEqual(columns['DTE_FLD'].tolist(),
+                         [datetime.date(2006, 5, 7), None,
+                          datetime.date(1899, 12, 31)])
+        self.assertEqual(columns['BLN_FLD'].tolist(), [True, False, True])
+        scaled = dbf.readColumns(fields=['FLT_FLD'], scaled=True)
+        self.assertEqual(scaled.keys(), ['FLT_FLD'])
+        self.assertEqual(scaled['FLT_FLD'].tolist(), [1234, -150, 0])
+
+    def test_wrong_date(self):
+        if numpy is None:
+            print "test %s SKIPPED, have no numpy" % 'test_wrong_date'
+            return
+        for date in ('20060231', '20070229', '20061301', '00000101'):
+            dbf_data = self.dbf_data.replace('20060507', date)
+            self.assertRaises(RuntimeError, list,
+                              YDbfReader(StringIO(dbf_data)))
+            self.assertRaises(RuntimeError,
+                              YDbfReader(StringIO(dbf_data)).readColumns)
+        dbf_data = self.dbf_data.replace('20060507', '20080229')
+        self.assertEqual(YDbfReader(StringIO(dbf_data)).readColumns(
+                             fields=['DTE_FLD'])['DTE_FLD'][0].tolist(),
+                         datetime.date(2008, 2, 29))
+
+    def test_truncate_scaled(self):
+        if numpy is None:
+            print "test %s SKIPPED, have no numpy" % 'test_truncate_scaled'
+            return
+        # extra digits after point are truncated toward zero, as by rows
+        fields = [('AMT_FLD', 'C', 6, 0), ('BIG_FLD', 'C', 22, 0)]
+        values = [(' -1.25', '-12345678901234567.25'),
+                  ('  1.25', ' 12345678901234567.25'),
+                  (' -0.05', '-0.05'.rjust(22))]
+        fh = StringIO()
+        YDbfWriter(fh, fields, use_unicode=False).write(
+            [{'AMT_FLD': amount, 'BIG_FLD': big} for amount, big in values])
+        dbf_data = bytearray(fh.getvalue())
+        # make fields numeric with one digit after point
+        for i in xrange(len(fields)):
+            dbf_data[32 + 32*i + 11] = 'N'
+            dbf_data[32 + 32*i + 17] = 1
+        dbf_data = str(dbf_data)
+        rows = list(YDbfReader(StringIO(dbf_data), numeric='int',
+                               row_type='tuple'))
+        columns = YDbfReader(StringIO(dbf_data)).readColumns(scaled=True)
+        self.assertEqual(rows, [(-12, -123456789012345672),
+                                (12, 123456789012345672), (0, 0)])
+        self.assertEqual(zip(columns['AMT_FLD'].tolist(),
+                             columns['BIG_FLD'].tolist()), rows)
+
+    def test_long_numbers(self):
+        if numpy is None:
+            print "test %s SKIPPED, have no numpy" % 'test_long_numbers'
+            return
+        fields = [('BIG_FLD', 'N', 20, 0), ('MNY_FLD', 'N', 20, 2)]
+        data = [{'BIG_FLD': -9223372036854775807,
+                 'MNY_FLD': decimal.Decimal('-1234567890123456.25')},
+                {'BIG_FLD': 25, 'MNY_FLD': decimal.Decimal('1.5')}]
+        fh = StringIO()
+        YDbfWriter(fh, fields).write(data)
+        dbf = YDbfReader(StringIO(fh.getvalue()))
+        columns = dbf.readColumns()
+        self.assertEqual(columns['BIG_FLD'].tolist(),
+                         [-9223372036854775807, 25])
+        self.assertEqual(columns['MNY_FLD'].tolist(),
+                         [-1234567890123456.25, 1.5])
+        self.assertEqual(dbf.readColumns(scaled=True)['MNY_FLD'].tolist(),
+                         [-123456789012345625, 150])
+        # doesn't fit to int64
+        data[0]['BIG_FLD'] = 12345678901234567890
+        fh = StringIO()
+        YDbfWriter(fh, fields).write(data)
+        self.assertRaises(RuntimeError,
+                          YDbfReader(StringIO(fh.getvalue())).readColumns)
+
+    @testdata('simple.dbf')
+    def test_batches(self, fh):
+        if numpy is None:
+            print "test %s SKIPPED, have no numpy" % 'test_batches'
+            return
+        dbf = YDbfReader(fh, use_unicode=False)
+        batches = list(dbf.iterColumnBatches(batch_size=2,
+                                             fields=['INT_FLD', 'CHR_FLD']))
+        self.assertEqual([batch['INT_FLD'].tolist() for batch in batches],
+                         [[25, 113], []])
+        self.assertEqual(batches[0]['CHR_FLD'].tolist(), ['test', 'del'])
+        columns = dbf.readColumns(show_deleted=True)
+        self.assertEqual(columns['_deletion_flag'].tolist(), [' ', ' ', '*'])
+        self.assertEqual(columns['INT_FLD'].tolist(), [25, 113, 7436])
+
+    @testdata('ooonumbug.dbf')
+    def test_ooo_num_bug(self, fh):
+        if numpy is None:
+            print "test %s SKIPPED, have no numpy" % 'test_ooo_num_bug'
+            return
+        dbf = YDbfMmapReader(fh)
+        columns = dbf.readColumns(fields=['INT_FLD', 'FLT_FLD'])
+        self.assertEqual(columns['INT_FLD'].tolist(), [25, 113])
+        self.assertEqual(columns['FLT_FLD'].tolist(), [12.34, 1.01])
+
+class TestReaderRandomAccess(unittest.TestCase):
+
+    @testdata('simple.dbf')
+    def setUp(self, fh):
+        self.dbf_data = fh.read()
+        self.reference_data = list(YDbfReader(StringIO(self.dbf_data)
+                                             ).records(show_deleted=True))
+
+    def test_getitem(self):
+        for dbf in (YDbfReader(StringIO(self.dbf_data)),
+                    YDbfMmapReader(self.dbf_data)):
+            self.assertEqual(dbf[0], self.reference_data[0])
+            self.assertEqual(dbf[2], self.reference_data[2])
+            self.assertEqual(dbf[-1], self.reference_data[2])
+            self.assertEqual(dbf[1], self.reference_data[1])
+            self.assertRaises(IndexError, dbf.__getitem__, 3)
+            self.assertRaises(IndexError, dbf.__getitem__, -4)
+            self.assertEqual(dbf[::2], self.reference_data[::2])
+            self.assertEqual(dbf[1:], self.reference_data[1:])
+            self.assertEqual(dbf[5:], [])
+            # iteration state is not changed
+            self.assertEqual(len(list(dbf)), 2)
+
+    def test_get_many(self):
+        for block_size in (1, 50, 1024):
+            dbf = YDbfReader(StringIO(self.dbf_data), block_size=block_size)
+            self.assertEqual(dbf.getMany([2, 0, 2]),
+                             [self.reference_data[2],
+                              self.reference_data[0],
+                              self.reference_data[2]])
+            self.assertEqual(dbf.getMany([2, 1], show_deleted=False,
+                                         fields=['INT_FLD']),
+                             [None, {'INT_FLD': 113}])
+            self.assertEqual(dbf.getMany([]), [])
+
+class TestParallelReading(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = [('INT_FLD', 'N', 6, 0)]
+        _, self.filepath = tempfile.mkstemp(suffix='.dbf')
+        fh = open(self.filepath, 'wb')
+        YDbfWriter(fh, self.fields).write({'INT_FLD': i}
+                                          for i in xrange(1000))
+        fh.close()
+
+    def tearDown(self):
+        os.unlink(self.filepath)
+
+    def test_parallel_records(self):
+        self.assertEqual(list(parallel_records(self.filepath, workers=3,
+                                               func=_get_int_fld)),
+                         range(1000))
+        self.assertEqual(sorted(parallel_records(self.filepath, workers=2,
+                                                 predicate=_is_odd,
+                                                 ordered=False,
+                                                 chunk_size=7,
+                                                 mmap=True)),
+                         [{'INT_FLD': i} for i in xrange(1, 1000, 2)])
+        self.assertEqual(list(parallel_records(self.filepath, workers=1,
+                                               row_type='tuple')),
+                         [(i,) for i in xrange(1000)])
+
+    def test_row_types(self):
+        # records of different readers have different classes
+        def values(records):
+            return [getattr(rec, '_asdict', lambda: rec)()
+                    for rec in records]
+        for row_type in ydbf.reader.ROW_TYPES:
+            reference = list(YDbfReader(open(self.filepath, 'rb'),
+                                        row_type=row_type).records(
+                                            show_deleted=True))
+            for workers in (1, 2):
+                records = list(parallel_records(
+                    self.filepath, workers=workers, row_type=row_type,
+                    chunk_size=300, show_deleted=True))
+                self.assertEqual(type(records[0]).__name__,
+                                 type(reference[0]).__name__)
+                self.assertEqual(values(records), values(reference))
+
+    def test_parallel_reduce(self):
+        self.assertEqual(parallel_reduce(self.filepath, _add_int_fld, 0, _add,
+                                         workers=2),
+                         sum(xrange(1000)))
+
+class TestReaderWhere(unittest.TestCase):
+
+    @testdata('simple.dbf')
+    def setUp(self, fh):
+        self.dbf_data = fh.read()
+        self.reference_data = list(YDbfReader(StringIO(self.dbf_data)
+                                             ).records(show_deleted=True))
+
+    def _ids(self, where, **kwargs):
+        result = []
+        for dbf in (YDbfReader(StringIO(self.dbf_data), **kwargs),
+                    YDbfMmapReader(bytearray(self.dbf_data), **kwargs)):
+            result.append([rec['INT_FLD'] for rec in
+                           dbf.records(where=where, show_deleted=True)])
+        self.assertEqual(result[0], result[1])
+        return result[0]
+
+    def test_char(self):
+        self.assertEqual(self._ids([('CHR_FLD', '==', u'del')]), [113])
+        self.assertEqual(self._ids([('CHR_FLD', '!=', u'del')]), [25, 7436])
+        self.assertEqual(self._ids([('CHR_FLD', '==', 'del')],
+                                   use_unicode=False), [113])
+        self.assertEqual(self._ids([('CHR_FLD', 'startswith', u'te')]), [25])
+        self.assertEqual(self._ids([('CHR_FLD', 'startswith', u'')]),
+                         [25, 113, 7436])
+        self.assertEqual(self._ids([('CHR_FLD', '>', u'del')]), [25, 7436])
+        self.assertEqual(self._ids([('CHR_FLD', '<=', u'ex.')]), [113, 7436])
+
+    def test_long_value(self):
+        # value longer than field is not truncated
+        fh = StringIO()
+        YDbfWriter(fh, [('S', 'C', 3, 0), ('T', 'C', 3, 0)]).write(
+            [{'S': u'abc', 'T': u'xyz'}, {'S': u'ab', 'T': u'cxy'}])
+        dbf = YDbfReader(StringIO(fh.getvalue()))
+        def values(where):
+            return [rec['S'] for rec in dbf.records(where=where)]
+        self.assertEqual(values([('S', '==', u'abcd')]), [])
+        self.assertEqual(values([('S', '!=', u'abcd')]), [u'abc', u'ab'])
+        self.assertEqual(values([('S', 'startswith', u'abcx')]), [])
+        # prefix doesn't match next field
+        self.assertEqual(values([('S', 'startswith', u'ab c')]), [])
+        self.assertEqual(values([('S', 'startswith', u'ab')]),
+                         [u'abc', u'ab'])
+        self.assertEqual(values([('S', '<', u'abcd')]), [u'abc', u'ab'])
+        self.assertEqual(values([('S', '>', u'abca')]), [])
+        self.assertEqual(values([('S', '>=', u'abc')]), [u'abc'])
+
+    def test_number(self):
+        self.assertEqual(self._ids([('INT_FLD', '>=', 113)]), [113, 7436])
+        self.assertEqual(self._ids([('FLT_FLD', '<', 2)]), [113, 7436])
+        self.assertEqual(self._ids([('FLT_FLD', '==',
+                                     decimal.Decimal('12.34'))]), [25])
+        self.assertEqual(self._ids([('INT_FLD', '>', 25),
+                                    ('FLT_FLD', '>', 1)]), [113])
+
+    def test_date_logic(self):
+        self.assertEqual(self._ids([('DTE_FLD', '>',
+                                     datetime.date(2006, 6, 1))]),
+                         [113, 7436])
+        self.assertEqual(self._ids([('DTE_FLD', '==',
+                                     datetime.date(2006, 5, 7))]), [25])
+        self.assertEqual(self._ids([('BLN_FLD', '==', True)]), [25, 7436])
+        self.assertEqual(self._ids([('BLN_FLD', '!=', True)]), [113])
+
+    def test_wrong(self):
+        dbf = YDbfReader(StringIO(self.dbf_data))
+        for where in ([('FOO', '==', 1)], [('INT_FLD', '=', 1)],
+                      [('INT_FLD', 'startswith', 1)],
+                      [('BLN_FLD', '<', True)]):
+            self.assertRaises(ValueError, dbf.records(where=where).next)
+
+    def test_dump(self):
+        from ydbf.dump import dbf_data
+        fields_spec, data = dbf_data(StringIO(self.dbf_data), ('INT_FLD',),
+                                     ['chr_fld^=d', 'DTE_FLD>=01.12.2006'])
+        self.assertEqual(list(data), [(113,)])
+        fields_spec, data = dbf_data(StringIO(self.dbf_data), None,
+                                     ['BLN_FLD=T', 'FLT_FLD > 10'])
+        self.assertEqual([rec[0] for rec in data], [25])
+
+class TestIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = [('CUSTID', 'C', 8, 0),
+                       ('AMOUNT', 'N', 8, 2),
+                       ('DAY', 'D', 8, 0)]
+        self.data = [{'CUSTID': u'C%d' % (i % 7),
+                      'AMOUNT': decimal.Decimal(i % 5) - 2,
+                      'DAY': datetime.date(2010, 1, 1 + i % 3)}
+                     for i in xrange(100)]
+        _, self.filepath = tempfile.mkstemp(suffix='.dbf')
+        self._write(self.data)
+
+    def _write(self, data):
+        fh = open(self.filepath, 'wb')
+        YDbfWriter(fh, self.fields).write(data)
+        fh.close()
+
+    def tearDown(self):
+        for path in [self.filepath] + [
+                index.index_path(self.filepath, fields)
+                for fields in (('CUSTID',), ('AMOUNT', 'DAY'))]:
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def _expected(self, data, **values):
+        return [rec for rec in data
+                if all(rec[name] == value for name, value in values.items())]
+
+    def test_lookup(self):
+        dbf = ydbf.open(self.filepath)
+        self.assertEqual(dbf.lookup('CUSTID', u'C3'),
+                         self._expected(self.data, CUSTID=u'C3'))
+        self.assertEqual(dbf.lookup('CUSTID', u'C9'), [])
+        self.assert_(os.path.isfile(index.index_path(self.filepath,
+                                                     ['CUSTID'])))
+        self.assertEqual(dbf.lookup(['AMOUNT', 'DAY'],
+                                    [-1, datetime.date(2010, 1, 2)]),
+                         self._expected(self.data, AMOUNT=-1,
+                                        DAY=datetime.date(2010, 1, 2)))
+        # lookup by leading field of index, records are ordered by index
+        self.assertEqual(dbf.lookup(['AMOUNT', 'DAY'], [2]),
+                         sorted(self._expected(self.data, AMOUNT=2),
+                                key=lambda rec: rec['DAY']))
+        dbf.close()
+
+    def test_value_too_long(self):
+        # value doesn't fit to field, so no record has it
+        dbf = ydbf.open(self.filepath)
+        self.assertEqual(dbf.lookup('CUSTID', u'C3xxxxxxx'), [])
+        self.assertEqual(dbf.lookup('CUSTID', u'C3      '),
+                         self._expected(self.data, CUSTID=u'C3'))
+        self.assertEqual(dbf.lookup('AMOUNT', decimal.Decimal('1.001')), [])
+        self.assertEqual(len(dbf.lookup('AMOUNT', decimal.Decimal('1.00'))),
+                         20)
+        dbf.close()
+
+    def test_readonly_dir(self):
+        tmp_dir = tempfile.mkdtemp()
+        filepath = os.path.join(tmp_dir, 'data.dbf')
+        shutil.copy(self.filepath, filepath)
+        os.chmod(tmp_dir, 0555)
+        access = os.access
+        if access(tmp_dir, os.W_OK):
+            # superuser may write to read-only directory
+            os.access = lambda path, mode: \
+                        path != tmp_dir and access(path, mode)
+        try:
+            dbf = ydbf.open(filepath)
+            self.assertEqual(dbf.lookup('CUSTID', u'C3'),
+                             self._expected(self.data, CUSTID=u'C3'))
+            idx_dir = dbf.indexes[('CUSTID',)].tmp_dir
+            self.assert_(os.path.isdir(idx_dir))
+            dbf.close()
+            self.assertEqual(os.listdir(tmp_dir), ['data.dbf'])
+            self.failIf(os.path.exists(idx_dir))
+        finally:
+            os.access = access
+            os.chmod(tmp_dir, 0755)
+            shutil.rmtree(tmp_dir)
+
+    def test_stale(self):
+        dbf = ydbf.open(self.filepath)
+        self.assertEqual(len(dbf.lookup('CUSTID', u'C1')), 15)
+        dbf.close()
+        self._write(self.data + self.data)
+        dbf = ydbf.open(self.filepath, mmap=True)
+        self.assertRaises(ValueError, dbf.lookup, 'CUSTID', u'C1',
+                          rebuild=False)
+        self.assertEqual(len(dbf.lookup('CUSTID', u'C1')), 30)
+        dbf.close()
+
+    def test_external_sort(self):
+        dbf = ydbf.open(self.filepath)
+        idx = index.build_index(dbf, ['AMOUNT', 'DAY'], sort_chunk=7)
+        self.assertEqual(len(idx), 100)
+        keys = [idx.data[pos:pos + idx.entry_size] for pos in
+                xrange(idx.offset, len(idx.data), idx.entry_size)]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(sorted(idx.find(index.make_key(dbf, ['AMOUNT'],
+                                                        [0]))),
+                         [i for i in xrange(100) if i % 5 == 2])
+        idx.close()
+        dbf.close()
+
+class TestNativeIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = [('NAME', 'C', 8, 0),
+                       ('AMOUNT', 'N', 8, 2),
+                       ('DAY', 'D', 8, 0)]
+        names = [u'bob', u'alice', u'carol', u'alice', u'dave', u'bob',
+                 u'eve']
+        amounts = ['3.50', '-1', '12', '0', '3.50', '250', '-7.25']
+        self.data = [{'NAME': name, 'AMOUNT': decimal.Decimal(amount),
+                      'DAY': datetime.date(2010, 1, 1 + i % 4)}
+                     for i, (name, amount) in enumerate(zip(names, amounts))]
+        self.tempdir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tempdir, 'data.dbf')
+        fh = open(self.filepath, 'wb')
+        YDbfWriter(fh, self.fields).write(self.data)
+        fh.close()
+        # last record is deleted
+        dbf = ydbf.open(self.filepath)
+        offset = dbf.lenheader + dbf.recsize*(len(self.data) - 1)
+        dbf.close()
+        fh = open(self.filepath, 'r+b')
+        fh.seek(offset)
+        fh.write('*')
+        fh.close()
+        self.live_data = self.data[:-1]
+
+    def tearDown(self):
+        for name in os.listdir(self.tempdir):
+            os.unlink(os.path.join(self.tempdir, name))
+        os.rmdir(self.tempdir)
+
+    def _keys(self, make_key, field):
+        return sorted((make_key(rec[field]), i + 1)
+                      for i, rec in enumerate(self.data))
+
+    def _write(self, name, data):
+        path = os.path.join(self.tempdir, name)
+        fh = open(path, 'wb')
+        fh.write(data)
+        fh.close()
+        return path
+
+    def _expected(self, field, test):
+        return sorted([rec for rec in self.live_data if test(rec[field])],
+                      key=lambda rec: rec[field])
+
+    def test_ndx(self):
+        keys = self._keys(nativeindex.julian_day, 'DAY')
+        path = self._write('day.ndx', _ndx_file(keys))
+        dbf = ydbf.open(self.filepath)
+        self.assertEqual(dbf.openIndex(path), ['DAY'])
+        self.assertEqual(dbf.tags['DAY'].expression, 'DAY')
+        day = datetime.date(2010, 1, 2)
+        self.assertEqual(dbf.seekKey('day', day),
+                         self._expected('DAY', lambda v: v == day))
+        self.assertEqual(dbf.seekKey('DAY', datetime.date(2011, 1, 1)), [])
+        self.assertEqual(list(dbf.scanRange('DAY')),
+                         self._expected('DAY', lambda v: True))
+        low, high = datetime.date(2010, 1, 2), datetime.date(2010, 1, 3)
+        self.assertEqual(list(dbf.scanRange('DAY', low, high)),
+                         self._expected('DAY', lambda v: low <= v <= high))
+        self.assertRaises(ValueError, dbf.seekKey, 'NAME', u'bob')
+        dbf.close()
+
+    def test_mdx(self):
+        names = self._keys(lambda v: v.encode('ascii').ljust(8), 'NAME')
+        amounts = self._keys(_mdx_bcd, 'AMOUNT')
+        # BCD keys are not ordered bytewise, order them by values
+        amounts.sort(key=lambda item: self.data[item[1] - 1]['AMOUNT'])
+        self._write('data.mdx', _mdx_file([('NAME', 'C', names),
+                                           ('AMOUNT', 'N', amounts)]))
+        # mark DBF as having production index
+        fh = open(self.filepath, 'r+b')
+        fh.seek(28)
+        fh.write('\x01')
+        fh.close()
+        dbf = ydbf.open(self.filepath)
+        self.assertEqual(dbf.mdx_flag, 1)
+        # production index is opened on demand
+        self.assertEqual(dbf.seekKey('NAME', u'alice'),
+                         self._expected('NAME', lambda v: v == u'alice'))
+        self.assertEqual(sorted(dbf.tags), ['AMOUNT', 'NAME'])
+        self.assertEqual(dbf.seekKey('NAME', u'eve'), [])
+        self.assertEqual(dbf.seekKey('AMOUNT', decimal.Decimal('3.5')),
+                         self._expected('AMOUNT', lambda v: v == 3.5))
+        self.assertEqual(list(dbf.scanRange('AMOUNT', -1, 12)),
+                         self._expected('AMOUNT', lambda v: -1 <= v <= 12))
+        self.assertEqual(list(dbf.scanRange('NAME', u'bob')),
+                         self._expected('NAME', lambda v: v >= u'bob'))
+        dbf.close()
+
+    def test_mdx_levels(self):
+        names = self._keys(lambda v: v.encode('ascii').ljust(8), 'NAME')
+        path = self._write('names.mdx', _mdx_file([('NAME', 'C', names)],
+                                                  levels=2))
+        dbf = ydbf.open(self.filepath)
+        self.assertEqual(dbf.openIndex(path), ['NAME'])
+        self.assertEqual(list(dbf.scanRange('NAME')),
+                         self._expected('NAME', lambda v: True))
+        self.assertEqual(dbf.seekKey('NAME', u'dave'),
+                         self._expected('NAME', lambda v: v == u'dave'))
+        self.assertEqual(dbf.tags['NAME'].leaf_depth, 1)
+        dbf.close()
+
+    def test_cdx(self):
+        names = self._keys(lambda v: v.encode('ascii').ljust(8), 'NAME')
+        amounts = self._keys(lambda v: _cdx_double(float(v)), 'AMOUNT')
+        self._write('data.cdx', _cdx_file([('NAME', 'name', ' ', names),
+                                           ('AMOUNT', 'amount', '\x00',
+                                            amounts)]))
+        dbf = ydbf.open(self.filepath)
+        self.assertEqual(dbf.openIndex(), ['AMOUNT', 'NAME'])
+        self.assertEqual(dbf.seekKey('NAME', u'bob'),
+                         self._expected('NAME', lambda v: v == u'bob'))
+        self.assertEqual(list(dbf.scanRange('NAME', high=u'bob')),
+                         self._expected('NAME', lambda v: v <= u'bob'))
+        self.assertEqual(dbf.seekKey('AMOUNT', 0),
+                         self._expected('AMOUNT', lambda v: v == 0))
+        self.assertEqual(list(dbf.scanRange('AMOUNT', 0)),
+                         self._expected('AMOUNT', lambda v: v >= 0))
+        self.assertEqual(list(dbf.scanRange('AMOUNT')),
+                         self._expected('AMOUNT', lambda v: True))
+        dbf.close()
+
+    def test_unknown_index(self):
+        dbf = ydbf.open(self.filepath)
+        self.assertRaises(ValueError, dbf.openIndex)
+        path = self._write('data.idx', '')
+        self.assertRaises(ValueError, dbf.openIndex, path)
+        dbf.close()
+
+class TestReaderMemo(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = [('ID', 'N', 4, 0),
+                       ('NOTE', 'C', 10, 0)]
+        self.notes = [u'first memo', None, u'второе\r\nмемо' * 30,
+                      u'x' * 700, u'last']
+        self.tempdir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tempdir, 'memo.dbf')
+
+    def tearDown(self):
+        for name in os.listdir(self.tempdir):
+            os.unlink(os.path.join(self.tempdir, name))
+        os.rmdir(self.tempdir)
+
+    def _write(self, sig, blocks):
+        """
+        Write DBF with memo field NOTE, `blocks` are numbers of memo
+        blocks for each record
+        """
+        fh = open(self.filepath, 'wb')
+        YDbfWriter(fh, self.fields, encoding='cp1251').write(
+            {'ID': i, 'NOTE': unicode(block or '').rjust(10)}
+            for i, block in enumerate(blocks))
+        fh.close()
+        # set signature and type of field
+        fh = open(self.filepath, 'r+b')
+        fh.write(chr(sig))
+        fh.seek(32*2 + 11)
+        fh.write('M')
+        fh.close()
+
+    def _write_dbt3(self):
+        memo = ['\x00'*512]
+        blocks = []
+        for note in self.notes:
+            if note is None:
+                blocks.append(None)
+                continue
+            blocks.append(len(memo))
+            data = note.encode('cp1251') + '\x1a\x1a'
+            data = data.ljust(-(-len(data) // 512) * 512, '\x00')
+            memo.extend(data[i:i + 512] for i in xrange(0, len(data), 512))
+        self._write(0x83, blocks)
+        fh = open(os.path.join(self.tempdir, 'memo.dbt'), 'wb')
+        fh.write(''.join(memo))
+        fh.close()
+
+    def _write_fpt(self, block_size=64):
+        memo = struct.pack('>L2xH', 0, block_size).ljust(512, '\x00')
+        blocks = []
+        for note in self.notes:
+            if note is None:
+                blocks.append(None)
+                continue
+            blocks.append(len(memo) // block_size)
+            data = note.encode('cp1251')
+            data = struct.pack('>LL', 1, len(data)) + data
+            memo += data.ljust(-(-len(data) // block_size) * block_size,
+                               '\x00')
+        blocks.append(len(memo) // block_size)
+        memo += struct.pack('>LL', 0, 4) + '\x89PNG'
+        self._write(0xF5, blocks)
+        fh = open(os.path.join(self.tempdir, 'memo.FPT'), 'wb')
+        fh.write(memo)
+        fh.close()
+
+    def test_parallel(self):
+        self._write_dbt3()
+        self.assertEqual([rec['NOTE'] for rec in
+                          parallel_records(self.filepath, workers=2,
+                                           chunk_size=2)],
+                         self.notes)
+
+    def test_lazy_dbt(self):
+        self._write_dbt3()
+        dbf = ydbf.open(self.filepath)
+        recs = list(dbf)
+        # memos aren't read by scan
+        self.assertEqual(dbf.memo_file.misses, 0)
+        self.assertEqual(len(dbf.memo_file.cache), 0)
+        self.assert_(isinstance(recs[0]['NOTE'], ydbf.memo.MemoHandle))
+        self.assertEqual(recs[1]['NOTE'], None)
+        self.assertEqual([rec['NOTE'] for rec in recs], self.notes)
+        self.assertEqual(unicode(recs[2]['NOTE']), self.notes[2])
+        self.assertEqual(str(recs[4]['NOTE']), 'last')
+        # first read caches following memos
+        self.assertEqual(dbf.memo_file.misses, 1)
+        dbf.close()
+
+    def test_eager_fpt(self):
+        self._write_fpt()
+        dbf = ydbf.open(self.filepath, lazy_memo=False, use_unicode=False)
+        recs = list(dbf)
+        self.assertEqual([rec['NOTE'] for rec in recs],
+                         [note and note.encode('cp1251')
+                          for note in self.notes] + ['\x89PNG'])
+        dbf.close()
+        dbf = ydbf.open(self.filepath, lazy_memo=False)
+        # picture memo is not decoded
+        self.assertEqual(list(dbf)[-1]['NOTE'], '\x89PNG')
+        dbf.close()
+
+    def test_cache(self):
+        self._write_fpt()
+        dbf = ydbf.open(self.filepath)
+        recs = list(dbf)
+        memo_file = dbf._getMemoFile()
+        memo_file.cache_size = 2
+        memo_file.read_ahead = 64
+        self.assertEqual(recs[3]['NOTE'], self.notes[3])
+        self.assertEqual(recs[0]['NOTE'], self.notes[0])
+        self.assertEqual(memo_file.misses, 2)
+        self.assertEqual(recs[3]['NOTE'], self.notes[3])
+        self.assertEqual(memo_file.hits, 1)
+        self.assertEqual(len(memo_file.cache), 2)
+        # memos of all records are read at once
+        memo_file.cache_size = 10
+        memo_file.read_ahead = 64*1024
+        memo_file.cache.clear()
+        dbf.prefetchMemos(recs)
+        self.assertEqual(len(memo_file.cache), 5)
+        self.assertEqual([rec['NOTE'] for rec in recs[:-1]], self.notes)
+        self.assertEqual(memo_file.misses, 2)
+        dbf.close()
+
+    def test_memo_not_found(self):
+        self._write_dbt3()
+        os.unlink(os.path.join(self.tempdir, 'memo.dbt'))
+        dbf = ydbf.open(self.filepath, lazy_memo=False)
+        self.assertRaises(RuntimeError, list, dbf)
+        dbf.close()
+        dbf = ydbf.open(self.filepath)
+        self.assertEqual([rec['ID'] for rec in dbf.records(fields=['ID'])],
+                         range(len(self.notes)))
+        self.assertRaises(ValueError, list,
+                          dbf.records(where=[('NOTE', '==', '')]))
+        dbf.close()
+
+class TestReaderVfp(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = [('ID', 'I', 4, 0),
+                       ('NAME', 'C', 6, 0),
+                       ('PRICE', 'B', 8, 2),
+                       ('TOTAL', 'Y', 8, 4),
+                       ('STAMP', 'T', 8, 0),
+                       ('QTY', 'F', 6, 2)]
+        stamp = datetime.datetime(2010, 1, 2, 3, 4, 5, 123000)
+        ms = (3*3600 + 4*60 + 5)*1000 + 123
+        records = [
+            ' ' + struct.pack('<i6sdq', 1, 'apple ', 1.5, 123456) +
+            struct.pack('<ll', stamp.toordinal() + 1721425, ms) + '  2.50',
+            ' ' + struct.pack('<i6sdq', -7, 'pear\x00\x00', -0.25, -10000) +
+            '\x00'*8 + '      ',
+            '*' + struct.pack('<i6sdq', 3, 'plum  ', 0, 0) + '\x00'*8 +
+            '  1.00',
+        ]
+        self.data = [
+            {'ID': 1, 'NAME': u'apple', 'PRICE': 1.5,
+             'TOTAL': decimal.Decimal('12.3456'), 'STAMP': stamp,
+             'QTY': decimal.Decimal('2.50')},
+            {'ID': -7, 'NAME': u'pear', 'PRICE': -0.25,
+             'TOTAL': decimal.Decimal('-1'), 'STAMP': None,
+             'QTY': decimal.Decimal('0')},
+        ]
+        self.dbf_data = self._vfp_file(self.fields, records)
+
+    def _vfp_file(self, fields, records, sig=0x30):
+        recsize = 1 + sum(size for name, typ, size, dec in fields)
+        header = struct.pack('<B3BLHH16xBB2x', sig, 110, 1, 1, len(records),
+                             32 + 32*len(fields) + 1 + 263, recsize, 0,
+                             0xC9)
+        header += ''.join(struct.pack('<11sc4xBB13xB', name, typ, size,
+                                      dec, 0)
+                          for name, typ, size, dec in fields)
+        return header + '\x0d' + '\x00'*263 + ''.join(records) + '\x1a'
+
+    def test_read(self):
+        dbf = YDbfReader(StringIO(self.dbf_data))
+        self.assertEqual(dbf.fields, self.fields)
+        self.assertEqual(list(dbf), self.data)
+        self.assertEqual(list(dbf.records(fields=['QTY', 'ID'])),
+                         [{'QTY': rec['QTY'], 'ID': rec['ID']}
+                          for rec in self.data])
+        dbf = YDbfMmapReader(bytearray(self.dbf_data), row_type='tuple')
+        self.assertEqual(list(dbf.records(fields=['NAME', 'STAMP'])),
+                         [(rec['NAME'], rec['STAMP']) for rec in self.data])
+
+    def test_where(self):
+        dbf = YDbfReader(StringIO(self.dbf_data))
+        self.assertEqual(list(dbf.records(where=[('ID', '<', 0)])),
+                         self.data[1:])
+        self.assertEqual(list(dbf.records(where=[('PRICE', '>', 1)])),
+                         self.data[:1])
+        self.assertEqual(list(dbf.records(where=[('TOTAL', '==', '-1')])),
+                         self.data[1:])
+        self.assertEqual(list(dbf.records(where=[('QTY', '==', 2.5)])),
+                         self.data[:1])
+        self.assertRaises(ValueError, list,
+                          dbf.records(where=[('STAMP', '==', None)]))
+
+    def test_columns(self):
+        if numpy is None:
+            print "test %s SKIPPED, have no numpy" % 'test_columns'
+            return
+        dbf = YDbfReader(StringIO(self.dbf_data))
+        columns = dbf.readColumns()
+        self.assertEqual(columns['ID'].tolist(), [1, -7])
+        self.assertEqual(columns['PRICE'].tolist(), [1.5, -0.25])
+        self.assertEqual(columns['TOTAL'].tolist(), [12.3456, -1.0])
+        self.assertEqual(dbf.readColumns(scaled=True)['TOTAL'].tolist(),
+                         [123456, -10000])
+        self.assertEqual(str(columns['STAMP'][0]), '2010-01-02T03:04:05.123')
+        self.assert_(numpy.isnat(columns['STAMP'][1]))
+        self.assertEqual(columns['QTY'].tolist(), [2.5, 0])
+
+    def test_wrong_size(self):
+        data = self._vfp_file([('ID', 'I', 8, 0)], [])
+        self.assertRaises(ValueError, YDbfReader, StringIO(data))
+
+class TestReaderDeleted(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = [('ID', 'N', 4, 0), ('NAME', 'C', 5, 0)]
+        self.data = [{'ID': i, 'NAME': u'n%d' % i} for i in xrange(50)]
+        fh = StringIO()
+        YDbfWriter(fh, self.fields).write(self.data)
+        dbf_data = bytearray(fh.getvalue())
+        # run of deleted records and every third record
+        self.deleted = set(range(10, 25)) | set(range(0, 50, 3))
+        lenheader, recsize = 32 + 32*2 + 1, 10
+        for i in self.deleted:
+            dbf_data[lenheader + i*recsize] = '*'
+        self.dbf_data = str(dbf_data)
+        self.live_data = [rec for i, rec in enumerate(self.data)
+                          if i not in self.deleted]
+
+    def test_records(self):
+        for block_size in (1, 25, 70, lib.BLOCK_SIZE):
+            for dbf in (YDbfReader(StringIO(self.dbf_data),
+                                   block_size=block_size),
+                        YDbfMmapReader(self.dbf_data, block_size=block_size),
+                        YDbfMmapReader(bytearray(self.dbf_data),
+                                       block_size=block_size)):
+                self.assertEqual(list(dbf.records()), self.live_data)
+                self.assertEqual(len(list(dbf.records(show_deleted=True))),
+                                 50)
+                self.assertEqual(list(dbf.records(start_from=12, limit=20)),
+                                 [rec for rec in self.live_data
+                                  if 12 <= rec['ID'] < 32])
+
+    def test_count(self):
+        dbf = YDbfReader(StringIO(self.dbf_data), block_size=100)
+        self.assertEqual(dbf.countLive(), len(self.live_data))
+        self.assertEqual(dbf.deletedRatio(), len(self.deleted) / 50.0)
+        self.assertEqual(YDbfMmapReader(self.dbf_data).countLive(),
+                         len(self.live_data))
+        fh = StringIO()
+        YDbfWriter(fh, self.fields).write([])
+        self.assertEqual(YDbfReader(StringIO(fh.getvalue())).deletedRatio(),
+                         0.0)
+
+    def test_interleaved(self):
+        dbf = YDbfReader(StringIO(self.dbf_data), block_size=30)
+        result = []
+        for rec in dbf.records():
+            # counting and random access don't break iteration
+            dbf.countLive()
+            dbf[0]
+            result.append(rec)
+        self.assertEqual(result, self.live_data)
+
+class TestYDbfMmapReader(unittest.TestCase):
+
+    @testdata('simple.dbf')
+    def test_mmap(self, fh):
+        reference_data = list(YDbfReader(fh).records(show_deleted=True))
+        dbf = YDbfMmapReader(fh)
+        self.assertEqual(dbf.numrec, 3)
+        self.assertEqual(list(dbf.records(show_deleted=True)),
+                         reference_data)
+        # the same data on the second scan
+        self.assertEqual(list(dbf.records(show_deleted=True)),
+                         reference_data)
+        self.assertEqual(list(dbf.records(start_from=1, limit=2)),
+                         [dict((k, v) for k, v in reference_data[1].items()
+                               if k != '_deletion_flag')])
+
+    @testdata('simple.dbf')
+    def test_blob(self, fh):
+        dbf_data = fh.read()
+        reference_data = list(YDbfReader(StringIO(dbf_data)))
+        self.assertEqual(list(YDbfMmapReader(dbf_data)), reference_data)
+        self.assertEqual(list(YDbfMmapReader(bytearray(dbf_data),
+                                             block_size=1)),
+                         reference_data)
+        self.assertRaises(RuntimeError, list,
+                          YDbfMmapReader(dbf_data[:-10]))
+
+    def test_open(self):
+        filepath = os.path.join(os.path.dirname(__file__),
+                                'testdata', 'simple.dbf')
+        dbf = ydbf.open(filepath, mmap=True)
+        self.assert_(isinstance(dbf, YDbfMmapReader))
+        self.assertEqual(len(list(dbf)), 2)
+        dbf.close()
+        self.assertRaises(ValueError, ydbf.open, StringIO(), 'w', [],
+                          mmap=True)
+
+class ForwardOnly(object):
+    """
+    Stream which can be read only, by small pieces
+    """
+    def __init__(self, data, piece=7):
+        self.fh = StringIO(data)
+        self.piece = piece
+
+    def read(self, size=-1):
+        if size < 0 or size > self.piece:
+            size = self.piece
+        return self.fh.read(size)
+
+class TestYDbfStreamReader(unittest.TestCase):
+
+    @testdata('simple.dbf')
+    def setUp(self, fh):
+        self.dbf_data = fh.read()
+        self.reference_data = list(YDbfReader(StringIO(self.dbf_data)
+                                              ).records(show_deleted=True))
+
+    def _gzip(self, data):
+        fh = StringIO()
+        gz = gzip.GzipFile(fileobj=fh, mode='wb')
+        gz.write(data)
+        gz.close()
+        return fh.getvalue()
+
+    def test_stream(self):
+        for data in (self.dbf_data, self._gzip(self.dbf_data),
+                     bz2.compress(self.dbf_data)):
+            dbf = ydbf.YDbfStreamReader(ForwardOnly(data), block_size=1)
+            self.assertEqual(dbf.numrec, 3)
+            self.assertEqual(list(dbf.records(show_deleted=True)),
+                             self.reference_data)
+            # stream can't be read once again
+            self.assertRaises(RuntimeError, list, dbf.records())
+        dbf = ydbf.YDbfStreamReader(ForwardOnly(self.dbf_data),
+                                    compression=None)
+        self.assertEqual(list(dbf.records(start_from=1, limit=1)),
+                         [dict((k, v) for k, v in
+                               self.reference_data[1].items()
+                               if k != '_deletion_flag')])
+        self.assertRaises(ValueError, ydbf.YDbfStreamReader,
+                          ForwardOnly(self.dbf_data), compression='zip')
+        self.assertRaises(RuntimeError, list,
+                          ydbf.YDbfStreamReader(ForwardOnly(
+                              self._gzip(self.dbf_data[:-10]))))
+
+    def test_vfp(self):
+        # data starts after backlink, which is skipped
+        vfp = TestReaderVfp('test_columns')
+        vfp.setUp()
+        dbf = ydbf.YDbfStreamReader(ForwardOnly(vfp.dbf_data))
+        self.assertEqual(list(dbf), vfp.data)
+
+    def test_concatenated(self):
+        data = self._gzip(self.dbf_data[:100]) + \
+               self._gzip(self.dbf_data[100:])
+        self.assertEqual(stream.StreamFile(ForwardOnly(data)).read(),
+                         self.dbf_data)
+        data = bz2.compress(self.dbf_data[:100]) + \
+               bz2.compress(self.dbf_data[100:])
+        self.assertEqual(stream.StreamFile(ForwardOnly(data)).read(),
+                         self.dbf_data)
+
+    def test_open(self):
+        filepath = os.path.join(os.path.dirname(__file__),
+                                'testdata', 'simple.dbf')
+        dbf = ydbf.open(filepath, stream=True)
+        self.assert_(isinstance(dbf, ydbf.YDbfStreamReader))
+        self.assertEqual(len(list(dbf)), 2)
+        dbf.close()
+        self.assertRaises(ValueError, ydbf.open, StringIO(), 'w', [],
+                          stream=True)
+
+class TestReaderNumeric(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = [('ID', 'N', 4, 0), ('AMOUNT', 'N', 19, 4)]
+        fh = StringIO()
+        YDbfWriter(fh, self.fields).write([
+            {'ID': 1, 'AMOUNT': decimal.Decimal('1')},
+            {'ID': -2, 'AMOUNT': decimal.Decimal('-0.5')},
+            {'ID': 3, 'AMOUNT': decimal.Decimal('0')}])
+        # 18 significant digits, writer loses them through float
+        self.dbf_data = fh.getvalue().replace('1.0000'.rjust(19),
+                                              '12345678901234.5678')
+
+    def _read(self, numeric):
+        dbf = YDbfReader(StringIO(self.dbf_data), numeric=numeric,
+                         row_type='tuple')
+        return list(dbf)
+
+    def test_modes(self):
+        self.assertEqual(self._read('decimal'),
+                         [(1, decimal.Decimal('12345678901234.5678')),
+                          (-2, decimal.Decimal('-0.5000')),
+                          (3, decimal.Decimal('0.0000'))])
+        # exponent of decimals is defined by field
+        self.assertEqual([str(rec[1]) for rec in self._read('decimal')],
+                         ['12345678901234.5678', '-0.5000', '0.0000'])
+        self.assertEqual(self._read('float'),
+                         [(1, 12345678901234.5678), (-2, -0.5), (3, 0.0)])
+        self.assertEqual(self._read('int'),
+                         [(1, 123456789012345678), (-2, -5000), (3, 0)])
+        raw = self._read('raw')
+        self.assertEqual([rec[0].strip() for rec in raw], ['1', '-2', '3'])
+        self.assertEqual(len(raw[0][1]), 19)
+        self.assertRaises(ValueError, YDbfReader, StringIO(self.dbf_data),
+                          numeric='double')
+
+    def test_wrong_number(self):
+        for numeric in ('decimal', 'int', 'float'):
+            dbf = YDbfReader(StringIO(self.dbf_data), numeric=numeric)
+            conv = dbf.converters['AMOUNT']
+            self.assertRaises(ValueError, conv, 'foo', 19, 4)
+        self.assertEqual(lib.dbf2scaled(' 1.23456', 4), 12345)
+        self.assertEqual(lib.dbf2scaled('  -.5', 2), -50)
+        self.assertEqual(lib.dbf2decimal(' 1.5 ', 2), decimal.Decimal('1.50'))
+
+class TestReaderWholeDecode(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = [('ID', 'N', 4, 0),
+                       ('NAME', 'C', 10, 0),
+                       ('DAY', 'D', 8, 0),
+                       ('CITY', 'C', 8, 0)]
+        self.data = [
+            {'ID': 1, 'NAME': u'Иван', 'DAY': datetime.date(2010, 1, 2),
+             'CITY': u'Москва'},
+            {'ID': 2, 'NAME': u'', 'DAY': None, 'CITY': u'  Тверь'},
+        ]
+        fh = StringIO()
+        YDbfWriter(fh, self.fields, encoding='cp1251').write(self.data)
+        self.dbf_data = fh.getvalue()
+
+    def test_single_byte(self):
+        self.assert_(lib.is_single_byte('cp1251'))
+        self.assert_(lib.is_single_byte('ascii'))
+        self.assert_(lib.is_single_byte('mac_cyrillic'))
+        self.failIf(lib.is_single_byte('utf-8'))
+        self.failIf(lib.is_single_byte('cp932'))
+        self.failIf(lib.is_single_byte('unknown'))
+
+    def test_whole_decode(self):
+        for row_type in ('dict', 'tuple', 'namedtuple'):
+            dbf = YDbfReader(StringIO(self.dbf_data), row_type=row_type)
+            decode = dbf._getDecoder(show_deleted=False)
+            self.assert_('decode_fields' in decode.func_globals)
+            recs = list(dbf)
+            if row_type == 'dict':
+                self.assertEqual(recs, self.data)
+            else:
+                self.assertEqual([tuple(rec) for rec in recs],
+                                 [(rec['ID'], rec['NAME'], rec['DAY'],
+                                   rec['CITY']) for rec in self.data])
+        dbf = YDbfReader(StringIO(self.dbf_data))
+        self.assertEqual(list(dbf.records(fields=['CITY', 'NAME'])),
+                         [{'CITY': rec['CITY'], 'NAME': rec['NAME']}
+                          for rec in self.data])
+        # single unicode field is decoded as usual
+        decode = dbf._getDecoder(show_deleted=False, fields=['CITY', 'ID'])
+        self.failIf('decode_fields' in decode.func_globals)
+
+    def test_fallback(self):
+        # NULL-terminated value
+        dbf_data = self.dbf_data.replace(u'Иван'.encode('cp1251'),
+                                         u'Ив\x00н'.encode('cp1251'))
+        recs = list(YDbfReader(StringIO(dbf_data)))
+        self.assertEqual(recs[0]['NAME'], u'Ив')
+        self.assertEqual(recs[0]['CITY'], u'Москва')
+        # non-decodable bytes raise the same error as per-field decoding
+        dbf = YDbfReader(StringIO(self.dbf_data), encoding='ascii')
+        self.assertRaises(UnicodeDecodeError, list, dbf)
+
+class TestReaderValueCache(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = [('STATUS', 'C', 6, 0),
+                       ('DAY', 'D', 8, 0),
+                       ('AMOUNT', 'N', 6, 2),
+                       ('ID', 'N', 6, 0),
+                       ('NAME', 'C', 10, 0)]
+        self.data = [{'STATUS': u'st%d' % (i % 3),
+                      'DAY': datetime.date(2010, 1, 1 + i % 5),
+                      'AMOUNT': decimal.Decimal(i % 4) / 4,
+                      'ID': i, 'NAME': u'name %d' % i}
+                     for i in xrange(3000)]
+        fh = StringIO()
+        YDbfWriter(fh, self.fields).write(self.data)
+        self.dbf_data = fh.getvalue()
+
+    def test_auto(self):
+        dbf = YDbfReader(StringIO(self.dbf_data), value_cache='auto',
+                         block_size=1000)
+        self.assertEqual(list(dbf), self.data)
+        stats = dbf.cacheStats()
+        self.assertEqual(sorted(stats), ['AMOUNT', 'DAY', 'ID', 'NAME',
+                                         'STATUS'])
+        self.assertEqual(stats['STATUS']['misses'], 3)
+        self.assertEqual(stats['STATUS']['hits'], 2997)
+        self.assertEqual(stats['DAY']['size'], 5)
+        self.assert_(stats['AMOUNT']['enabled'])
+        # unique values, cache is disabled
+        self.failIf(stats['ID']['enabled'])
+        self.failIf(stats['NAME']['enabled'])
+        self.assertEqual(stats['NAME']['size'], 0)
+        self.assert_(stats['NAME']['misses'] < 3000)
+        # values are shared
+        recs = list(dbf.records())
+        self.assert_(recs[0]['STATUS'] is recs[3]['STATUS'])
+        self.assertEqual(recs, self.data)
+
+    def test_fields(self):
+        dbf = YDbfReader(StringIO(self.dbf_data), value_cache=['NAME'],
+                         row_type='tuple')
+        self.assertEqual(list(dbf.records(fields=['NAME', 'ID'])),
+                         [(rec['NAME'], rec['ID']) for rec in self.data])
+        # cache of non-adaptive cache is not disabled
+        self.assertEqual(dbf.cacheStats(),
+                         {'NAME': {'hits': 0, 'misses': 3000,
+                                   'size': 3000, 'enabled': True}})
+        self.assertRaises(ValueError, YDbfReader, StringIO(self.dbf_data),
+                          value_cache=['FOO'])
+        dbf = YDbfReader(StringIO(self.dbf_data))
+        self.assertEqual(dbf.cacheStats(), {})
+
+class TestReaderLazy(unittest.TestCase):
+
+    @testdata('simple.dbf')
+    def setUp(self, fh):
+        self.dbf_data = fh.read()
+
+    def test_lazy(self):
+        dbf = YDbfReader(StringIO(self.dbf_data))
+        reference = list(dbf.records())
+        recs = list(dbf.records(lazy=True))
+        self.assertEqual(len(recs), len(reference))
+        rec = recs[0]
+        self.assert_(isinstance(rec, ydbf.reader.LazyRecord))
+        self.assertEqual(rec._values, None)
+        self.assertEqual(rec['INT_FLD'], reference[0]['INT_FLD'])
+        # only accessed field is converted
+        self.assertEqual(rec._values.keys(), ['INT_FLD'])
+        self.assertEqual(sorted(rec.keys()), sorted(dbf.field_names))
+        self.assert_('CHR_FLD' in rec)
+        self.failIf('FOO' in rec)
+        self.assertEqual(rec.get('FOO', 1), 1)
+        self.assertRaises(KeyError, lambda: rec['FOO'])
+        self.assertEqual([dict(rec) for rec in recs], reference)
+        self.assertEqual([rec.materialize() for rec in recs], reference)
+        self.assertEqual(recs, reference)
+
+    def test_options(self):
+        dbf = YDbfReader(StringIO(self.dbf_data), row_type='tuple')
+        self.assertEqual(
+            [dict(rec) for rec in dbf.records(lazy=True, show_deleted=True,
+                                              fields=['INT_FLD'])],
+            [{'_deletion_flag': flag, 'INT_FLD': value} for flag, value in
+             dbf.records(show_deleted=True, fields=['INT_FLD'])])
+        recs = list(dbf.records(lazy=True, where=[('INT_FLD', '>', 0)]))
+        self.assertEqual([rec['INT_FLD'] for rec in recs],
+                         [value for value, in dbf.records(
+                             fields=['INT_FLD']) if value > 0])
+        dbf = YDbfMmapReader(bytearray(self.dbf_data))
+        self.assertEqual([dict(rec) for rec in dbf.records(lazy=True)],
+                         list(dbf.records()))
+
+    def test_nulls(self):
+        dbf = YDbfReader(StringIO(self.dbf_data))
+        offset = dbf.lenheader + dbf.field_offsets['CHR_FLD']
+        nulled_data = self.dbf_data[:offset] + 'x\x00' + \
+                      self.dbf_data[offset + 2:]
+        dbf = YDbfReader(StringIO(nulled_data))
+        rec = dbf.records(lazy=True, show_deleted=True).next()
+        self.assertEqual(rec['CHR_FLD'], u'x')
+        self.assertEqual(dict(rec),
+                         dbf.records(show_deleted=True, start_from=0).next())
+
+class TestReaderAio(unittest.TestCase):
+
+    @testdata('simple.dbf')
+    def setUp(self, fh):
+        self.dbf_data = fh.read()
+        if aio is not None:
+            self.loop = aio.asyncio.new_event_loop()
+
+    def tearDown(self):
+        if aio is not None:
+            self.loop.close()
+
+    def _collect(self, records):
+        result = []
+        while True:
+            try:
+                result.append(self.loop.run_until_complete(
+                    records.__anext__()))
+            except aio.StopAsyncIteration:
+                return result
+
+    def test_records(self):
+        if aio is None:
+            print "test %s SKIPPED, have no asyncio" % 'test_records'
+            return
+        for block_size in (1, 1024):
+            reader = aio.AsyncReader(YDbfReader(StringIO(self.dbf_data),
+                                                block_size=block_size),
+                                     self.loop)
+            dbf = reader.reader
+            self.assertEqual(self._collect(reader.__aiter__()),
+                             list(dbf.records()))
+            self.assertEqual(
+                self._collect(reader.records(show_deleted=True,
+                                             start_from=1, limit=2)),
+                list(dbf.records(show_deleted=True, start_from=1, limit=2)))
+            self.assertEqual(
+                self._collect(reader.records(where=[('INT_FLD', '>', 0)],
+                                             fields=['INT_FLD'])),
+                list(dbf.records(where=[('INT_FLD', '>', 0)],
+                                 fields=['INT_FLD'])))
+        reader = aio.AsyncReader(YDbfMmapReader(bytearray(self.dbf_data)),
+                                 self.loop)
+        self.assertEqual(self._collect(reader.records(show_deleted=True)),
+                         list(reader.reader.records(show_deleted=True)))
+
+    def test_get(self):
+        if aio is None:
+            print "test %s SKIPPED, have no asyncio" % 'test_get'
+            return
+        reader = aio.AsyncReader(YDbfReader(StringIO(self.dbf_data),
+                                            block_size=1), self.loop)
+        reference = list(reader.reader.records(show_deleted=True))
+        records = reader.records(show_deleted=True)
+        first = self.loop.run_until_complete(records.__anext__())
+        # random access does not break iteration
+        self.assertEqual(self.loop.run_until_complete(reader.get(-1)),
+                         reference[-1])
+        self.assertEqual(self.loop.run_until_complete(reader.get(slice(0, 2))),
+                         reference[:2])
+        self.assertEqual([first] + self._collect(records), reference)
+        self.assertRaises(IndexError, self.loop.run_until_complete,
+                          reader.get(10))
+
+    def test_write(self):
+        if aio is None:
+            print "test %s SKIPPED, have no asyncio" % 'test_write'
+            return
+        dbf = YDbfReader(StringIO(self.dbf_data))
+        reference = list(dbf.records())
+        fh = StringIO()
+        fh.close = lambda: None
+        writer = aio.open(fh, 'w', dbf.fields, loop=self.loop)
+        self.loop.run_until_complete(writer.write_batch(reference[:1]))
+        self.loop.run_until_complete(writer.write_batch(reference[1:]))
+        self.loop.run_until_complete(writer.close())
+        self.assertEqual(list(YDbfReader(StringIO(fh.getvalue()))),
+                         reference)
+
 class TestReaderConverters(unittest.TestCase):
 
     @testdata('simple.dbf')
@@ -346,6 +1871,18 @@ class TestYdbfWriter(unittest.TestCase):
 
     def test_date2dbf(self):
         self.assertEqual(self.dbf.date2dbf, date2dbf)
+
+    def test_change_converters(self):
+        # encoder is rebuilt after change of converters
+        self.dbf.date2dbf = lambda val: '19991231'
+        self.dbf.converters['INT_FLD'] = lambda val, size, dec: \
+                                         str(val + 1).rjust(size)
+        self.dbf.write(self.reference_data)
+        data = list(YDbfReader(StringIO(self.fh.getvalue())))
+        self.assertEqual([rec['INT_FLD'] for rec in data],
+                         [rec['INT_FLD'] + 1 for rec in self.reference_data])
+        self.assertEqual(set(rec['DTE_FLD'] for rec in data),
+                         set([datetime.date(1999, 12, 31)]))
        
     def test_write(self):
         self.dbf.now = datetime.date(2006, 6, 19)
@@ -367,6 +1904,323 @@ class TestYdbfWriter(unittest.TestCase):
         fh = StringIO("")
         self.assertRaises(ValueError, YDbfWriter, fh, fields)
 
+    def test_buffer(self):
+        # one record per chunk, two records, all at once
+        for buffer_size in (1, 50, 1024):
+            fh = StringIO()
+            dbf = YDbfWriter(fh, self.fields, buffer_size=buffer_size)
+            dbf.now = datetime.date(2006, 6, 19)
+            dbf.write(self.reference_data)
+            self.assertEqual(fh.getvalue(), self.dbf_reference_data)
+
+    def _headers(self, **kwargs):
+        # number of records in header and size of file
+        # before writing of each record
+        fh = StringIO()
+        dbf = YDbfWriter(fh, self.fields, **kwargs)
+        states = []
+        def records():
+            for rec in self.reference_data:
+                data = fh.getvalue()
+                states.append((struct.unpack('<L', data[4:8])[0], len(data)))
+                yield rec
+        dbf.write(records())
+        self.assertEqual(YDbfReader(StringIO(fh.getvalue())).numrec, 3)
+        return states
+
+    def test_checkpoint(self):
+        self.assertEqual(self._headers(checkpoint_records=2),
+                         [(0, 193), (0, 193), (2, 243)])
+        self.assertEqual(self._headers(checkpoint_records=1),
+                         [(0, 193), (1, 218), (2, 243)])
+        self.assertEqual(self._headers(checkpoint_records=None),
+                         [(0, 193), (0, 193), (0, 193)])
+        # records are written by chunks, header is written at the end
+        self.assertEqual(self._headers(checkpoint_records=None,
+                                       buffer_size=50),
+                         [(0, 193), (0, 193), (0, 243)])
+        self.assertEqual(self._headers(checkpoint_records=None,
+                                       checkpoint_seconds=0),
+                         [(0, 193), (1, 218), (2, 243)])
+
+    def test_checkpoint_header(self):
+        # after first write of header, checkpoints update only
+        # date and number of records
+        writes = []
+        class File(StringIO):
+            def write(self, data):
+                if self.tell() < 193:
+                    writes.append((self.tell(), len(data)))
+                StringIO.write(self, data)
+        fh = File()
+        dbf = YDbfWriter(fh, self.fields, checkpoint_records=1)
+        del writes[:]
+        dbf.now = datetime.date(2006, 6, 19)
+        dbf.write(self.reference_data)
+        self.assertEqual(writes, [(1, 7)]*4)
+        self.assertEqual(fh.getvalue(), self.dbf_reference_data)
+
+    def test_encoder(self):
+        # encoder gives the same bytes as converters
+        data = self.reference_data + [
+            {'INT_FLD': 0, 'FLT_FLD': 0, 'CHR_FLD': u'',
+             'DTE_FLD': None, 'BLN_FLD': None},
+            {'INT_FLD': -7, 'FLT_FLD': decimal.Decimal('-1.5'),
+             'CHR_FLD': u'too long', 'BLN_FLD': 1,
+             'DTE_FLD': datetime.datetime(2010, 1, 2, 3, 4)},
+        ]
+        for use_unicode in (True, False):
+            dbf = YDbfWriter(StringIO(), self.fields, use_unicode=use_unicode)
+            buf = bytearray(dbf.recsize)
+            for rec in data:
+                if not use_unicode:
+                    rec = dict(rec, CHR_FLD=str(rec['CHR_FLD']))
+                dbf.encoder(rec, buf, 1)
+                self.assertEqual(
+                    str(buf[1:]),
+                    ''.join(dbf.converters[name](rec[name], size, dec)
+                            for name, typ, size, dec in dbf.fields))
+
+    def test_wide(self):
+        # fields are packed by several calls
+        fields = [('F%d' % i, 'N', 3, 0) for i in xrange(250)]
+        fh = StringIO()
+        dbf = YDbfWriter(fh, fields)
+        data = [dict(('F%d' % i, i + j) for i in xrange(250))
+                for j in xrange(3)]
+        dbf.write(data)
+        self.assertEqual(list(YDbfReader(StringIO(fh.getvalue()))), data)
+
+    def test_overflow(self):
+        data = [dict(self.reference_data[0], INT_FLD=12345)]
+        self.assertRaises(RuntimeError, self.dbf.write, data)
+        self.assertEqual(self.dbf.numrec, 0)
+
+class ModifyTestCase(unittest.TestCase):
+    """
+    Fixture of tests which modify existing DBF
+    """
+    def setUp(self):
+        self.fields = [('INT_FLD', 'N', 4, 0),
+                       ('CHR_FLD', 'C', 6, 0),
+                       ('DTE_FLD', 'D', 8, 0)]
+        self.data = [{'INT_FLD': i, 'CHR_FLD': u'rec%d' % i,
+                      'DTE_FLD': datetime.date(2010, 1, i + 1)}
+                     for i in xrange(5)]
+        self.dbf_data = self._write(self.data)
+
+    def _write(self, data):
+        fh = StringIO()
+        dbf = YDbfWriter(fh, self.fields)
+        dbf.write(data)
+        return fh.getvalue()
+
+class TestYdbfAppender(ModifyTestCase):
+    def setUp(self):
+        super(TestYdbfAppender, self).setUp()
+        self.reference = self.dbf_data
+
+    def _append(self, dbf_data, data, **kwargs):
+        fh = StringIO(dbf_data)
+        dbf = ydbf.YDbfAppender(fh, **kwargs)
+        dbf.write(data)
+        return fh.getvalue()
+
+    def test_append(self):
+        dbf_data = self._write(self.data[:3])
+        self.assertEqual(self._append(dbf_data, self.data[3:]),
+                         self.reference)
+        self.assertEqual(self._append(dbf_data, self.data[3:],
+                                      fields=self.fields, buffer_size=1),
+                         self.reference)
+        # by batches
+        fh = StringIO(dbf_data)
+        dbf = ydbf.YDbfAppender(fh)
+        dbf.write(self.data[3:4])
+        dbf.write(self.data[4:])
+        self.assertEqual(fh.getvalue(), self.reference)
+        fh = StringIO()
+        dbf = YDbfWriter(fh, self.fields)
+        dbf.write(self.data[:2])
+        dbf.write([])
+        dbf.write(self.data[2:])
+        self.assertEqual(fh.getvalue(), self.reference)
+
+    def test_tail(self):
+        dbf_data = self._write(self.data[:3])
+        # without end of file mark, with garbage after it
+        self.assertEqual(self._append(dbf_data[:-1], self.data[3:]),
+                         self.reference)
+        self.assertEqual(self._append(dbf_data + 'garbage', self.data[3:]),
+                         self.reference)
+        self.assertRaises(ValueError, self._append, dbf_data[:-10],
+                          self.data[3:])
+
+    def test_wrong_fields(self):
+        dbf_data = self._write(self.data[:3])
+        fields = self.fields[:2] + [('DTE_FLD', 'C', 8, 0)]
+        self.assertRaises(ValueError, self._append, dbf_data, self.data[3:],
+                          fields=fields)
+        self.assertRaises(ValueError, self._append, dbf_data, self.data[3:],
+                          fields=self.fields[:2])
+        # size of record in header doesn't match fields
+        dbf_data = dbf_data[:10] + struct.pack('<H', 20) + dbf_data[12:]
+        self.assertRaises(ValueError, self._append, dbf_data, self.data[3:])
+
+    def test_open(self):
+        _, filepath = tempfile.mkstemp(suffix='.dbf')
+        try:
+            with ydbf.open(filepath, 'w', self.fields) as dbf:
+                dbf.write(self.data[:3])
+            with ydbf.open(filepath, 'a') as dbf:
+                self.assert_(isinstance(dbf, ydbf.YDbfAppender))
+                dbf.write(self.data[3:])
+            with ydbf.open(filepath) as dbf:
+                self.assertEqual(list(dbf), self.data)
+        finally:
+            os.remove(filepath)
+
+class TestYdbfUpdater(ModifyTestCase):
+
+    def test_update(self):
+        fh = StringIO(self.dbf_data)
+        dbf = ydbf.YDbfUpdater(fh)
+        dbf.update(1, {'INT_FLD': 100, 'CHR_FLD': u'new'})
+        dbf.update(-1, {'DTE_FLD': None})
+        dbf.delete(2)
+        dbf.delete(3)
+        dbf.undelete(3)
+        self.assertEqual(fh.getvalue(), self.dbf_data)
+        # changes are visible for reading
+        self.assertEqual([rec['INT_FLD'] for rec in dbf], [0, 100, 3, 4])
+        self.assertEqual(dbf[1]['CHR_FLD'], u'new')
+        self.assertEqual(dbf[-1]['DTE_FLD'], None)
+        self.assertEqual(dbf[2]['_deletion_flag'], '*')
+        data = fh.getvalue()
+        self.assertEqual(len(data), len(self.dbf_data))
+        self.assertEqual(list(YDbfReader(StringIO(data)).records(
+                             fields=['INT_FLD'], show_deleted=True)),
+                         [{'_deletion_flag': flag, 'INT_FLD': value}
+                          for flag, value in (('', 0), ('', 100),
+                                              ('*', 2), ('', 3), ('', 4))])
+        # only changed bytes are written
+        changed = [pos for pos in xrange(len(data))
+                   if data[pos] != self.dbf_data[pos]]
+        rec_offset = dbf.lenheader + dbf.recsize
+        self.assertEqual(changed[:4],
+                         [rec_offset + 2, rec_offset + 3, rec_offset + 4,
+                          rec_offset + 5])
+
+    def test_lookup(self):
+        _, filepath = tempfile.mkstemp(suffix='.dbf')
+        try:
+            with open(filepath, 'wb') as fh:
+                fh.write(self.dbf_data)
+            with ydbf.open(filepath, 'r+') as dbf:
+                self.assertEqual(dbf.lookup('CHR_FLD', u'rec1'),
+                                 [self.data[1]])
+                dbf.update(1, {'CHR_FLD': u'new'})
+                dbf.update(2, {'INT_FLD': 20})
+                self.assertEqual(dbf.lookup('CHR_FLD', u'rec1'), [])
+                self.assertEqual(dbf.lookup('CHR_FLD', u'new'),
+                                 [dict(self.data[1], CHR_FLD=u'new')])
+                self.assertEqual(dbf.lookup('CHR_FLD', u'rec2'),
+                                 [dict(self.data[2], INT_FLD=20)])
+                dbf.update(1, {'CHR_FLD': u'rec1'})
+                self.assertEqual(dbf.lookup('CHR_FLD', u'new'), [])
+        finally:
+            for name in os.listdir(os.path.dirname(filepath)):
+                if name.startswith(os.path.basename(filepath)):
+                    os.remove(os.path.join(os.path.dirname(filepath), name))
+
+    def test_cache(self):
+        fh = StringIO(self.dbf_data)
+        dbf = ydbf.YDbfUpdater(fh, cache_size=2)
+        dbf.delete(0)
+        dbf.update(0, {'INT_FLD': 7})
+        dbf.delete(1)
+        self.assertEqual(len(dbf.dirty), 2)
+        self.assertEqual(fh.getvalue(), self.dbf_data)
+        dbf.delete(2)
+        self.assertEqual(dbf.dirty, {})
+        self.assertEqual([rec['INT_FLD'] for rec in
+                          YDbfReader(StringIO(fh.getvalue()))], [3, 4])
+        dbf.undelete(0)
+        dbf.flush()
+        self.assertEqual(YDbfReader(StringIO(fh.getvalue()))[0]['INT_FLD'],
+                         7)
+
+    def test_errors(self):
+        dbf = ydbf.YDbfUpdater(StringIO(self.dbf_data))
+        self.assertRaises(ValueError, dbf.update, 0, {'FOO': 1})
+        self.assertRaises(ValueError, dbf.update, 0, {'_deletion_flag': '*'})
+        self.assertRaises(ValueError, dbf.update, 0,
+                          {'CHR_FLD': u'new', 'INT_FLD': 12345})
+        self.assertEqual(dbf.dirty, {})
+        self.assertRaises(IndexError, dbf.delete, 5)
+        self.assertRaises(IndexError, dbf.update, -6, {'INT_FLD': 1})
+
+    def test_open(self):
+        _, filepath = tempfile.mkstemp(suffix='.dbf')
+        try:
+            with open(filepath, 'wb') as fh:
+                fh.write(self.dbf_data)
+            with ydbf.open(filepath, 'r+') as dbf:
+                self.assert_(isinstance(dbf, ydbf.YDbfUpdater))
+                dbf.update(4, {'CHR_FLD': u'last'})
+                dbf.delete(0)
+            with ydbf.open(filepath) as dbf:
+                self.assertEqual(dbf.dt, datetime.date.today())
+                self.assertEqual([rec['CHR_FLD'] for rec in dbf],
+                                 [u'rec1', u'rec2', u'rec3', u'last'])
+        finally:
+            os.remove(filepath)
+
+class TestPack(ModifyTestCase):
+    def setUp(self):
+        super(TestPack, self).setUp()
+        self.deleted = [0, 2, 3]
+        fh = StringIO(self.dbf_data)
+        dbf = ydbf.YDbfUpdater(fh)
+        for i in self.deleted:
+            dbf.delete(i)
+        dbf.flush()
+        self.dbf_data = fh.getvalue()
+        self.packed_data = self._write([rec for i, rec in enumerate(self.data)
+                                        if i not in self.deleted])
+
+    def test_in_place(self):
+        # one record per block, several records, all at once
+        for block_size in (1, 30, 1024):
+            fh = StringIO(self.dbf_data)
+            self.assertEqual(ydbf.pack(fh, block_size=block_size), 3)
+            self.assertEqual(fh.getvalue(), self.packed_data)
+        # nothing to remove
+        fh = StringIO(self.packed_data)
+        self.assertEqual(ydbf.pack(fh), 0)
+        self.assertEqual(fh.getvalue(), self.packed_data)
+
+    def test_target(self):
+        source, target = StringIO(self.dbf_data), StringIO()
+        self.assertEqual(ydbf.pack(source, target, block_size=30), 3)
+        self.assertEqual(target.getvalue(), self.packed_data)
+        self.assertEqual(source.getvalue(), self.dbf_data)
+
+    def test_files(self):
+        _, filepath = tempfile.mkstemp(suffix='.dbf')
+        _, target_path = tempfile.mkstemp(suffix='.dbf')
+        try:
+            with open(filepath, 'wb') as fh:
+                fh.write(self.dbf_data + 'garbage')
+            self.assertEqual(ydbf.pack(filepath, target_path), 3)
+            self.assertEqual(ydbf.pack(filepath), 3)
+            for path in (filepath, target_path):
+                with open(path, 'rb') as fh:
+                    self.assertEqual(fh.read(), self.packed_data)
+        finally:
+            os.remove(filepath)
+            os.remove(target_path)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+# YDbf - Pythonic reader and writer for DBF/XBase files
+# Inspired by code of Raymond Hettinger
+# http://code.activestate.com/recipes/362715
+#
+# Copyright (C) 2006-2010 Yury Yurevich and contributors
+#
+# http://pyobject.ru/projects/ydbf/
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, version 2
+# of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+"""
+DBF updater: in-place update and deletion of records, packing
+"""
+__all__ = ["YDbfUpdater", "pack"]
+
+import re
+import datetime
+import struct
+
+from ydbf import lib
+from ydbf.reader import YDbfReader
+from ydbf.writer import YDbfWriter
+
+# default number of changed records kept in write-back cache
+CACHE_SIZE = 1024
+
+# types of fields which can be updated
+UPDATABLE_TYPES = ('N', 'D', 'L', 'C')
+
+# runs of live records in deletion flags
+LIVE_RUN_RE = re.compile(' +')
+
+class _Encoder(YDbfWriter):
+    """
+    Converters of writer which doesn't touch any file
+    """
+    def _defineLangCode(self):
+        pass
+
+    def _prepareFile(self):
+        pass
+
+class YDbfUpdater(YDbfReader):
+    """
+    DBF reader which updates, deletes and undeletes records in place
+
+    Only changed fields (or deletion flag) are written, at their offsets
+    in file. Changes are kept in write-back cache and written in order
+    of offsets when cache is full, on `flush` or `close`. Records which
+    are read after change are read with the change.
+    """
+    def __init__(self, fh, *args, **kwargs):
+        """
+        Create DBF updater
+
+        Args:
+            `fh`:
+                filehandler, should be opened for binary reading
+                and writing (i.e. 'r+b')
+            `cache_size`:
+                maximal number of changed records kept in cache,
+                by default 1024
+
+        All other args are the same as for YDbfReader.
+        """
+        self.cache_size = kwargs.pop('cache_size', CACHE_SIZE)
+        # changes: index of record -> {offset in record: raw data}
+        self.dirty = {}
+        self.changed = False     # file was changed
+        # fields changed by `update`, and sidecar indexes (by fields)
+        # rebuilt after last change of their fields
+        self.changed_fields = set()
+        self.rebuilt_indexes = set()
+        self.encoder = None
+        super(YDbfUpdater, self).__init__(fh, *args, **kwargs)
+
+    def postInit(self):
+        super(YDbfUpdater, self).postInit()
+        fields = [field for field in self.fields
+                  if field[1] in UPDATABLE_TYPES]
+        self.encoder = _Encoder(None, fields,
+                                use_unicode=self.encoding is not None,
+                                encoding=self.encoding or 'ascii',
+                                buffer_size=1)
+
+    def _index(self, i):
+        if i < 0:
+            i += self.numrec
+        if not 0 <= i < self.numrec:
+            raise IndexError("Record index %d out of range" % i)
+        return i
+
+    def _change(self, i, offset, raw):
+        """
+        Put change of record #`i` to cache
+        """
+        self.dirty.setdefault(i, {})[offset] = raw
+        if len(self.dirty) > self.cache_size:
+            self.flush()
+
+    def update(self, i, changes):
+        """
+        Update fields of record
+
+        Args:
+            `i`:
+                index of record, negative index counts from the end
+            `changes`:
+                dict of new values of fields (NAME: VALUE)
+        """
+        i = self._index(i)
+        converters = self.encoder.converters
+        raw_changes = []
+        for name, value in changes.items():
+            if name not in self.field_offsets or name == '_deletion_flag':
+                raise ValueError("Unknown field %s" % name)
+            if name not in converters:
+                typ = dict((fld[0], fld[1]) for fld in self.fields)[name]
+                raise ValueError("Field %s of type %s can't be updated"
+                                 % (name, typ))
+            size, dec = self.field_sizes[name]
+            raw = converters[name](value, size, dec)
+            if len(raw) != size:
+                raise ValueError("Value %r does not fit into field %s "
+                                 "(size %d)" % (value, name, size))
+            raw_changes.append((self.field_offsets[name], raw))
+        # record is changed only if all values are converted
+        for offset, raw in raw_changes:
+            self._change(i, offset, raw)
+        self._invalidateIndexes(changes.keys())
+
+    def _invalidateIndexes(self, names):
+        """
+        Drop sidecar indexes on changed fields `names`
+        """
+        names = set(names)
+        self.changed_fields.update(names)
+        for fields in self.indexes.keys():
+            if names.intersection(fields):
+                self.indexes.pop(fields).close()
+        self.rebuilt_indexes = set(fields for fields in self.rebuilt_indexes
+                                   if not names.intersection(fields))
+
+    def _openLookupIndex(self, fields, rebuild):
+        # sidecar index file may look fresh after change (e.g. if
+        # modification time of DBF has not changed), so index on
+        # changed fields is rebuilt
+        from ydbf import index
+        if fields in self.rebuilt_indexes or \
+               not self.changed_fields.intersection(fields):
+            return index.open_index(self, fields, rebuild)
+        if not rebuild:
+            raise ValueError("Index on %s is stale" % '+'.join(fields))
+        self.flush()
+        self.rebuilt_indexes.add(fields)
+        return index.build_index(self, fields)
+
+    def delete(self, i):
+        """
+        Mark record #`i` as deleted
+        """
+        self._change(self._index(i), 0, '*')
+
+    def undelete(self, i):
+        """
+        Unmark deleted record #`i`
+        """
+        self._change(self._index(i), 0, ' ')
+
+    def flush(self):
+        """
+        Write cached changes to file (in order of offsets)
+        """
+        if self.dirty:
+            changes = []
+            for i, fields in self.dirty.iteritems():
+                rec_offset = self.lenheader + self.recsize*i
+                changes.extend((rec_offset + offset, raw)
+                               for offset, raw in fields.iteritems())
+            changes.sort()
+            # adjacent changes are written at once
+            start, chunks = changes[0][0], []
+            end = start
+            for offset, raw in changes:
+                if offset != end:
+                    self.fh.seek(start)
+                    self.fh.write(''.join(chunks))
+                    start, chunks = offset, []
+                chunks.append(raw)
+                end = offset + len(raw)
+            self.fh.seek(start)
+            self.fh.write(''.join(chunks))
+            self.dirty = {}
+            self.changed = True
+        self.fh.flush()
+
+    def _readBlocks(self, start, stop, recs_per_block=None):
+        # changes are written before reading, so records are read
+        # with changes
+        blocks = super(YDbfUpdater, self)._readBlocks(start, stop,
+                                                      recs_per_block)
+        while True:
+            if self.dirty:
+                self.flush()
+            try:
+                block = next(blocks)
+            except StopIteration:
+                return
+            yield block
+
+    def close(self):
+        self.flush()
+        if self.changed:
+            _write_numrec(self.fh, self.numrec)
+            self.fh.flush()
+        return super(YDbfUpdater, self).close()
+
+def _write_numrec(fh, numrec):
+    """
+    Write date of last update (today) and number of records to header
+    """
+    today = datetime.date.today()
+    fh.seek(1)
+    fh.write(struct.pack('<3BL', today.year - 1900, today.month, today.day,
+                         numrec))
+
+def pack(source, target=None, block_size=lib.BLOCK_SIZE):
+    """
+    Remove deleted records from DBF
+
+    Raw data of live records is moved by blocks, fields are not decoded.
+    Memo file and index files are not changed (indexes should be
+    rebuilt after packing).
+
+    Args:
+        `source`:
+            file name or filehandler of DBF (opened for binary reading
+            and writing, i.e. 'r+b', if DBF is packed in place)
+        `target`:
+            file name or filehandler (opened for binary writing) of
+            packed DBF. By default, DBF is packed in place: live records
+            are moved forward and file is truncated.
+        `block_size`:
+            size (in bytes) of block which is read at once,
+            by default 1 MB
+
+    Returns number of removed records.
+    """
+    in_place = target is None
+    own_files = []
+    if isinstance(source, basestring):
+        source = file(source, (in_place and 'r+b') or 'rb')
+        own_files.append(source)
+    if isinstance(target, basestring):
+        target = file(target, 'wb')
+        own_files.append(target)
+    try:
+        reader = YDbfReader(source, use_unicode=False, block_size=block_size)
+        recsize = reader.recsize
+        if in_place:
+            target = source
+        else:
+            source.seek(0)
+            target.write(source.read(reader.lenheader))
+        write_pos = reader.lenheader
+        live = 0
+        for first, count, block, offset in reader._readBlocks(0,
+                                                              reader.numrec):
+            flags = reader._flags(block, offset, count)
+            chunks = []
+            for run in LIVE_RUN_RE.finditer(flags):
+                start, end = run.span()
+                live += end - start
+                if in_place and write_pos == (reader.lenheader +
+                                              (first + start)*recsize):
+                    # no deleted records before, run is in place
+                    write_pos += (end - start)*recsize
+                    continue
+                chunks.append(block[offset + start*recsize:
+                                    offset + end*recsize])
+            if not chunks:
+                continue
+            data = ''.join(chunks)
+            # records are moved forward only, so data which is
+            # not read yet is never overwritten
+            if target.tell() != write_pos:
+                target.seek(write_pos)
+            target.write(data)
+            write_pos += len(data)
+        target.seek(write_pos)
+        # end of file mark
+        target.write('\x1A')
+        if in_place:
+            target.truncate()
+        _write_numrec(target, live)
+        target.flush()
+        return reader.numrec - live
+    finally:
+        for fh in own_files:
+            fh.close()
@@ -19,18 +19,29 @@
 """
 DBF writer
 """
-__all__ = ["YDbfWriter"]
+__all__ = ["YDbfWriter", "YDbfAppender"]
 
+import time
 import struct
 import datetime
 
 from ydbf import lib
+from ydbf.reader import YDbfReader
+
+# maximal number of fields packed by one call of pack_into
+# (number of arguments in call is limited by 255)
+FIELDS_PER_PACK = 200
+# maximal number of converted dates kept by encoder
+DATE_CACHE_SIZE = 10000
 
 class YDbfWriter(object):
     """
     Writes DBF from iterator
     """
-    def __init__(self, fh, fields, use_unicode=True, encoding='ascii'):
+    def __init__(self, fh, fields, use_unicode=True, encoding='ascii',
+                 buffer_size=lib.BLOCK_SIZE,
+                 checkpoint_records=lib.CHECKPOINT_RECORDS,
+                 checkpoint_seconds=None):
         """
         Create DBF writer
         
@@ -55,6 +66,21 @@ class YDbfWriter(object):
                 use unicode (recommended), then unicode data will be encoded
                 by this encoding, else data will be written as is.
                 Default is 'ascii', which means 0x00 lang code.
+            `buffer_size`:
+                size (in bytes) of write buffer. Records are collected
+                in buffer and written to file by big chunks. At least
+                one record is buffered. By default 1 MB.
+            `checkpoint_records`:
+                write header (with actual number of records) and flush
+                file each `checkpoint_records` records, by default
+                each 1000 records. None -- don't checkpoint by number
+                of records.
+            `checkpoint_seconds`:
+                write header and flush file if more than
+                `checkpoint_seconds` seconds have passed since last
+                checkpoint. None (default) -- don't checkpoint by time.
+                If both checkpoint options are None, header is written
+                at the end only.
         """
         self.fh = fh
         self.fields = fields
@@ -66,15 +92,29 @@ class YDbfWriter(object):
         self.numfields = len(fields)
         self.lenheader = self.numfields * 32 + 33
         self.recsize = sum([field[2] for field in fields]) + 1
+        self.numwritten = 0  # number of records written to file
+        self.header_written = False  # full header is written to file
+        self.checkpoint_records = checkpoint_records
+        self.checkpoint_seconds = checkpoint_seconds
+        self.checkpointed = 0  # number of records at last checkpoint
+        self.checkpoint_time = time.time()
+        # write buffer, deletion flags are filled in advance
+        self.buffer = bytearray(' '*(max(1, buffer_size // self.recsize) *
+                                     self.recsize))
         self.date2dbf = lib.date2dbf
         self.sig = 0x03  # signature, DBF 3
         self.lang = 0x0 # default -- ascii, 0x00
         
         self.converters = {}
         self.action_resolvers = ()
+        self.inline_converters = {}
+        self.exact_converters = []
+        self.encoder = None      # compiled encoder of records
+        # converters and date2dbf, which encoder was made with
+        self.encoder_state = None
 
         self._defineLangCode()        
-        self._writeHeader()
+        self._prepareFile()
         self._makeActions()        
     
     def _defineLangCode(self):
@@ -125,9 +165,104 @@ class YDbfWriter(object):
                     break
             if not action:
                 raise ValueError("Cannot find python-to-dbf converter "
-                                 "for field %s (type %s)" % (name, typ))        
+                                 "for field %s (type %s)" % (name, typ))
+        # expressions which are inlined into encoder instead of call
+        # of builtin converter, %(val)s is substituted by value,
+        # %(size)d, %(dec)d -- by size and decimals of field,
+        # %(blank)r -- by string of `size` spaces
+        self.inline_converters = {
+            py2dbf_date: '(%(val)s and (dates.get(%(val)s) or '
+                         'cache_date(%(val)s))) or %(blank)r',
+            py2dbf_logic: "(%(val)s and 'T') or 'F'",
+            py2dbf_unicode: '(%(val)s and %(val)s[:%(size)d].encode('
+                            '%(encoding)r).ljust(%(size)d)) or %(blank)r',
+            py2dbf_string: '(%(val)s and str(%(val)s)[:%(size)d]'
+                           '.ljust(%(size)d)) or %(blank)r',
+            py2dbf_integer: "((%(val)s and str(%(val)s)) or '0')"
+                            ".rjust(%(size)d)",
+            py2dbf_decimal: "((%(val)s and '%%.%(dec)df' %% float(str("
+                            "%(val)s))) or '0.%(zeros)s').rjust(%(size)d)",
+        }
+        # converters which always return value of field size
+        self.exact_converters = [py2dbf_date, py2dbf_logic, py2dbf_string]
+        if lib.is_single_byte(self.encoding):
+            self.exact_converters.append(py2dbf_unicode)
+        self._getEncoder()
+
+    def _getEncoder(self):
+        """
+        Get compiled encoder of records, it is rebuilt if `converters`
+        or `date2dbf` were changed since it was made
+        """
+        state = self.encoder_state
+        if state is None or state[0] is not self.date2dbf or \
+               state[1] != self.converters:
+            self.encoder = self._makeEncoder()
+            self.encoder_state = (self.date2dbf, dict(self.converters))
+        return self.encoder
+
+    def _makeEncoder(self):
+        """
+        Make encoder of records: function encode(rec, buf, offset),
+        which converts values of record `rec` and packs them into
+        bytearray `buf` at `offset` (deletion flag is not packed).
+        Builtin converters are inlined, ValueError is raised if
+        converted value doesn't fit into field.
+        """
+        # dates are usually repeated, so converted ones are cached
+        dates = {}
+        date2dbf = self.date2dbf
+
+        def cache_date(val):
+            if len(dates) >= DATE_CACHE_SIZE:
+                dates.clear()
+            dates[val] = dbf_date = date2dbf(val)
+            return dbf_date
+
+        namespace = {'dates': dates, 'cache_date': cache_date}
+        lines = []
+        packs = []
+        offset = 0
+        for start in xrange(0, len(self.fields), FIELDS_PER_PACK):
+            fields = self.fields[start:start + FIELDS_PER_PACK]
+            names = []
+            for num, (name, typ, size, dec) in enumerate(fields, start):
+                val, res = 'v', 'f%d' % num
+                conv = self.converters[name]
+                lines.append('    %s = rec[%r]' % (val, name))
+                if conv in self.inline_converters:
+                    expr = self.inline_converters[conv] % {
+                        'val': val, 'size': size, 'dec': dec,
+                        'blank': ' '*size, 'zeros': '0'*dec,
+                        'encoding': self.encoding}
+                else:
+                    namespace['conv_%d' % num] = conv
+                    expr = 'conv_%d(%s, %d, %d)' % (num, val, size, dec)
+                lines.append('    %s = %s' % (res, expr))
+                if conv not in self.exact_converters:
+                    lines.append(
+                        '    if len(%s) != %d:\n'
+                        '        raise ValueError("value %%r does not fit '
+                        'into field %s (size %d)" %% (%s,))'
+                        % (res, size, name, size, val))
+                names.append(res)
+            struct_name = 'struct_%d' % len(packs)
+            namespace[struct_name] = struct.Struct(
+                '<' + ''.join('%ds' % field[2] for field in fields))
+            packs.append('    %s.pack_into(buf, offset + %d, %s)'
+                         % (struct_name, offset, ', '.join(names)))
+            offset += namespace[struct_name].size
+        source = ("def encode(rec, buf, offset):\n%s\n%s\n"
+                  % ('\n'.join(lines), '\n'.join(packs)))
+        return lib.compile_function('encode', source, namespace)
         
 
+    def _prepareFile(self):
+        """
+        Prepare file for writing of records: write initial header
+        """
+        self._writeHeader()
+
     def _writeHeader(self):
         """
         Write DBF-header
@@ -138,23 +273,53 @@ class YDbfWriter(object):
 
         self.hdr = struct.pack(lib.HEADER_FORMAT, self.sig, year, month,
                                day, self.numrec, self.lenheader,
-                               self.recsize, self.lang)
+                               self.recsize, 0, self.lang)
         self.fh.write(self.hdr)
         for name, typ, size, deci in self.fields:
             if typ not in ('N', 'D', 'L', 'C'):
                 raise ValueError("Unknown type %r on field %s" % (typ, name))
             name = name.ljust(11, '\x00')
             fld = struct.pack(lib.FIELD_DESCRIPTION_FORMAT,
-                              name, typ, size, deci)
+                              name, typ, size, deci, 0)
             self.fh.write(fld)
         # terminator
         self.fh.write('\x0d')
+        self.header_written = True
         if pos > 0:
             self.fh.seek(pos)
 
+    def _updateHeader(self):
+        """
+        Update date of last update and number of records in header
+        (other fields of header are not changed after first write)
+        """
+        if not self.header_written:
+            self._writeHeader()
+            return
+        pos = self.fh.tell()
+        self.fh.seek(1)
+        self.fh.write(struct.pack('<3BL', self.now.year - 1900,
+                                  self.now.month, self.now.day, self.numrec))
+        self.fh.seek(pos)
+
+    def _writeBuffer(self):
+        """
+        Write buffered records to file
+        """
+        size = (self.numrec - self.numwritten)*self.recsize
+        if size == len(self.buffer):
+            self.fh.write(str(self.buffer))
+        elif size:
+            self.fh.write(str(buffer(self.buffer, 0, size)))
+        self.numwritten = self.numrec
+
     def flush(self):
-        self._writeHeader()
-        self.fh.flush()    
+        self._writeBuffer()
+        self._updateHeader()
+        self.fh.flush()
+        self.checkpointed = self.numrec
+        if self.checkpoint_seconds is not None:
+            self.checkpoint_time = time.time()
     
     def close(self):
         self.fh.close()    
@@ -166,13 +331,31 @@ class YDbfWriter(object):
         Args:
             `records`:
                 iterator over records (each record is a dict of values)
+        
+        Records of next call are written after already written ones
+        (end of file mark is overwritten).
+        """
+        self.fh.seek(self.lenheader + self.recsize*self.numwritten)
+        self._writeRecords(records)
+        self._finish()
+
+    def _writeRecords(self, records):
+        """
+        Write records after already written ones, header and
+        end of file mark are not written
         """
-        i = 0
+        i = self.numrec
+        recsize = self.recsize
+        encode = self._getEncoder()
+        buf = self.buffer
+        pos = (i - self.numwritten)*recsize
+        checkpoint_records = self.checkpoint_records
+        checkpoint_seconds = self.checkpoint_seconds
         for rec in records:
             i += 1
             try:
-                raw_rec = ''.join(self.converters[name](rec[name], size, dec)
-                                  for name, typ, size, dec in self.fields)
+                # deletion flag is already in buffer
+                encode(rec, buf, pos + 1)
             except UnicodeDecodeError, err:
                 self.flush()
                 if self.use_unicode:
@@ -212,13 +395,26 @@ class YDbfWriter(object):
                 raise RuntimeError("Error occured (%s: %s) while reading "
                                    "rec #%d. Record data: %s" %
                                    (err.__class__.__name__, err, i, rec))
-            # first empty symbol is a deletion flag
-            self.fh.write(' '+raw_rec)
+            pos += recsize
             self.numrec = i
-            if divmod(i, 1000)[1] == 0:
-                # each 1k records flush header
+            if checkpoint_records is not None and \
+                   i - self.checkpointed >= checkpoint_records:
                 self.flush()
-        self._writeHeader()
+                pos = 0
+            elif checkpoint_seconds is not None and \
+                     time.time() - self.checkpoint_time >= checkpoint_seconds:
+                self.flush()
+                pos = 0
+            elif pos == len(buf):
+                self._writeBuffer()
+                pos = 0
+
+    def _finish(self):
+        """
+        Write final header and end of file mark
+        """
+        self._writeBuffer()
+        self._updateHeader()
         # End of file
         self.fh.write('\x1A')
         self.fh.flush()
@@ -228,3 +424,83 @@ class YDbfWriter(object):
 
     def __exit__(self, exc_type, exc_value, traceback):
         self.close()
+
+class YDbfAppender(YDbfWriter):
+    """
+    Appends records to existing DBF
+
+    Records are written after existing ones, only number of records and
+    date of last update are rewritten in header, so append costs as
+    much as new records, not as whole file.
+    """
+    def __init__(self, fh, fields=None, use_unicode=True, encoding=None,
+                 **kwargs):
+        """
+        Create DBF appender
+        
+        Args:
+            `fh`:
+                filehandler, should be opened for binary reading
+                and writing (i.e. 'r+b')
+            `fields`:
+                fields structure (optional), if defined it should be
+                the same as structure of DBF
+            `use_unicode`:
+                use unicode mode or not, default is True
+            `encoding`:
+                encoding of string data, by default builtin
+                encoding of DBF (lang code)
+
+        All other args are the same as for YDbfWriter.
+        """
+        self.dbf_header = YDbfReader(fh, use_unicode=False)
+        dbf_fields = [tuple(field) for field in self.dbf_header.fields]
+        if fields is None:
+            fields = dbf_fields
+        elif [tuple(field) for field in fields] != dbf_fields:
+            raise ValueError("Fields %r don't match fields of DBF %r"
+                             % (list(fields), dbf_fields))
+        if encoding is None:
+            raw_lang = self.dbf_header.raw_lang
+            encoding = lib.ENCODINGS.get(raw_lang, (None,))[0]
+            if encoding is None:
+                if use_unicode:
+                    raise ValueError("Encoding of DBF (lang code %s) is "
+                                     "unknown, please define it by "
+                                     "`encoding` option" % hex(raw_lang))
+                encoding = 'ascii'
+        super(YDbfAppender, self).__init__(fh, fields, use_unicode, encoding,
+                                           **kwargs)
+
+    def _defineLangCode(self):
+        # lang code of DBF is kept
+        self.lang = self.dbf_header.raw_lang
+
+    def _prepareFile(self):
+        """
+        Take state from header of DBF and seek to end of records
+        """
+        header = self.dbf_header
+        if self.recsize != header.raw_recsize:
+            raise ValueError("Size of record by fields (%d) doesn't match "
+                             "size of record in header of DBF (%d)"
+                             % (self.recsize, header.raw_recsize))
+        self.sig = header.sig
+        self.lenheader = header.lenheader
+        self.numrec = self.numwritten = self.checkpointed = header.numrec
+        # header exists, only number of records and date are updated
+        self.header_written = True
+        end = self.lenheader + self.recsize*self.numrec
+        self.fh.seek(0, 2)
+        if self.fh.tell() < end:
+            raise ValueError("DBF file is truncated: it should have at "
+                             "least %d bytes (by header), but it has %d"
+                             % (end, self.fh.tell()))
+        # end of file mark (if any) is overwritten by new records
+        self.fh.seek(end)
+
+    def _finish(self):
+        super(YDbfAppender, self)._finish()
+        # drop data which was after records (e.g. garbage after
+        # end of file mark)
+        self.fh.truncate()